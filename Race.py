@@ -1,11 +1,37 @@
 import os
+import asyncio
 import logging
-import random
-import sqlite3
-from datetime import datetime
+import multiprocessing
+import queue
+import secrets
+import signal
+import time
 from dotenv import load_dotenv
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from telegram import (Update, InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup,
+                      WebAppInfo)
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
+
+from cache import PlayerCache
+from callbacks import CallbackRouter
+from challenges import ChallengeStore
+from leaderboard import Leaderboard, score_of
+from ledger import LEDGER_PENDING, LEDGER_PENDING_BY_USER, Ledger, entry
+from matchups import Matchmaker
+from arcade import Verifier
+from backup import backup_database, export_table, prune
+from metrics import Metrics
+from migrations import migrate
+from outbound import BACKGROUND, URGENT, OutboundScheduler
+from race_engine import BATCH_BACKEND, PVE_LUCK, PVP_LUCK, RaceEngine
+from ratelimit import CallbackLimiter
+from records import Car, Player
+from render import RenderCache
+from scores import ACCEPTED, DUPLICATE, REJECTED, ScoreBuffer, parse_score, score_reward
+from sharding import Coordinator
+from storage import AsyncFacade, Storage
+from tournaments import (ALREADY_JOINED, CLOSED, FULL, MATCH_WIN_REWARD, NOT_HOST, TOO_FEW, TournamentStore,
+                         bracket_deltas, run_bracket)
+from writebehind import BALANCE, EXPERIENCE, PVP_RACES, PVP_WINS, RACES, WINS, StatsBuffer, race_delta
 
 # --- Загрузка переменных окружения ---
 load_dotenv()
@@ -13,6 +39,89 @@ load_dotenv()
 # --- Получение конфигурации из .env ---
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_ID = os.getenv('ADMIN_ID', '0')
+DB_PATH = os.getenv('DB_PATH', 'racing.db')
+# Отложенная запись результатов гонок: сброс каждые N мс или каждые M гонок
+STATS_FLUSH_INTERVAL_MS = int(os.getenv('STATS_FLUSH_INTERVAL_MS', '1000'))
+STATS_FLUSH_RACES = int(os.getenv('STATS_FLUSH_RACES', '100'))
+# Число процессов-обработчиков, между которыми чаты делятся по chat_id (0 или 1 - один процесс)
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '0'))
+# Как часто шард перечитывает топ из общей БД (с)
+LEADERBOARD_REFRESH = int(os.getenv('LEADERBOARD_REFRESH', '30'))
+# Число игроков в LRU-кэше (0 - без кэша). Игрока из разных чатов меняют разные
+# шарды, поэтому при шардировании кэш по умолчанию выключен
+PLAYER_CACHE_SIZE = int(os.getenv('PLAYER_CACHE_SIZE', '0' if SHARD_WORKERS > 1 else '10000'))
+# Ограничение частоты нажатий: токенов в секунду и запас на всплеск
+RATE_USER_PER_SEC = float(os.getenv('RATE_USER_PER_SEC', '1'))
+RATE_USER_BURST = int(os.getenv('RATE_USER_BURST', '4'))
+RATE_CHAT_PER_SEC = float(os.getenv('RATE_CHAT_PER_SEC', '3'))
+RATE_CHAT_BURST = int(os.getenv('RATE_CHAT_BURST', '10'))
+# Сколько обновлений обрабатывается одновременно
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '64'))
+# Время жизни вызова (с), лимит открытых вызовов на игрока и период очистки
+CHALLENGE_TTL = int(os.getenv('CHALLENGE_TTL', '1800'))
+MAX_OPEN_CHALLENGES = int(os.getenv('MAX_OPEN_CHALLENGES', '3'))
+CHALLENGE_SWEEP_INTERVAL = int(os.getenv('CHALLENGE_SWEEP_INTERVAL', '5'))
+# Максимум участников турнира в группе (турнир живет столько же, сколько вызов)
+TOURNAMENT_MAX_PLAYERS = int(os.getenv('TOURNAMENT_MAX_PLAYERS', '32'))
+# Режим webhook: если задан WEBHOOK_URL (публичный https-адрес), бот принимает
+# обновления по HTTP вместо run_polling
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+# Секрет заголовка X-Telegram-Bot-Api-Secret-Token; без него - случайный на каждый запуск
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+# Соединений к Bot API: больше 8 httpx лишь тратит время на обход пула
+API_CONNECTIONS = int(os.getenv('API_CONNECTIONS', '8'))
+# Лимиты исходящих вызовов Bot API: всего в секунду, в личный чат в секунду,
+# в группу в минуту и запас на всплеск в чате
+OUTBOUND_PER_SEC = float(os.getenv('OUTBOUND_PER_SEC', '30'))
+OUTBOUND_CHAT_PER_SEC = float(os.getenv('OUTBOUND_CHAT_PER_SEC', '1'))
+OUTBOUND_GROUP_PER_MIN = float(os.getenv('OUTBOUND_GROUP_PER_MIN', '20'))
+OUTBOUND_CHAT_BURST = int(os.getenv('OUTBOUND_CHAT_BURST', '3'))
+# Сколько исходящих вызовов чата может ждать отправки; дальше нажатия в чат отклоняются
+OUTBOUND_CHAT_BACKLOG = int(os.getenv('OUTBOUND_CHAT_BACKLOG', '6'))
+# Метрики: как часто писать сводку в лог (с, 0 - не писать) и порт эндпоинта
+# /metrics для Prometheus (0 - выключен; шард N слушает METRICS_PORT + N)
+METRICS_LOG_INTERVAL = int(os.getenv('METRICS_LOG_INTERVAL', '60'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+# Адрес Bot API (можно направить на локальную заглушку сервера Telegram)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org/bot')
+
+# Аркада game.html: адрес WebApp (https), сброс счетов каждые N мс или каждые M счетов
+# и окно (с), в котором тот же счет того же игрока считается повтором
+WEBAPP_URL = os.getenv('WEBAPP_URL', '')
+SCORE_FLUSH_INTERVAL_MS = int(os.getenv('SCORE_FLUSH_INTERVAL_MS', '1000'))
+SCORE_FLUSH_SIZE = int(os.getenv('SCORE_FLUSH_SIZE', '500'))
+SCORE_DEDUPE_WINDOW = int(os.getenv('SCORE_DEDUPE_WINDOW', '60'))
+# Проверка счета повтором игры по выданному зерну (0 - принимать счет без журнала),
+# срок жизни зерна (с), процессов проверки и предел ожидания проверки (с)
+ARCADE_VERIFY = os.getenv('ARCADE_VERIFY', '1') != '0'
+ARCADE_SEED_TTL = int(os.getenv('ARCADE_SEED_TTL', '3600'))
+ARCADE_VERIFY_WORKERS = int(os.getenv('ARCADE_VERIFY_WORKERS', '1'))
+ARCADE_VERIFY_TIMEOUT = float(os.getenv('ARCADE_VERIFY_TIMEOUT', '2.0'))
+
+# Резервные копии базы: каталог (пусто - выключены), интервал (с), сколько копий
+# хранить, страниц за шаг копирования и выгрузка игроков рядом с копией
+# (jsonl или csv, сжатые gzip; пусто - без выгрузки)
+BACKUP_DIR = os.getenv('BACKUP_DIR', '')
+BACKUP_INTERVAL = int(os.getenv('BACKUP_INTERVAL', '3600'))
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
+BACKUP_PAGES = int(os.getenv('BACKUP_PAGES', '256'))
+EXPORT_FORMAT = os.getenv('EXPORT_FORMAT', '')
+
+# Журнал экономики: свертка в players раз в N с, записей за транзакцию свертки,
+# сколько дней хранить свернутые записи (0 - хранить все)
+LEDGER_COMPACT_INTERVAL = int(os.getenv('LEDGER_COMPACT_INTERVAL', '60'))
+LEDGER_COMPACT_BATCH = int(os.getenv('LEDGER_COMPACT_BATCH', '5000'))
+LEDGER_KEEP_DAYS = int(os.getenv('LEDGER_KEEP_DAYS', '90'))
+
+# Зерно генератора гонок для воспроизводимых прогонов (по умолчанию случайное)
+RACE_SEED = int(os.getenv('RACE_SEED')) if os.getenv('RACE_SEED') else None
+
+# Колонки записи игрока (score - вычисляемая колонка и в запись не входит)
+PLAYER_COLUMNS = "user_id, username, balance, car_id, experience, level, wins, races, pvp_wins, pvp_races"
 
 # --- Проверка обязательных переменных ---
 if not BOT_TOKEN:
@@ -26,191 +135,472 @@ logging.basicConfig(
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
+# httpx пишет в INFO каждый запрос к API - под нагрузкой это заметная доля CPU
+logging.getLogger('httpx').setLevel(logging.WARNING)
 
 # --- База данных и игровая логика ---
+# Игрок вместе с еще не свернутыми записями журнала: один запрос - один снимок
+# БД, свертка из другого процесса не может попасть между двумя чтениями
+PLAYER_SQL = f"SELECT {PLAYER_COLUMNS}, pending.* FROM players, ({LEDGER_PENDING}) AS pending WHERE user_id = :user_id"
+# Кандидаты в топ, строки как у PLAYER_SQL и очки в players последней колонкой:
+# первые :size по индексу очков и все игроки с несвернутыми записями журнала.
+# Очки остальных в players окончательные, и выше первых :size они не поднимутся
+TOP_CANDIDATES_SQL = f'''WITH pending AS ({LEDGER_PENDING_BY_USER})
+    SELECT {PLAYER_COLUMNS}, COALESCE(d_credits, 0), COALESCE(d_experience, 0), COALESCE(d_races, 0),
+           COALESCE(d_wins, 0), COALESCE(d_pvp_races, 0), COALESCE(d_pvp_wins, 0), score
+    FROM players LEFT JOIN pending USING (user_id)
+    WHERE user_id IN (SELECT user_id FROM players ORDER BY score DESC, level DESC LIMIT :size)
+       OR d_credits IS NOT NULL'''
+
+def ledger_player(cursor, row):
+    """row_factory для PLAYER_SQL: запись игрока с наложенным журналом"""
+    player = Player(*row[:10])
+    RacingGame._apply_delta(player, row[10:])
+    return player
+
 class RacingGame:
-    def __init__(self):
-        self.init_db()
-        self.cars = {
-            1: {"name": "Старый седан 🚗", "price": 0, "speed": 3, "acceleration": 2, "handling": 3},
-            2: {"name": "Спортивный хэтчбек 🚙", "price": 5000, "speed": 5, "acceleration": 6, "handling": 5},
-            3: {"name": "Гоночная мыльница 🏎️", "price": 15000, "speed": 7, "acceleration": 8, "handling": 6},
-            4: {"name": "Суперкар 🔥", "price": 50000, "speed": 9, "acceleration": 9, "handling": 8},
-            5: {"name": "Гоночный болид 💀", "price": 150000, "speed": 10, "acceleration": 10, "handling": 9}
-        }
-        self.active_challenges = {}
-        self.ensure_db_schema()
-
-    def ensure_db_schema(self):
-        """Проверяем и обновляем схему базы данных"""
-        conn = sqlite3.connect('racing.db')
-        c = conn.cursor()
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS players
-                    (user_id INTEGER PRIMARY KEY, 
-                     username TEXT,
-                     balance INTEGER DEFAULT 1000,
-                     car_id INTEGER DEFAULT 1,
-                     experience INTEGER DEFAULT 0,
-                     level INTEGER DEFAULT 1,
-                     wins INTEGER DEFAULT 0,
-                     races INTEGER DEFAULT 0,
-                     pvp_wins INTEGER DEFAULT 0,
-                     pvp_races INTEGER DEFAULT 0)''')
-        
-        conn.commit()
-        conn.close()
-
-    def init_db(self):
-        """Инициализация базы данных"""
-        conn = sqlite3.connect('racing.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS players
-                    (user_id INTEGER PRIMARY KEY, 
-                     username TEXT,
-                     balance INTEGER DEFAULT 1000,
-                     car_id INTEGER DEFAULT 1,
-                     experience INTEGER DEFAULT 0,
-                     level INTEGER DEFAULT 1,
-                     wins INTEGER DEFAULT 0,
-                     races INTEGER DEFAULT 0,
-                     pvp_wins INTEGER DEFAULT 0,
-                     pvp_races INTEGER DEFAULT 0)''')
-        conn.commit()
-        conn.close()
+    def __init__(self, db_path=DB_PATH, stats_flush_races=STATS_FLUSH_RACES, cache_size=PLAYER_CACHE_SIZE):
+        # Соединение и миграции схемы - при первом обращении к базе (open_db)
+        self.db = Storage(db_path, on_open=migrate)
+        self.stats_buffer = StatsBuffer(stats_flush_races)
+        self.ledger = Ledger(self.db, LEDGER_COMPACT_BATCH)
+        self.cache = PlayerCache(cache_size)
+        self.leaderboard = Leaderboard(10)
+        self.cars = {car.car_id: car for car in (
+            Car(1, "Старый седан 🚗", price=0, speed=3, acceleration=2, handling=3),
+            Car(2, "Спортивный хэтчбек 🚙", price=5000, speed=5, acceleration=6, handling=5),
+            Car(3, "Гоночная мыльница 🏎️", price=15000, speed=7, acceleration=8, handling=6),
+            Car(4, "Суперкар 🔥", price=50000, speed=9, acceleration=9, handling=8),
+            Car(5, "Гоночный болид 💀", price=150000, speed=10, acceleration=10, handling=9),
+        )}
+        self.active_challenges = ChallengeStore(self.db, CHALLENGE_TTL, MAX_OPEN_CHALLENGES)
+        self.tournaments = TournamentStore(self.db, CHALLENGE_TTL, TOURNAMENT_MAX_PLAYERS)
+        self.scores = ScoreBuffer(SCORE_FLUSH_SIZE, SCORE_DEDUPE_WINDOW)
+
+    def open_db(self):
+        """Открываем базу и применяем миграции до первых обновлений; версия схемы"""
+        return self.db.fetchone("PRAGMA user_version")[0]
 
     def get_player(self, user_id):
-        """Безопасное получение данных игрока"""
-        conn = sqlite3.connect('racing.db')
-        c = conn.cursor()
+        """Запись игрока (Player) или None.
+
+        Запись из кэша отдается без копии и только для чтения: меняет ее
+        лишь поток БД, так что обработчик видит самое свежее состояние.
+        """
+        cached = self.cache.get(user_id)
+        if cached is not None:
+            return cached
         
         try:
-            c.execute("SELECT * FROM players WHERE user_id = ?", (user_id,))
-            player = c.fetchone()
-            
-            if player:
-                player_list = list(player)
-                while len(player_list) < 10:
-                    player_list.append(0)
-                player = tuple(player_list)
-                
+            player = self.db.fetchone(PLAYER_SQL, {'user_id': user_id}, factory=ledger_player)
         except Exception as e:
             logger.error(f"Ошибка при получении игрока {user_id}: {e}")
-            player = None
+            return None
         
-        conn.close()
+        if player is None:
+            return None
+        delta = self.stats_buffer.get(user_id)
+        if delta:
+            self._apply_delta(player, delta)
+        self.cache.put(user_id, player)
         return player
 
     def register_player(self, user_id, username):
         """Регистрация нового игрока"""
-        conn = sqlite3.connect('racing.db')
-        c = conn.cursor()
-        
         try:
-            c.execute("""INSERT OR IGNORE INTO players 
+            inserted = self.db.execute("""INSERT OR IGNORE INTO players 
                         (user_id, username, balance, car_id, experience, level, wins, races, pvp_wins, pvp_races) 
                         VALUES (?, ?, 1000, 1, 0, 1, 0, 0, 0, 0)""", 
                      (user_id, username))
-            conn.commit()
+            if inserted:
+                record = Player(user_id, username)
+                self.cache.put(user_id, record)
+                self.leaderboard.add_player(record)
         except Exception as e:
             logger.error(f"Ошибка при регистрации игрока: {e}")
-        
-        conn.close()
 
-    def update_balance(self, user_id, amount):
-        """Обновление баланса игрока"""
-        conn = sqlite3.connect('racing.db')
-        c = conn.cursor()
-        c.execute("UPDATE players SET balance = balance + ? WHERE user_id = ?", (amount, user_id))
-        conn.commit()
-        conn.close()
+    def update_balance(self, user_id, amount, reason='adjust'):
+        """Начисление или списание кредитов записью в журнал"""
+        player = self.get_player(user_id)
+        if not player:
+            return
+        
+        delta = [0] * 6
+        delta[BALANCE] = amount
+        player.balance += amount
+        self.leaderboard.set_balance(user_id, player.balance)
+        if self.stats_buffer.add_delta(user_id, delta, reason):
+            self.flush_stats()
 
     def buy_car(self, user_id, car_id):
         """Покупка автомобиля"""
-        conn = sqlite3.connect('racing.db')
-        c = conn.cursor()
-        c.execute("SELECT balance FROM players WHERE user_id = ?", (user_id,))
-        result = c.fetchone()
+        # Баланс в БД должен учитывать еще не записанные выигрыши
+        if self.stats_buffer.get(user_id):
+            self.flush_stats()
+        car_price = self.cars[car_id].price
+        delta = [0] * 6
+        delta[BALANCE] = -car_price
+        # Проверка баланса и списание в одной транзакции BEGIN IMMEDIATE:
+        # параллельные покупки не уведут баланс в минус
+        with self.db.transaction() as c:
+            player = self._read_player(c, user_id)
+            if player is None or player.balance < car_price:
+                return False
+            self.ledger.append(c, [entry(user_id, 'purchase', delta)])
+            c.execute("UPDATE players SET car_id = ? WHERE user_id = ?", (car_id, user_id))
         
-        if not result:
-            conn.close()
+        balance = player.balance - car_price
+        cached = self.cache.peek(user_id)
+        if cached is not None:
+            cached.balance = balance
+            cached.car_id = car_id
+        self.leaderboard.set_balance(user_id, balance)
+        return True
+
+    def update_stats_after_race(self, user_id, earnings, exp_gain, is_win=False, is_pvp=False):
+        """Обновление статистики после гонки.
+
+        Новый уровень считается по записи игрока в памяти: она хранит текущий
+        итог с журналом, поэтому журнал не перечитывается на каждую гонку, а
+        запись - просто INSERT (сразу или пачкой через буфер).
+        """
+        player = self.get_player(user_id)
+        if not player:
             return False
-            
-        balance = result[0]
-        car_price = self.cars[car_id]["price"]
         
-        if balance >= car_price:
-            c.execute("UPDATE players SET balance = balance - ?, car_id = ? WHERE user_id = ?", 
-                     (car_price, car_id, user_id))
-            conn.commit()
-            conn.close()
-            return True
+        delta = race_delta(earnings, exp_gain, is_win, is_pvp)
+        if self.stats_buffer.enabled:
+            if self.stats_buffer.add(user_id, earnings, exp_gain, is_win, is_pvp):
+                self.flush_stats()
+        else:
+            try:
+                self._write_entries([entry(user_id, 'pvp' if is_pvp else 'race', delta)])
+            except Exception as e:
+                logger.error(f"Ошибка при обновлении статистики: {e}")
+                return False
         
-        conn.close()
-        return False
+        level, old_score = player.level, score_of(player)
+        self._apply_delta(player, delta)
+        self.leaderboard.update(player, old_score)
+        return player.level > level
 
-    def update_stats_after_race(self, user_id, earnings, exp_gain, is_win=False, is_pvp=False):
-        """Обновление статистики после гонки"""
-        conn = sqlite3.connect('racing.db')
-        c = conn.cursor()
+    @staticmethod
+    def _read_player(c, user_id):
+        """Игрок с журналом внутри открытой транзакции c"""
+        row = c.execute(PLAYER_SQL, {'user_id': user_id}).fetchone()
+        return ledger_player(None, row) if row else None
+
+    @staticmethod
+    def _apply_delta(record, delta):
+        """Наложение незаписанных приращений на запись игрока"""
+        record.balance += delta[BALANCE]
+        record.experience += delta[EXPERIENCE]
+        record.level = max(record.level, record.experience // 100 + 1)
+        record.wins += delta[WINS]
+        record.races += delta[RACES]
+        record.pvp_wins += delta[PVP_WINS]
+        record.pvp_races += delta[PVP_RACES]
+
+    def _write_entries(self, entries):
+        """Пачка записей журнала одной транзакцией через executemany"""
+        with self.db.transaction() as c:
+            return self.ledger.append(c, entries)
+
+    def flush_stats(self):
+        """Запись накопленных результатов гонок в журнал одной транзакцией"""
+        pending = self.stats_buffer.take()
+        if not pending:
+            return 0
         
         try:
-            if is_pvp:
-                c.execute('''UPDATE players 
-                             SET balance = balance + ?, 
-                                 experience = experience + ?,
-                                 pvp_races = pvp_races + 1,
-                                 pvp_wins = pvp_wins + ?
-                             WHERE user_id = ?''', 
-                         (earnings, exp_gain, 1 if is_win else 0, user_id))
-            else:
-                c.execute('''UPDATE players 
-                             SET balance = balance + ?, 
-                                 experience = experience + ?,
-                                 races = races + 1,
-                                 wins = wins + ?
-                             WHERE user_id = ?''', 
-                         (earnings, exp_gain, 1 if is_win else 0, user_id))
-            
-            c.execute("SELECT experience, level FROM players WHERE user_id = ?", (user_id,))
-            result = c.fetchone()
-            if result:
-                exp, level = result
-                new_level = exp // 100 + 1
-                if new_level > level:
-                    c.execute("UPDATE players SET level = ? WHERE user_id = ?", (new_level, user_id))
-                    conn.commit()
-                    conn.close()
-                    return True
-            
-            conn.commit()
-            
+            written = self._write_entries(pending)
         except Exception as e:
-            logger.error(f"Ошибка при обновлении статистики: {e}")
+            logger.error(f"Ошибка при записи статистики: {e}")
+            self.stats_buffer.restore(pending)
+            return 0
         
-        conn.close()
-        return False
+        self.stats_buffer.flushes += 1
+        return written
+
+    def record_tournament(self, deltas):
+        """Результаты всей сетки одной транзакцией; id игроков с новым уровнем или None при ошибке"""
+        players = {user_id: self.get_player(user_id) for user_id in deltas}
+        try:
+            now = time.time()
+            self._write_entries([entry(user_id, 'tournament', delta, now) for user_id, delta in deltas.items()])
+        except Exception as e:
+            logger.error(f"Ошибка при записи турнира: {e}")
+            return None
+        
+        level_ups = []
+        for user_id, delta in deltas.items():
+            player = players[user_id]
+            if not player:
+                continue
+            if (player.experience + delta[EXPERIENCE]) // 100 + 1 > player.level:
+                level_ups.append(user_id)
+            old_score = score_of(player)
+            self._apply_delta(player, delta)
+            self.leaderboard.update(player, old_score)
+        return level_ups
+
+    def compact_ledger(self):
+        """Свертка журнала в players целиком и удаление старых свернутых записей; (записей, игроков, удалено)"""
+        try:
+            entries, players = self.ledger.compact()
+        except Exception as e:
+            logger.error(f"Ошибка при свертке журнала: {e}")
+            return 0, 0, 0
+        return entries, players, self.prune_ledger()
+
+    def compact_ledger_step(self):
+        """Одна пачка свертки; (записей, игроков)"""
+        try:
+            return self.ledger.compact_step()
+        except Exception as e:
+            logger.error(f"Ошибка при свертке журнала: {e}")
+            return 0, 0
+
+    def prune_ledger(self):
+        """Удаление свернутых записей старше LEDGER_KEEP_DAYS; число удаленных"""
+        if not LEDGER_KEEP_DAYS:
+            return 0
+        try:
+            return self.ledger.prune(time.time() - LEDGER_KEEP_DAYS * 86400)
+        except Exception as e:
+            logger.error(f"Ошибка при удалении старых записей журнала: {e}")
+            return 0
+
+    def best_score(self, user_id, game_name):
+        """Лучший счет игрока в аркаде с учетом еще не записанных"""
+        row = self.db.fetchone("SELECT best_score FROM game_scores WHERE user_id = ? AND game = ?",
+                               (user_id, game_name))
+        return max(row[0] if row else 0, self.scores.best(user_id, game_name))
+
+    def issue_arcade_seed(self, user_id):
+        """Новое зерно аркады игрока; прежнее перестает действовать"""
+        seed = secrets.randbits(32) or 1
+        self.db.execute("INSERT OR REPLACE INTO arcade_seeds (user_id, seed, expires_at) VALUES (?, ?, ?)",
+                        (user_id, seed, time.time() + ARCADE_SEED_TTL))
+        return seed
+
+    def expire_arcade_seeds(self):
+        return self.db.execute("DELETE FROM arcade_seeds WHERE expires_at <= ?", (time.time(),))
+
+    def submit_score(self, user_id, username, game_name, score, message_key=None, seed=None):
+        """Прием счета аркады в буферы: (статус, прежний рекорд, (кредиты, опыт), новый уровень)"""
+        player = self.get_player(user_id)
+        if not player:
+            self.register_player(user_id, username)
+            player = self.get_player(user_id)
+            if not player:
+                return None, 0, (0, 0), False
+        
+        previous_best = self.best_score(user_id, game_name)
+        if self.scores.is_duplicate(user_id, message_key, seed):
+            self.scores.duplicates += 1
+            return DUPLICATE, previous_best, (0, 0), False
+        # Зерно - действующее и еще не потраченное (потраченные помнит буфер счетов до flush_scores)
+        if seed is not None and (self.scores.spent(user_id, seed) or not self.db.fetchone(
+                "SELECT 1 FROM arcade_seeds WHERE user_id = ? AND seed = ? AND expires_at > ?",
+                (user_id, seed, time.time()))):
+            return REJECTED, previous_best, (0, 0), False
+        self.scores.add(user_id, game_name, score, message_key, seed)
+        
+        credits, exp_gain = score_reward(score)
+        delta = [0] * 6
+        delta[BALANCE], delta[EXPERIENCE] = credits, exp_gain
+        level, old_score = player.level, score_of(player)
+        self._apply_delta(player, delta)
+        self.leaderboard.update(player, old_score)
+        flush = self.stats_buffer.add_delta(user_id, delta, 'arcade')
+        if flush or self.scores.full:
+            self.flush_scores()
+        return ACCEPTED, previous_best, (credits, exp_gain), player.level > level
+
+    def flush_scores(self):
+        """Счета аркады, потраченные зерна и накопленная статистика одной транзакцией; число записанных счетов"""
+        scores, seeds = self.scores.take()
+        entries = self.stats_buffer.take()
+        if not scores and not entries:
+            return 0
+        
+        now = time.time()
+        rows = [(user_id, game_name, best, plays, total, now)
+                for (user_id, game_name), (best, plays, total) in scores.items()]
+        try:
+            with self.db.transaction() as c:
+                c.executemany('''INSERT INTO game_scores (user_id, game, best_score, plays, total_score, updated_at)
+                                 VALUES (?, ?, ?, ?, ?, ?)
+                                 ON CONFLICT (user_id, game) DO UPDATE SET
+                                     best_score = MAX(best_score, excluded.best_score),
+                                     plays = plays + excluded.plays,
+                                     total_score = total_score + excluded.total_score,
+                                     updated_at = excluded.updated_at''', rows)
+                c.executemany("DELETE FROM arcade_seeds WHERE user_id = ? AND seed = ?", seeds)
+                self.ledger.append(c, entries)
+        except Exception as e:
+            logger.error(f"Ошибка при записи счетов аркады: {e}")
+            self.scores.restore(scores, seeds)
+            self.stats_buffer.restore(entries)
+            return 0
+        
+        if scores:
+            self.scores.flushes += 1
+        if entries:
+            self.stats_buffer.flushes += 1
+        return len(rows)
+
+    def _ensure_leaderboard(self):
+        """Ленивая загрузка топа и распределения очков из БД"""
+        if self.leaderboard.loaded:
+            return
+        
+        # Журнал не сворачивается (это дело compact_ledger_batches): несвернутые
+        # записи накладываются на кандидатов в топ и переносят их очки в распределении
+        self.flush_stats()
+        with self.db.snapshot() as c:
+            rows = c.execute(TOP_CANDIDATES_SQL, {'size': self.leaderboard.size}).fetchall()
+            counts = dict(c.execute("SELECT score, COUNT(*) FROM players GROUP BY score").fetchall())
+        top = []
+        for row in rows:
+            player = Player(*row[:10])
+            self._apply_delta(player, row[10:16])
+            stored, score = row[16], score_of(player)
+            if score != stored:
+                counts[stored] -= 1
+                counts[score] = counts.get(score, 0) + 1
+            top.append(player)
+        self.leaderboard.load(top, counts.items())
+
+    def open_challenge(self, challenge_data):
+        """Новый PvP вызов; id вызова или None при превышении лимита"""
+        return self.active_challenges.create(challenge_data)
+
+    def get_challenge(self, challenge_id):
+        return self.active_challenges.get(challenge_id)
+
+    def challenges_in_chat(self, chat_id):
+        """Открытые вызовы чата парами (id, данные)"""
+        return self.active_challenges.in_chat(chat_id)
+
+    def claim_challenge(self, challenge_id):
+        """Атомарное принятие вызова: успех только у одного принявшего"""
+        return self.active_challenges.claim(challenge_id)
+
+    def expire_challenges(self):
+        return self.active_challenges.expire()
+
+    def open_tournament(self, data, car_id):
+        """Новый турнир; id или None, если у ведущего уже есть открытый"""
+        return self.tournaments.create(data, car_id)
+
+    def join_tournament(self, tournament_id, user_id, name, car_id):
+        return self.tournaments.join(tournament_id, user_id, name, car_id)
+
+    def start_tournament(self, tournament_id, user_id=None):
+        """Закрытие записи: успех только у одного нажатия"""
+        return self.tournaments.start(tournament_id, user_id)
+
+    def expire_tournaments(self):
+        return self.tournaments.expire()
+
+    def get_top(self, limit=10):
+        """Лучшие игроки по победам (PvP победа считается за две)"""
+        self._ensure_leaderboard()
+        return self.leaderboard.top(limit)
+
+    def reload_leaderboard(self):
+        """Топ перечитается из БД при следующем запросе (изменения других процессов)"""
+        self.leaderboard.loaded = False
+
+    def get_rank(self, user_id):
+        """Место игрока в общем рейтинге или None для незарегистрированных"""
+        self._ensure_leaderboard()
+        player = self.get_player(user_id)
+        return self.leaderboard.rank(player) if player else None
 
 # --- Создаем экземпляр игры ---
 game = RacingGame()
+# Задержки обработчиков кнопок, методов БД и вызовов Bot API
+metrics = Metrics()
+# Асинхронный доступ для обработчиков: запросы к БД идут в отдельном потоке
+game_async = AsyncFacade(game, metrics)
+# Симуляция гонок по характеристикам машин
+engine = RaceEngine(game.cars, seed=RACE_SEED)
+# Подбор ИИ-соперника по таблице шансов
+matchmaker = Matchmaker(engine, PVE_LUCK)
+
+# --- Маршруты кнопок: имя, код в callback_data, типы аргументов ---
+router = CallbackRouter()
+router.declare('main', 'm', legacy='menu_main')
+router.declare('profile', 'p', legacy='menu_profile')
+router.declare('garage', 'g', legacy='menu_garage')
+router.declare('race', 'r', legacy='menu_race')
+router.declare('challenge', 'c', legacy='menu_challenge')
+router.declare('top', 't', legacy='menu_top')
+router.declare('refresh', 'f', legacy='menu_refresh')
+router.declare('create_challenge', 'n', legacy='create_challenge')
+router.declare('buy', 'b', int, validate=lambda car_id: car_id in game.cars, legacy='buy_')
+router.declare('accept', 'a', str, legacy='accept_')
+router.declare('none', '0', legacy='none')
+router.declare('tournament', 'o')
+router.declare('join', 'j', str)
+router.declare('start_tournament', 's', str)
+cb = router.encode
+
+# Готовые клавиатуры; исходящие правки идут через очередь с лимитами Telegram
+render_cache = RenderCache(cb)
+editor = OutboundScheduler(OUTBOUND_PER_SEC, OUTBOUND_CHAT_PER_SEC, OUTBOUND_GROUP_PER_MIN / 60,
+                           OUTBOUND_CHAT_BURST, API_CONNECTIONS, metrics=metrics)
+# Защита БД и квоты Telegram API от спама кнопками
+# Нажатия в чат, очередь которого Telegram не успевает обслужить, отклоняются сразу,
+# а не держат обработчик в ожидании отправки
+limiter = CallbackLimiter(RATE_USER_PER_SEC, RATE_USER_BURST, RATE_CHAT_PER_SEC, RATE_CHAT_BURST,
+                          backlog=editor.backlog, max_backlog=OUTBOUND_CHAT_BACKLOG)
+
+# --- Статические клавиатуры (создаются один раз) ---
+MAIN_MENU = InlineKeyboardMarkup([
+    [InlineKeyboardButton("👤 Профиль", callback_data=cb("profile")),
+     InlineKeyboardButton("🏎️ Гараж", callback_data=cb("garage"))],
+    [InlineKeyboardButton("🏁 Гонка с ИИ", callback_data=cb("race")),
+     InlineKeyboardButton("⚔️ Вызов игрока", callback_data=cb("challenge"))],
+    [InlineKeyboardButton("🏆 Топ игроков", callback_data=cb("top")),
+     InlineKeyboardButton("🔄 Обновить", callback_data=cb("refresh"))]
+])
+PROFILE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Обновить", callback_data=cb("profile")),
+     InlineKeyboardButton("🔙 Назад", callback_data=cb("main"))]
+])
+RACE_RESULT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🏁 Еще гонку", callback_data=cb("race")),
+     InlineKeyboardButton("🔙 В меню", callback_data=cb("main"))]
+])
+CHALLENGE_MENU_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🎯 Бросить вызов", callback_data=cb("create_challenge"))],
+    [InlineKeyboardButton("🏆 Турнир", callback_data=cb("tournament"))],
+    [InlineKeyboardButton("🔙 Назад", callback_data=cb("main"))]
+])
+TOP_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Обновить", callback_data=cb("top")),
+     InlineKeyboardButton("🔙 Назад", callback_data=cb("main"))]
+])
+PVP_RESULT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⚔️ Новый вызов", callback_data=cb("challenge")),
+     InlineKeyboardButton("🔙 В меню", callback_data=cb("main"))]
+])
 
 # --- Главное меню ---
 def get_main_menu():
     """Клавиатура главного меню"""
-    keyboard = [
-        [InlineKeyboardButton("👤 Профиль", callback_data="menu_profile"),
-         InlineKeyboardButton("🏎️ Гараж", callback_data="menu_garage")],
-        [InlineKeyboardButton("🏁 Гонка с ИИ", callback_data="menu_race"),
-         InlineKeyboardButton("⚔️ Вызов игрока", callback_data="menu_challenge")],
-        [InlineKeyboardButton("🏆 Топ игроков", callback_data="menu_top"),
-         InlineKeyboardButton("🔄 Обновить", callback_data="menu_refresh")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return MAIN_MENU
 
 # --- Команды бота ---
+@router.handler('main')
+@router.handler('refresh')
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    game.register_player(user.id, user.first_name)
+    await game_async.register_player(user.id, user.first_name)
     
     welcome_text = (
         f"🏎️ Добро пожаловать в гоночную лигу, {user.first_name}!\n\n"
@@ -219,134 +609,88 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     if update.message:
-        await update.message.reply_text(welcome_text, reply_markup=get_main_menu())
+        await editor.call(update.message.chat_id, update.message.reply_text, welcome_text,
+                          reply_markup=get_main_menu())
     else:
-        await update.callback_query.edit_message_text(welcome_text, reply_markup=get_main_menu())
+        await editor.edit(update.callback_query, welcome_text, reply_markup=get_main_menu())
 
+@router.handler('profile')
 async def show_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user = query.from_user
-    player_data = game.get_player(user.id)
+    player = await game_async.get_player(user.id)
     
-    if not player_data:
+    if not player:
         await query.answer("Сначала зарегистрируйтесь через /start", show_alert=True)
         return
     
-    # Безопасная распаковка
-    try:
-        if len(player_data) >= 10:
-            user_id, username, balance, car_id, exp, level, wins, races, pvp_wins, pvp_races = player_data
-        else:
-            user_id, username, balance, car_id, exp, level, wins, races = player_data[:8]
-            pvp_wins, pvp_races = 0, 0
-    except ValueError as e:
-        await query.answer("❌ Ошибка в данных профиля", show_alert=True)
-        return
-    
-    car = game.cars.get(car_id, game.cars[1])
+    car = game.cars.get(player.car_id, game.cars[1])
     
     profile_text = (
         f"👤 **Профиль гонщика**\n\n"
-        f"🏷️ **Имя:** {username}\n"
-        f"⭐ **Уровень:** {level}\n"
-        f"📊 **Опыт:** {exp}/{(level * 100)}\n"
-        f"💰 **Баланс:** {balance} кредитов\n\n"
-        f"🏎️ **Автомобиль:** {car['name']}\n"
-        f"🚀 **Скорость:** {car['speed']}/10\n"
-        f"⚡ **Ускорение:** {car['acceleration']}/10\n"
-        f"🎯 **Управление:** {car['handling']}/10\n\n"
+        f"🏷️ **Имя:** {player.username}\n"
+        f"⭐ **Уровень:** {player.level}\n"
+        f"📊 **Опыт:** {player.experience}/{(player.level * 100)}\n"
+        f"💰 **Баланс:** {player.balance} кредитов\n\n"
+        f"🏎️ **Автомобиль:** {car.name}\n"
+        f"🚀 **Скорость:** {car.speed}/10\n"
+        f"⚡ **Ускорение:** {car.acceleration}/10\n"
+        f"🎯 **Управление:** {car.handling}/10\n\n"
         f"📈 **Статистика:**\n"
-        f"🏆 PvE: {wins} из {races} побед\n"
-        f"⚔️ PvP: {pvp_wins} из {pvp_races} побед"
+        f"🏆 PvE: {player.wins} из {player.races} побед\n"
+        f"⚔️ PvP: {player.pvp_wins} из {player.pvp_races} побед"
     )
     
-    keyboard = [
-        [InlineKeyboardButton("🔄 Обновить", callback_data="menu_profile"),
-         InlineKeyboardButton("🔙 Назад", callback_data="menu_main")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text(profile_text, reply_markup=reply_markup)
+    await editor.edit(query, profile_text, reply_markup=PROFILE_MARKUP)
 
+@router.handler('garage')
 async def show_garage(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user = query.from_user
-    player_data = game.get_player(user.id)
+    player = await game_async.get_player(user.id)
     
-    if not player_data:
+    if not player:
         await query.answer("Сначала зарегистрируйтесь через /start", show_alert=True)
         return
     
-    balance = player_data[2]
-    current_car_id = player_data[3]
-    
-    garage_text = f"🏁 **Гараж**\n\n💰 **Ваш баланс:** {balance} кредитов\n\n"
+    garage_text = f"🏁 **Гараж**\n\n💰 **Ваш баланс:** {player.balance} кредитов\n\n"
     
-    keyboard = []
-    for car_id, car in game.cars.items():
-        if car_id == current_car_id:
-            status = "✅ ВАШ АВТОМОБИЛЬ"
-            callback_data = "none"
-        elif balance >= car['price']:
-            status = f"🛒 Купить за {car['price']} кредитов"
-            callback_data = f"buy_{car_id}"
-        else:
-            status = f"❌ Недостаточно средств ({car['price']})"
-            callback_data = "none"
-        
-        car_info = f"{car['name']}\n🚀{car['speed']} ⚡{car['acceleration']} 🎯{car['handling']} - {status}"
-        
-        if callback_data != "none":
-            keyboard.append([InlineKeyboardButton(car_info, callback_data=callback_data)])
-        else:
-            keyboard.append([InlineKeyboardButton(car_info, callback_data="none")])
+    reply_markup = render_cache.garage_markup(game.cars, player.car_id, player.balance)
     
-    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="menu_main")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text(garage_text, reply_markup=reply_markup)
+    await editor.edit(query, garage_text, reply_markup=reply_markup)
 
+@router.handler('race')
 async def start_race(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user = query.from_user
-    player_data = game.get_player(user.id)
+    player = await game_async.get_player(user.id)
     
-    if not player_data:
+    if not player:
         await query.answer("Сначала зарегистрируйтесь через /start", show_alert=True)
         return
     
-    # Безопасная распаковка
-    try:
-        if len(player_data) >= 8:
-            user_id, username, balance, car_id, exp, level, wins, races = player_data[:8]
-        else:
-            await query.answer("❌ Ошибка данных", show_alert=True)
-            return
-    except ValueError as e:
-        await query.answer("❌ Ошибка в данных", show_alert=True)
-        return
-    
-    player_car = game.cars.get(car_id, game.cars[1])
+    level = player.level
+    player_car_id = player.car_id if player.car_id in game.cars else 1
+    player_car = game.cars[player_car_id]
     
-    # Ищем оппонента (ИИ)
-    opponent_car = random.choice(list(game.cars.values()))
+    # Ищем оппонента (ИИ) под уровень игрока
+    opponent_car_id = matchmaker.pick(player_car_id, level)
+    opponent_car = game.cars[opponent_car_id]
+    win_chance, draw_chance, _ = engine.odds(PVE_LUCK).get(player_car_id, opponent_car_id)
+    # Шансы - и в анимации, и в результате: под нагрузкой анимацию заменит результат
+    odds_text = f"📊 Шансы на победу: {win_chance:.0%}, ничья: {draw_chance:.0%}"
     
     # Расчет силы игрока и оппонента
-    player_power = (player_car['speed'] * 2 + 
-                   player_car['acceleration'] * 1.5 + 
-                   player_car['handling'] * 1.2 + 
-                   random.randint(1, 10))
-    
-    opponent_power = (opponent_car['speed'] * 2 + 
-                     opponent_car['acceleration'] * 1.5 + 
-                     opponent_car['handling'] * 1.2 + 
-                     random.randint(1, 10))
-    
-    # Анимация гонки
-    await query.edit_message_text(
+    player_power, opponent_power = engine.race(player_car, opponent_car, PVE_LUCK)
+    
+    # Анимация гонки: не ждем отправки - под нагрузкой ее заменит результат
+    await editor.edit(
+        query,
         f"🏁 **Начинаем гонку!**\n\n"
-        f"🏎️ {player_car['name']} vs {opponent_car['name']}\n\n"
-        f"🔧 Подготовка к старту..."
+        f"🏎️ {player_car.name} vs {opponent_car.name}\n"
+        f"{odds_text}\n\n"
+        f"🔧 Подготовка к старту...",
+        priority=BACKGROUND, wait=False
     )
     
     # Определение победителя
@@ -367,13 +711,14 @@ async def start_race(update: Update, context: ContextTypes.DEFAULT_TYPE):
         is_win = False
     
     # Обновление данных игрока
-    level_up = game.update_stats_after_race(user.id, earnings, exp_gain, is_win, False)
+    level_up = await game_async.update_stats_after_race(user.id, earnings, exp_gain, is_win, False)
     
     level_up_text = f"\n🎉 **Новый уровень!** Теперь у вас {level + 1} уровень!" if level_up else ""
     
     result_text = (
         f"🏁 **Гонка завершена!**\n\n"
-        f"🏎️ {player_car['name']} vs {opponent_car['name']}\n\n"
+        f"🏎️ {player_car.name} vs {opponent_car.name}\n"
+        f"{odds_text}\n\n"
         f"💪 **Ваша сила:** {player_power}\n"
         f"💪 **Сила оппонента:** {opponent_power}\n\n"
         f"**{win_text}**\n"
@@ -382,14 +727,9 @@ async def start_race(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"{level_up_text}"
     )
     
-    keyboard = [
-        [InlineKeyboardButton("🏁 Еще гонку", callback_data="menu_race"),
-         InlineKeyboardButton("🔙 В меню", callback_data="menu_main")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text(result_text, reply_markup=reply_markup)
+    await editor.edit(query, result_text, reply_markup=RACE_RESULT_MARKUP, priority=URGENT)
 
+@router.handler('challenge')
 async def show_challenge_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user = query.from_user
@@ -403,209 +743,221 @@ async def show_challenge_menu(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         return
     
-    player_data = game.get_player(user.id)
-    if not player_data:
+    player = await game_async.get_player(user.id)
+    if not player:
         await query.answer("Сначала зарегистрируйтесь через /start", show_alert=True)
         return
     
     challenge_text = (
         "⚔️ **Вызов игрока**\n\n"
         "Бросьте вызов другому игроку в этой группе!\n"
-        "Победитель получает 1000 кредитов и 50 опыта."
+        "Победитель получает 1000 кредитов и 50 опыта.\n\n"
+        f"🏆 Или соберите турнир до {TOURNAMENT_MAX_PLAYERS} участников: "
+        "за каждый выигранный матч - как за победу в вызове."
     )
     
-    keyboard = [
-        [InlineKeyboardButton("🎯 Бросить вызов", callback_data="create_challenge")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="menu_main")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Открытые вызовы этой группы, которые можно принять прямо из меню
+    reply_markup = CHALLENGE_MENU_MARKUP
+    open_challenges = [(challenge_id, data) for challenge_id, data
+                       in await game_async.challenges_in_chat(query.message.chat_id)
+                       if data['challenger_id'] != user.id]
+    if open_challenges:
+        challenge_text += "\n\n🎯 **Открытые вызовы:**"
+        reply_markup = InlineKeyboardMarkup(
+            [[InlineKeyboardButton(f"🎯 Принять: {data['challenger_name']}",
+                                   callback_data=cb("accept", challenge_id))]
+             for challenge_id, data in open_challenges] + list(CHALLENGE_MENU_MARKUP.inline_keyboard))
     
-    await query.edit_message_text(challenge_text, reply_markup=reply_markup)
+    await editor.edit(query, challenge_text, reply_markup=reply_markup)
 
+@router.handler('create_challenge')
 async def create_challenge(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user = query.from_user
-    player_data = game.get_player(user.id)
+    player = await game_async.get_player(user.id)
     
-    if not player_data:
+    if not player:
         await query.answer("Сначала зарегистрируйтесь через /start", show_alert=True)
         return
     
-    # Безопасное получение данных
-    car_id = player_data[3] if len(player_data) > 3 else 1
-    level = player_data[5] if len(player_data) > 5 else 1
-    
-    # Создаем уникальный ID для вызова
-    challenge_id = f"{user.id}_{int(datetime.now().timestamp())}"
+    car_id = player.car_id
     
-    # Сохраняем вызов
-    game.active_challenges[challenge_id] = {
+    # Сохраняем вызов, он получает уникальный ID
+    challenge_id = await game_async.open_challenge({
         'challenger_id': user.id,
         'challenger_name': user.first_name,
         'challenger_car_id': car_id,
         'chat_id': query.message.chat_id,
-        'message_id': query.message.message_id,
-        'created_at': datetime.now()
-    }
+        'message_id': query.message.message_id
+    })
+    if challenge_id is None:
+        await query.answer(f"❌ У вас уже {MAX_OPEN_CHALLENGES} открытых вызова!", show_alert=True)
+        return
     
     challenge_text = (
         f"🏎️ **{user.first_name} бросает вызов на гонку!**\n\n"
-        f"🚗 **Автомобиль:** {game.cars[car_id]['name']}\n"
-        f"⭐ **Уровень:** {level}\n\n"
+        f"🚗 **Автомобиль:** {game.cars[car_id].name}\n"
+        f"⭐ **Уровень:** {player.level}\n\n"
         "Кто готов соревноваться?"
     )
     
     keyboard = [
-        [InlineKeyboardButton("🎯 Принять вызов!", callback_data=f"accept_{challenge_id}")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="menu_challenge")]
+        [InlineKeyboardButton("🎯 Принять вызов!", callback_data=cb("accept", challenge_id))],
+        [InlineKeyboardButton("🔙 Назад", callback_data=cb("challenge"))]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text(challenge_text, reply_markup=reply_markup)
+    await editor.edit(query, challenge_text, reply_markup=reply_markup)
 
+@router.handler('top')
 async def show_top(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    conn = sqlite3.connect('racing.db')
-    c = conn.cursor()
     
-    try:
-        c.execute('''SELECT username, level, wins, races, pvp_wins, pvp_races, balance 
-                     FROM players 
-                     ORDER BY (wins + pvp_wins * 2) DESC, level DESC 
-                     LIMIT 10''')
-        leaders = c.fetchall()
-    except Exception as e:
-        logger.error(f"Ошибка при получении топа: {e}")
-        leaders = []
+    # Текст топа пересобирается, только когда рейтинг изменился
+    version = game.leaderboard.version
+    top_text = render_cache.top_text(version)
+    if top_text is None:
+        try:
+            leaders = await game_async.get_top(10)
+        except Exception as e:
+            logger.error(f"Ошибка при получении топа: {e}")
+            leaders = []
+        top_text = render_cache.store_top_text(version, format_top(leaders))
     
-    conn.close()
+    rank = await game_async.get_rank(query.from_user.id)
+    if rank:
+        top_text += f"\n📍 Ваше место: {rank}"
     
+    await editor.edit(query, top_text, reply_markup=TOP_MARKUP)
+
+def format_top(leaders):
+    """Текст таблицы лидеров"""
     if not leaders:
-        top_text = "🏆 **Топ гонщиков**\n\nПока нет данных о игроках."
-    else:
-        top_text = "🏆 **Топ гонщиков**\n\n"
-        for i, leader in enumerate(leaders, 1):
-            if len(leader) == 7:  # Новая структура с PvP
-                username, level, wins, races, pvp_wins, pvp_races, balance = leader
-                total_wins = wins + pvp_wins
-                total_races = races + pvp_races
-            else:  # Старая структура без PvP
-                username, level, wins, races, balance = leader
-                total_wins = wins
-                total_races = races
-            
-            win_rate = (total_wins / total_races * 100) if total_races > 0 else 0
-            top_text += f"{i}. **{username}** - Ур.{level} 🏆{total_wins} ({win_rate:.1f}%) 💰{balance}\n"
-    
-    keyboard = [
-        [InlineKeyboardButton("🔄 Обновить", callback_data="menu_top"),
-         InlineKeyboardButton("🔙 Назад", callback_data="menu_main")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+        return "🏆 **Топ гонщиков**\n\nПока нет данных о игроках."
     
-    await query.edit_message_text(top_text, reply_markup=reply_markup)
+    lines = ["🏆 **Топ гонщиков**\n\n"]
+    for i, leader in enumerate(leaders, 1):
+        total_wins = leader.wins + leader.pvp_wins
+        total_races = leader.races + leader.pvp_races
+        
+        win_rate = (total_wins / total_races * 100) if total_races > 0 else 0
+        lines.append(f"{i}. **{leader.username}** - Ур.{leader.level} 🏆{total_wins} ({win_rate:.1f}%) "
+                     f"💰{leader.balance}\n")
+    return "".join(lines)
 
 # --- Обработчики кнопок ---
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
+    user_id = query.from_user.id
+    chat_id = query.message.chat_id if query.message else user_id
+    message_id = query.message.message_id if query.message else query.inline_message_id
     
-    data = query.data
+    if not limiter.allow(user_id, chat_id):
+        metrics.inc('callback_rejected')
+        await query.answer("⏳ Слишком часто! Подождите немного.")
+        return
     
-    if data == "menu_main":
-        await start(update, context)
+    # Повторное нажатие той же кнопки, пока первое еще обрабатывается
+    key = (chat_id, message_id, query.data)
+    if limiter.in_flight(key):
+        await query.answer()
+        return
     
-    elif data == "menu_profile":
-        await show_profile(update, context)
+    with limiter.track(key):
+        await dispatch_callback(update, context)
+
+async def dispatch_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    resolved = router.decode(query.data)
     
-    elif data == "menu_garage":
-        await show_garage(update, context)
+    if resolved is None:
+        logger.warning(f"Некорректные данные кнопки: {query.data!r}")
+        metrics.inc('callback_invalid')
+        await query.answer("❌ Кнопка устарела, откройте меню заново", show_alert=True)
+        return
     
-    elif data == "menu_race":
-        await start_race(update, context)
+    await query.answer()
+    route, args = resolved
+    await metrics.timed('callback', route.name, route.handler(update, context, *args))
+
+@router.handler('none')
+async def ignore_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопки-надписи без действия"""
+
+@router.handler('buy')
+async def buy_car(update: Update, context: ContextTypes.DEFAULT_TYPE, car_id):
+    query = update.callback_query
+    success = await game_async.buy_car(query.from_user.id, car_id)
     
-    elif data == "menu_challenge":
-        await show_challenge_menu(update, context)
+    if success:
+        await query.answer(f"🎉 Вы купили {game.cars[car_id].name}!", show_alert=True)
+        await show_garage(update, context)
+    else:
+        await query.answer("❌ Недостаточно средств для покупки!", show_alert=True)
+
+@router.handler('accept')
+async def accept_challenge(update: Update, context: ContextTypes.DEFAULT_TYPE, challenge_id):
+    query = update.callback_query
     
-    elif data == "menu_top":
-        await show_top(update, context)
+    # Проверяем существование вызова (просроченный не вернется)
+    challenge_data = await game_async.get_challenge(challenge_id)
+    if challenge_data is None:
+        await query.answer("❌ Вызов устарел или уже принят!", show_alert=True)
+        return
     
-    elif data == "menu_refresh":
-        await start(update, context)
+    # Не позволяем самому себе принимать вызов
+    if query.from_user.id == challenge_data['challenger_id']:
+        await query.answer("🤔 Вы не можете принять свой же вызов!", show_alert=True)
+        return
     
-    elif data == "create_challenge":
-        await create_challenge(update, context)
+    # Проверяем, что принимающий зарегистрирован
+    acceptor = await game_async.get_player(query.from_user.id)
+    if not acceptor:
+        await query.answer("❌ Сначала зарегистрируйтесь через /start", show_alert=True)
+        return
     
-    elif data.startswith('buy_'):
-        car_id = int(data.split('_')[1])
-        success = game.buy_car(query.from_user.id, car_id)
-        
-        if success:
-            await query.answer(f"🎉 Вы купили {game.cars[car_id]['name']}!", show_alert=True)
-            await show_garage(update, context)
-        else:
-            await query.answer("❌ Недостаточно средств для покупки!", show_alert=True)
+    # Забираем вызов; пока мы ждали БД, его мог принять другой или он истек
+    challenge_data = await game_async.claim_challenge(challenge_id)
+    if challenge_data is None:
+        await query.answer("❌ Вызов устарел или уже принят!", show_alert=True)
+        return
     
-    elif data.startswith('accept_'):
-        challenge_id = data.replace('accept_', '')
-        
-        # Проверяем существование вызова
-        if challenge_id not in game.active_challenges:
-            await query.answer("❌ Вызов устарел или уже принят!", show_alert=True)
-            return
-        
-        challenge_data = game.active_challenges[challenge_id]
-        
-        # Не позволяем самому себе принимать вызов
-        if query.from_user.id == challenge_data['challenger_id']:
-            await query.answer("🤔 Вы не можете принять свой же вызов!", show_alert=True)
-            return
-        
-        # Проверяем, что принимающий зарегистрирован
-        acceptor_data = game.get_player(query.from_user.id)
-        if not acceptor_data:
-            await query.answer("❌ Сначала зарегистрируйтесь через /start", show_alert=True)
-            return
-        
-        # Удаляем вызов из активных
-        del game.active_challenges[challenge_id]
-        
-        # Запускаем PvP гонку
-        await run_pvp_race(query, challenge_data, acceptor_data)
+    # Запускаем PvP гонку
+    await run_pvp_race(query, challenge_data, acceptor)
 
-async def run_pvp_race(query, challenge_data, acceptor_data):
+async def run_pvp_race(query, challenge_data, acceptor):
     try:
         challenger_id = challenge_data['challenger_id']
         challenger_name = challenge_data['challenger_name']
         
-        acceptor_id = acceptor_data[0]
-        acceptor_name = acceptor_data[1]
+        acceptor_id = acceptor.user_id
+        acceptor_name = acceptor.username
         
-        # Безопасное получение car_id
         challenger_car_id = challenge_data.get('challenger_car_id', 1)
-        acceptor_car_id = acceptor_data[3] if len(acceptor_data) > 3 else 1
+        acceptor_car_id = acceptor.car_id
         
         # Получаем данные об автомобилях
-        challenger_car = game.cars.get(challenger_car_id, game.cars[1])
-        acceptor_car = game.cars.get(acceptor_car_id, game.cars[1])
+        challenger_car_id = challenger_car_id if challenger_car_id in game.cars else 1
+        acceptor_car_id = acceptor_car_id if acceptor_car_id in game.cars else 1
+        challenger_car = game.cars[challenger_car_id]
+        acceptor_car = game.cars[acceptor_car_id]
+        challenger_chance, draw_chance, acceptor_chance = engine.odds(PVP_LUCK).get(challenger_car_id, acceptor_car_id)
+        # Шансы - и в анимации, и в результате: под нагрузкой анимацию заменит результат
+        odds_text = (f"📊 Шансы: {challenger_name} {challenger_chance:.0%}, {acceptor_name} {acceptor_chance:.0%}, "
+                     f"ничья {draw_chance:.0%}")
         
-        # Анимация гонки
-        await query.edit_message_text(
+        # Анимация гонки: не ждем отправки - под нагрузкой ее заменит результат
+        await editor.edit(
+            query,
             f"⚔️ **PvP Гонка начинается!**\n\n"
-            f"🏎️ {challenger_name} vs {acceptor_name}\n\n"
-            f"🔧 Подготовка к старту..."
+            f"🏎️ {challenger_name} vs {acceptor_name}\n"
+            f"{odds_text}\n\n"
+            f"🔧 Подготовка к старту...",
+            priority=BACKGROUND, wait=False
         )
         
         # Расчет силы с случайным фактором
-        challenger_power = (challenger_car['speed'] * 2 + 
-                           challenger_car['acceleration'] * 1.5 + 
-                           challenger_car['handling'] * 1.2 + 
-                           random.randint(1, 15))
-        
-        acceptor_power = (acceptor_car['speed'] * 2 + 
-                         acceptor_car['acceleration'] * 1.5 + 
-                         acceptor_car['handling'] * 1.2 + 
-                         random.randint(1, 15))
+        challenger_power, acceptor_power = engine.race(challenger_car, acceptor_car, PVP_LUCK)
         
         # Определяем победителя
         if challenger_power > acceptor_power:
@@ -627,8 +979,8 @@ async def run_pvp_race(query, challenge_data, acceptor_data):
         
         # Обновляем статистику
         if winner_id:
-            game.update_stats_after_race(winner_id, earnings, exp_gain, True, True)
-            game.update_stats_after_race(loser_id, 200, 20, False, True)
+            await game_async.update_stats_after_race(winner_id, earnings, exp_gain, True, True)
+            await game_async.update_stats_after_race(loser_id, 200, 20, False, True)
             
             result_text = (
                 f"🏆 **ПОБЕДИТЕЛЬ: {winner_name}!**\n\n"
@@ -638,8 +990,8 @@ async def run_pvp_race(query, challenge_data, acceptor_data):
                 f"😢 Проигравший получает 200 кредитов и 20 опыта"
             )
         else:
-            game.update_stats_after_race(challenger_id, earnings, exp_gain, False, True)
-            game.update_stats_after_race(acceptor_id, earnings, exp_gain, False, True)
+            await game_async.update_stats_after_race(challenger_id, earnings, exp_gain, False, True)
+            await game_async.update_stats_after_race(acceptor_id, earnings, exp_gain, False, True)
             
             result_text = (
                 f"🤝 **НИЧЬЯ!**\n\n"
@@ -648,61 +1000,504 @@ async def run_pvp_race(query, challenge_data, acceptor_data):
                 f"💰 Оба игрока получают {earnings} кредитов и {exp_gain} опыта!"
             )
         
-        keyboard = [
-            [InlineKeyboardButton("⚔️ Новый вызов", callback_data="menu_challenge"),
-             InlineKeyboardButton("🔙 В меню", callback_data="menu_main")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(
-            f"🏁 **PvP Гонка завершена!**\n\n{result_text}",
-            reply_markup=reply_markup
+        await editor.edit(
+            query,
+            f"🏁 **PvP Гонка завершена!**\n\n{result_text}\n\n{odds_text}",
+            reply_markup=PVP_RESULT_MARKUP,
+            priority=URGENT
         )
         
     except Exception as e:
         logger.error(f"Ошибка в run_pvp_race: {e}")
-        await query.edit_message_text("❌ Произошла ошибка при запуске гонки. Попробуйте снова.")
+        await editor.edit(query, "❌ Произошла ошибка при запуске гонки. Попробуйте снова.")
+
+# --- Турниры ---
+# Предел длины сообщения Telegram с запасом
+MAX_MESSAGE_TEXT = 4000
+
+def tournament_markup(tournament_id):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("✋ Участвовать", callback_data=cb("join", tournament_id)),
+         InlineKeyboardButton("🚦 Старт", callback_data=cb("start_tournament", tournament_id))],
+        [InlineKeyboardButton("🔙 Назад", callback_data=cb("challenge"))]
+    ])
+
+def format_lobby(tournament_data, entrants):
+    players = "\n".join(f"{number}. {name} - {game.cars.get(car_id, game.cars[1]).name}"
+                        for number, (_, name, car_id) in enumerate(entrants, 1))
+    return (
+        f"🏆 **Турнир от {tournament_data['host_name']}!**\n\n"
+        f"👥 **Участники ({len(entrants)}/{TOURNAMENT_MAX_PLAYERS}):**\n{players}\n\n"
+        f"💰 За каждый выигранный матч: {MATCH_WIN_REWARD[0]} кредитов и {MATCH_WIN_REWARD[1]} опыта\n"
+        "🚦 Ведущий запускает сетку кнопкой «Старт»"
+    )
+
+def format_bracket(rounds, level_up_names):
+    champion = rounds[-1][0][0]
+    header = f"🏁 **Турнир завершен!**\n\n👑 **Чемпион: {champion[1]}** ({game.cars[champion[2]].name})"
+    footer = f"\n\n🎉 Новый уровень: {', '.join(level_up_names)}" if level_up_names else ""
+    # Раунды с конца: если все не помещаются в сообщение, ранние сворачиваются в одну строку
+    sections = []
+    length = len(header) + len(footer)
+    for number in range(len(rounds), 0, -1):
+        matches = rounds[number - 1]
+        title = "Финал" if number == len(rounds) else f"Раунд {number}"
+        section = f"\n\n**{title}:**\n" + "\n".join(f"🏎️ {winner[1]} обходит {loser[1]}" for winner, loser in matches)
+        if length + len(section) > MAX_MESSAGE_TEXT:
+            sections.append(f"\n\n... и еще {number} раунд(а) в начале сетки")
+            break
+        sections.append(section)
+        length += len(section)
+    return header + "".join(reversed(sections)) + footer
+
+@router.handler('tournament')
+async def create_tournament(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    user = query.from_user
+    
+    if query.message.chat.type not in ['group', 'supergroup']:
+        await query.answer("❌ Турниры проводятся только в группах!", show_alert=True)
+        return
+    
+    player = await game_async.get_player(user.id)
+    if not player:
+        await query.answer("Сначала зарегистрируйтесь через /start", show_alert=True)
+        return
+    
+    car_id = player.car_id
+    tournament_data = {
+        'host_id': user.id,
+        'host_name': user.first_name,
+        'chat_id': query.message.chat_id,
+        'message_id': query.message.message_id
+    }
+    tournament_id = await game_async.open_tournament(tournament_data, car_id)
+    if tournament_id is None:
+        await query.answer("❌ У вас уже есть открытый турнир!", show_alert=True)
+        return
+    
+    await editor.edit(query, format_lobby(tournament_data, [(user.id, user.first_name, car_id)]),
+                      reply_markup=tournament_markup(tournament_id))
+
+@router.handler('join')
+async def join_tournament(update: Update, context: ContextTypes.DEFAULT_TYPE, tournament_id):
+    query = update.callback_query
+    user = query.from_user
+    player = await game_async.get_player(user.id)
+    
+    if not player:
+        await query.answer("❌ Сначала зарегистрируйтесь через /start", show_alert=True)
+        return
+    
+    car_id = player.car_id
+    status, tournament_data, entrants = await game_async.join_tournament(tournament_id, user.id, user.first_name, car_id)
+    if status == CLOSED:
+        await query.answer("❌ Турнир уже начался или устарел!", show_alert=True)
+    elif status == ALREADY_JOINED:
+        await query.answer("✅ Вы уже в списке участников")
+    elif status == FULL:
+        await query.answer("❌ Мест больше нет!", show_alert=True)
+    elif len(entrants) >= TOURNAMENT_MAX_PLAYERS:
+        # Сетка заполнена - стартуем без ведущего
+        await run_tournament(query, tournament_id)
+    else:
+        await editor.edit(query, format_lobby(tournament_data, entrants), reply_markup=tournament_markup(tournament_id))
+
+@router.handler('start_tournament')
+async def start_tournament(update: Update, context: ContextTypes.DEFAULT_TYPE, tournament_id):
+    query = update.callback_query
+    await run_tournament(query, tournament_id, query.from_user.id)
+
+async def run_tournament(query, tournament_id, user_id=None):
+    status, tournament_data, entrants = await game_async.start_tournament(tournament_id, user_id)
+    if status == CLOSED:
+        await query.answer("❌ Турнир уже начался или устарел!", show_alert=True)
+        return
+    if status == NOT_HOST:
+        await query.answer("🤔 Запустить турнир может только ведущий", show_alert=True)
+        return
+    if status == TOO_FEW:
+        await query.answer("❌ Для турнира нужно хотя бы 2 участника", show_alert=True)
+        return
+    
+    # Вся сетка - один проход симуляции, все результаты - одна транзакция, итог - одна правка
+    seed = engine.rng.getrandbits(64)
+    rounds = run_bracket(entrants, engine, game.cars, PVP_LUCK, seed)
+    logger.info(f"Турнир {tournament_id}: {len(entrants)} участников, seed {seed}")
+    level_ups = await game_async.record_tournament(bracket_deltas(rounds))
+    if level_ups is None:
+        await editor.edit(query, "❌ Не удалось сохранить результаты турнира.")
+        return
+    
+    names = {user_id: name for user_id, name, _ in entrants}
+    await editor.edit(query, format_bracket(rounds, [names[user_id] for user_id in level_ups]),
+                      reply_markup=PVP_RESULT_MARKUP, priority=URGENT)
+
+# --- Аркада (game.html) ---
+ARCADE_GAME = 'racer'
+verifier = Verifier(ARCADE_VERIFY_WORKERS, ARCADE_VERIFY_TIMEOUT)
+
+async def arcade_keyboard(user_id):
+    """Кнопка WebApp с новым зерном игрока в адресе"""
+    url = WEBAPP_URL
+    if ARCADE_VERIFY:
+        seed = await game_async.issue_arcade_seed(user_id)
+        url += f"{'&' if '?' in url else '?'}seed={seed:08x}"
+    return ReplyKeyboardMarkup([[KeyboardButton("🎮 Играть", web_app=WebAppInfo(url))]], resize_keyboard=True)
+
+async def arcade(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка запуска аркады: tg.sendData работает только из WebApp обычной клавиатуры"""
+    message = update.message
+    if message.chat.type != 'private':
+        await editor.call(message.chat_id, message.reply_text, "🎮 Аркада открывается в личном чате с ботом")
+        return
+    if not WEBAPP_URL:
+        await editor.call(message.chat_id, message.reply_text, "🎮 Аркада пока не настроена")
+        return
+    
+    user = update.effective_user
+    await game_async.register_player(user.id, user.first_name)
+    best = await game_async.best_score(user.id, ARCADE_GAME)
+    keyboard = await arcade_keyboard(user.id)
+    await editor.call(message.chat_id, message.reply_text,
+                      f"🎮 **Аркада**\n\nОбъезжайте машины и жмите \"Поделиться счетом\" - "
+                      f"за очки начисляются кредиты и опыт.\n🏅 Ваш рекорд: {best}",
+                      reply_markup=keyboard)
+
+async def handle_web_app_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Счет из shareScore() аркады"""
+    message = update.effective_message
+    user = update.effective_user
+    try:
+        game_name, score, run = parse_score(message.web_app_data.data)
+        if ARCADE_VERIFY and run is None:
+            raise ValueError("нет журнала игры")
+    except ValueError as e:
+        metrics.inc('score_invalid')
+        logger.warning(f"Некорректный счет от {user.id}: {e}")
+        await editor.call(message.chat_id, message.reply_text, "❌ Не удалось принять счет")
+        return
+    
+    seed = None
+    if ARCADE_VERIFY:
+        # Повтор игры в пуле процессов: цикл событий не ждет симуляцию
+        if not await metrics.timed('arcade', 'verify', verifier.verify(score, *run)):
+            metrics.inc('score_rejected')
+            logger.warning(f"Счет {score} от {user.id} не подтвержден повтором игры")
+            await editor.call(message.chat_id, message.reply_text, "❌ Счет не подтвердился")
+            return
+        seed = run[0]
+    
+    status, previous_best, (credits, exp_gain), level_up = await game_async.submit_score(
+        user.id, user.first_name, game_name, score, (message.chat_id, message.message_id), seed)
+    if status == REJECTED:
+        # Зерно чужое, истекло или уже потрачено другим счетом
+        metrics.inc('score_rejected')
+        await editor.call(message.chat_id, message.reply_text,
+                          "❌ Эта игра уже засчитана или устарела. Откройте аркаду заново: /arcade")
+        return
+    if status == DUPLICATE:
+        # Повторная доставка того же сообщения: ответ уже отправлен
+        metrics.inc('score_duplicate')
+        return
+    if status is None:
+        await editor.call(message.chat_id, message.reply_text, "❌ Не удалось сохранить счет. Попробуйте позже.")
+        return
+    
+    record_text = "🏆 **Новый рекорд!**" if score > previous_best else f"🏅 Рекорд: {previous_best}"
+    level_up_text = "\n🎉 **Новый уровень!**" if level_up else ""
+    # Новое зерно для следующей игры
+    keyboard = await arcade_keyboard(user.id) if WEBAPP_URL else None
+    await editor.call(message.chat_id, message.reply_text,
+                      f"🎮 Счет: {score}\n{record_text}\n"
+                      f"💰 +{credits} кредитов, ⭐ +{exp_gain} опыта{level_up_text}",
+                      reply_markup=keyboard)
+
+# --- Сброс отложенной статистики ---
+async def flush_stats(context: ContextTypes.DEFAULT_TYPE):
+    await game_async.flush_stats()
+
+# --- Свертка журнала экономики ---
+async def compact_ledger_batches():
+    """Свертка журнала: каждая пачка - отдельный вызов потока БД, и запросы
+    обработчиков выполняются между пачками; (записей, игроков, удалено)"""
+    entries = players = 0
+    while True:
+        folded, updated = await game_async.compact_ledger_step()
+        entries += folded
+        players += updated
+        if folded < game.ledger.compact_batch:
+            break
+    return entries, players, await game_async.prune_ledger()
+
+async def compact_ledger(context: ContextTypes.DEFAULT_TYPE):
+    entries, players, pruned = await compact_ledger_batches()
+    if entries or pruned:
+        logger.info(f"Журнал: свернуто {entries} записей в {players} игроков, удалено старых {pruned}")
 
 # --- Очистка старых вызовов ---
 async def cleanup_challenges(context: ContextTypes.DEFAULT_TYPE):
-    now = datetime.now()
-    expired_challenges = []
+    expired_challenges = await game_async.expire_challenges()
     
-    for challenge_id, challenge_data in game.active_challenges.items():
-        if (now - challenge_data['created_at']).seconds > 1800:  # 30 минут
-            expired_challenges.append(challenge_id)
+    if expired_challenges:
+        logger.info(f"Очищено {expired_challenges} просроченных вызовов")
     
-    for challenge_id in expired_challenges:
-        del game.active_challenges[challenge_id]
+    expired_tournaments = await game_async.expire_tournaments()
+    if expired_tournaments:
+        logger.info(f"Очищено {expired_tournaments} несостоявшихся турниров")
     
-    if expired_challenges:
-        logger.info(f"Очищено {len(expired_challenges)} просроченных вызовов")
+    await game_async.expire_arcade_seeds()
 
-# --- Главная функция ---
-def main():
-    # Используем BOT_TOKEN из .env файла
-    application = Application.builder().token(BOT_TOKEN).build()
+# --- Корректное завершение ---
+async def flush_scores(context: ContextTypes.DEFAULT_TYPE):
+    await game_async.flush_scores()
+
+async def on_shutdown(application: Application):
+    # Дописываем отложенные результаты гонок и счета аркады, пока поток БД еще работает,
+    # и сворачиваем журнал: players после остановки актуальна
+    await game_async.flush_scores()
+    await game_async.flush_stats()
+    await compact_ledger_batches()
+    server = application.bot_data.pop('metrics_server', None)
+    if server is not None:
+        server.close()
+
+# --- Метрики ---
+def format_outbound_stats():
+    return ", ".join(f"{name}={value:.1f}" if isinstance(value, float) else f"{name}={value}"
+                     for name, value in editor.stats().items())
+
+async def log_metrics(context: ContextTypes.DEFAULT_TYPE):
+    for family in ('callback', 'db', 'api', 'arcade', 'backup'):
+        lines = metrics.summary(family, limit=10)
+        if lines:
+            logger.info(f"Метрики {family}: " + "; ".join(lines))
+    logger.info(f"Исходящие: {format_outbound_stats()}")
+
+async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Сводка метрик для администратора"""
+    if ADMIN_ID == '0' or str(update.effective_user.id) != ADMIN_ID:
+        return
+    
+    sections = [("🖱 Кнопки", 'callback', None), ("🗄 БД", 'db', 10), ("📡 Bot API", 'api', None),
+                ("🎮 Аркада", 'arcade', None)]
+    text = "📊 Метрики бота\n"
+    for title, family, limit in sections:
+        lines = metrics.summary(family, limit)
+        text += f"\n{title}\n" + ("\n".join(lines) if lines else "нет данных") + "\n"
+    counters = ", ".join(f"{name}={value}" for name, value in sorted(metrics.counters.items()))
+    text += f"\n📤 Исходящие: {format_outbound_stats()}\n"
+    if counters:
+        text += f"🚦 Отклонено: {counters}\n"
+    await editor.call(update.message.chat_id, update.message.reply_text, text[:MAX_MESSAGE_TEXT])
+
+async def start_metrics_server(application: Application, port=METRICS_PORT):
+    if port:
+        application.bot_data['metrics_server'] = await metrics.serve(METRICS_HOST, port)
+
+async def post_init(application: Application, metrics_port=METRICS_PORT):
+    # Процессы проверки форкаются до открытия базы и первых обновлений:
+    # соединение SQLite и поток БД в дочерние процессы не попадают
+    if ARCADE_VERIFY:
+        verifier.start()
+    version = await game_async.open_db()
+    logger.info(f"База {DB_PATH}, версия схемы {version}")
+    logger.info(f"Пакетные гонки (турниры): {BATCH_BACKEND}"
+                + ("" if BATCH_BACKEND == 'numpy' else " - NumPy не установлен, расчет медленнее"))
+    await start_metrics_server(application, metrics_port)
+
+
+# --- Резервные копии ---
+async def backup_db(context: ContextTypes.DEFAULT_TYPE):
+    """Онлайн-копия базы и выгрузка игроков из нее.
+
+    Копирование идет в отдельном потоке и со своего соединения, поток БД
+    обработчиков оно не занимает. Пока оно идет, раз в 100 мс замеряем,
+    сколько писатель ждет блокировку записи, - в отчет попадает худшее.
+    """
+    # Отложенные результаты - в базу, журнал - в players, чтобы выгрузка была актуальной
+    await game_async.flush_scores()
+    await game_async.flush_stats()
+    await compact_ledger_batches()
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    name = os.path.splitext(os.path.basename(DB_PATH))[0]
+    dest = os.path.join(BACKUP_DIR, f"{name}-{stamp}.db")
+    
+    copying = asyncio.create_task(metrics.timed('backup', 'copy',
+                                                asyncio.to_thread(backup_database, DB_PATH, dest, BACKUP_PAGES)))
+    stall = 0.0
+    while not copying.done():
+        stall = max(stall, await game_async.call(game.db.probe_write))
+        await asyncio.wait({copying}, timeout=0.1)
+    try:
+        report = copying.result()
+    except Exception as e:
+        logger.error(f"Ошибка резервного копирования: {e}")
+        return
+    metrics.observe('backup', 'writer_stall', stall)
+    megabytes = report['bytes'] / 2 ** 20
+    logger.info(f"Резервная копия {dest}: {megabytes:.1f} МБ за {report['seconds']:.2f} с "
+                f"({megabytes / max(report['seconds'], 1e-9):.1f} МБ/с, шагов {report['steps']}), "
+                f"самое долгое ожидание записи {stall * 1000:.1f} мс")
+    prune(os.path.join(BACKUP_DIR, f"{name}-*.db"), BACKUP_KEEP)
+    
+    if EXPORT_FORMAT:
+        # Выгрузка читает готовую копию, а не рабочую базу
+        export = os.path.join(BACKUP_DIR, f"players-{stamp}.{EXPORT_FORMAT}.gz")
+        try:
+            report = await metrics.timed('backup', 'export', asyncio.to_thread(
+                export_table, dest, export, 'players', PLAYER_COLUMNS, EXPORT_FORMAT))
+        except Exception as e:
+            logger.error(f"Ошибка выгрузки игроков: {e}")
+            return
+        logger.info(f"Выгрузка {export}: {report['rows']} игроков за {report['seconds']:.2f} с "
+                    f"({report['rows'] / max(report['seconds'], 1e-9):.0f} строк/с, "
+                    f"{report['bytes'] / 2 ** 20:.1f} МБ)")
+        prune(os.path.join(BACKUP_DIR, f"players-*.{EXPORT_FORMAT}.gz"), BACKUP_KEEP)
+
+async def reload_leaderboard(context: ContextTypes.DEFAULT_TYPE):
+    await game_async.reload_leaderboard()
+
+# --- Сборка приложения ---
+def build_application(token=BOT_TOKEN, base_url=TELEGRAM_API_URL, updater=True, backups=True):
+    builder = (
+        Application.builder()
+        .token(token)
+        .base_url(base_url)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        # Одновременные обработчики не должны ждать единственного соединения к API
+        .connection_pool_size(API_CONNECTIONS)
+        .post_init(post_init)
+        .post_shutdown(on_shutdown)
+    )
+    if not updater:
+        # Обновления шарду передает координатор
+        builder = builder.updater(None)
+    application = builder.build()
     
     # Обработчики команд
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("stats", show_stats))
+    application.add_handler(CommandHandler("arcade", arcade))
+    application.add_handler(MessageHandler(filters.StatusUpdate.WEB_APP_DATA, handle_web_app_data))
     
     # Обработчики кнопок
     application.add_handler(CallbackQueryHandler(handle_callback))
     
+    # Состояние очереди исходящих, кэша игроков и ограничителя нажатий - в /metrics
+    # (лямбды: бенчмарки и тесты подменяют editor и limiter)
+    metrics.gauge('outbound', lambda: editor.stats())
+    metrics.gauge('player_cache', lambda: game.cache.stats())
+    metrics.gauge('limiter', lambda: limiter.stats())
+    
     # Запуск очистки вызовов
     job_queue = application.job_queue
-    job_queue.run_repeating(cleanup_challenges, interval=1800, first=10)
+    job_queue.run_repeating(cleanup_challenges, interval=CHALLENGE_SWEEP_INTERVAL, first=10)
+    if game.stats_buffer.enabled:
+        job_queue.run_repeating(flush_stats, interval=STATS_FLUSH_INTERVAL_MS / 1000)
+    job_queue.run_repeating(flush_scores, interval=SCORE_FLUSH_INTERVAL_MS / 1000)
+    if LEDGER_COMPACT_INTERVAL:
+        job_queue.run_repeating(compact_ledger, interval=LEDGER_COMPACT_INTERVAL, first=LEDGER_COMPACT_INTERVAL)
+    if METRICS_LOG_INTERVAL:
+        job_queue.run_repeating(log_metrics, interval=METRICS_LOG_INTERVAL, first=METRICS_LOG_INTERVAL)
+    if SHARD_WORKERS > 1:
+        job_queue.run_repeating(reload_leaderboard, interval=LEADERBOARD_REFRESH)
+    if backups and BACKUP_DIR and BACKUP_INTERVAL:
+        job_queue.run_repeating(backup_db, interval=BACKUP_INTERVAL, first=BACKUP_INTERVAL)
     
+    return application
+
+# --- Процесс-обработчик шарда ---
+async def serve_shard(application: Application, updates, metrics_port=0):
+    loop = asyncio.get_running_loop()
+    async with application:
+        # post_init вызывают только run_polling/run_webhook
+        await post_init(application, metrics_port)
+        await application.start()
+        while True:
+            try:
+                batch = await loop.run_in_executor(None, updates.get, True, 1)
+            except queue.Empty:
+                # Координатор упал, не успев остановить воркеры
+                if not multiprocessing.parent_process().is_alive():
+                    break
+                continue
+            if batch is None:
+                break
+            for data in batch:
+                await application.update_queue.put(Update.de_json(data, application.bot))
+        # stop() дожидается обработки уже полученных обновлений
+        await application.stop()
+        await on_shutdown(application)
+
+def run_shard_worker(index, updates):
+    # Ctrl+C и SIGTERM получает вся группа процессов; воркеры останавливает координатор,
+    # дав им доработать очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    logger.info(f"Шард {index} запущен")
+    try:
+        # Копии базы делает только первый шард
+        application = build_application(updater=False, backups=index == 0)
+        asyncio.run(serve_shard(application, updates, METRICS_PORT + index if METRICS_PORT else 0))
+    finally:
+        verifier.shutdown()
+        game_async.shutdown()
+        game.flush_scores()
+        game.flush_stats()
+
+# --- Главная функция ---
+def main():
     # Запуск бота
     print("✅ Конфигурация загружена из .env файла!")
     print("🏎️ Гоночный бот запущен...")
     logger.info("Бот запущен с защищенной конфигурацией")
     
+    if SHARD_WORKERS > 1:
+        # Приложения собирают сами воркеры, координатору нужен только прием обновлений
+        run_sharded()
+        return
+    
+    # Используем BOT_TOKEN из .env файла
+    application = build_application()
     try:
-        application.run_polling()
+        if WEBHOOK_URL:
+            logger.info(f"Режим webhook: {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+            # Запросы без верного секретного заголовка отклоняются с кодом 403
+            application.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+            )
+        else:
+            application.run_polling()
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
         print("❌ Ошибка при запуске бота. Проверьте BOT_TOKEN в .env файле")
+    finally:
+        verifier.shutdown()
+        game_async.shutdown()
+        # Не теряем результаты гонок и счета, накопленные с последнего сброса
+        game.flush_scores()
+        game.flush_stats()
+
+def run_sharded():
+    """Координатор принимает обновления и раздает их SHARD_WORKERS процессам"""
+    logger.info(f"Шардирование: {SHARD_WORKERS} процессов")
+    coordinator = Coordinator(run_shard_worker, SHARD_WORKERS)
+    api_url = f"{TELEGRAM_API_URL}{BOT_TOKEN}"
+    if WEBHOOK_URL:
+        ingest = coordinator.serve_webhook(api_url, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+                                           f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}", WEBHOOK_SECRET)
+    else:
+        ingest = coordinator.poll(api_url)
+    try:
+        coordinator.run(ingest)
+    finally:
+        game_async.shutdown()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,149 @@
+import asyncio
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+# Модель аркады game.html в логических единицах: поле высотой 700, кадр - 50 мс.
+# Числа и порядок шагов должны совпадать с gameLoop в game.html
+FIELD_HEIGHT = 700
+OBSTACLE_HEIGHT = 100
+SPAWN_Y = -100
+PLAYER_TOP, PLAYER_BOTTOM = 550, 650
+LANES = 3
+START_SPEED = 5.0
+# Прибавка скорости за каждые 100 очков
+SPEED_STEP = 0.5
+POINTS_PER_OBSTACLE = 10
+FIRST_SPAWN_TICKS = 40
+MIN_SPAWN_TICKS = 10
+# Потолок длины игры для проверки (30 минут) - время проверки ограничено
+MAX_TICKS = 36000
+MAX_ROUND = 10000
+
+_MOVES = re.compile(r'(?:[0-9a-z]{1,4}[LR])*')
+_MOVE = re.compile(r'([0-9a-z]{1,4})([LR])')
+
+
+def next_random(state):
+    """xorshift32 - тот же генератор, что nextRandom() в game.html"""
+    state ^= (state << 13) & 0xFFFFFFFF
+    state ^= state >> 17
+    state ^= (state << 5) & 0xFFFFFFFF
+    return state
+
+
+def round_state(seed, round_index):
+    """Начальное состояние генератора для раунда (повторные игры в одном запуске WebApp)"""
+    return (seed ^ ((round_index + 1) * 0x9E3779B1 & 0xFFFFFFFF)) or 1
+
+
+def spawn_ticks(score):
+    return max(MIN_SPAWN_TICKS, (2000 - score * 4 // 5) // 50)
+
+
+def decode_moves(log):
+    """[(кадр, -1 или +1)] из журнала "<кадров с прошлого хода в base36><L|R>..." """
+    if not _MOVES.fullmatch(log):
+        raise ValueError("некорректный журнал ходов")
+    moves, tick = [], 0
+    for delta, direction in _MOVE.findall(log):
+        tick += int(delta, 36)
+        moves.append((tick, -1 if direction == 'L' else 1))
+    return moves
+
+
+def simulate(seed, round_index, moves, max_ticks=MAX_TICKS):
+    """Прогон игры по ходам: (счет, кадр столкновения или None, если игра не кончилась)"""
+    state = round_state(seed, round_index)
+    lane = 1
+    speed = START_SPEED
+    score = milestones = 0
+    countdown = FIRST_SPAWN_TICKS
+    obstacles = []
+    pending = iter(moves)
+    move = next(pending, None)
+    for tick in range(max_ticks):
+        # Ходы, сделанные до этого кадра
+        while move is not None and move[0] <= tick:
+            lane = min(LANES - 1, max(0, lane + move[1]))
+            move = next(pending, None)
+        countdown -= 1
+        if countdown <= 0:
+            state = next_random(state)
+            obstacles.append([state % LANES, SPAWN_Y])
+            countdown = spawn_ticks(score)
+        kept = []
+        for obstacle in obstacles:
+            obstacle[1] += speed
+            if obstacle[1] > FIELD_HEIGHT:
+                score += POINTS_PER_OBSTACLE
+            else:
+                kept.append(obstacle)
+        obstacles = kept
+        for obstacle_lane, top in obstacles:
+            if obstacle_lane == lane and top + OBSTACLE_HEIGHT > PLAYER_TOP and top < PLAYER_BOTTOM:
+                return score, tick
+        if score // 100 > milestones:
+            speed += SPEED_STEP * (score // 100 - milestones)
+            milestones = score // 100
+    return score, None
+
+
+def verify_run(score, seed, round_index, ticks, log):
+    """Заявленный счет получается из ходов и зерна, а игра кончается на заявленном кадре"""
+    if not 0 <= ticks < MAX_TICKS:
+        return False
+    try:
+        moves = decode_moves(log)
+    except ValueError:
+        return False
+    if moves and moves[-1][0] > ticks:
+        return False
+    return simulate(seed, round_index, moves, ticks + 1) == (score, ticks)
+
+
+class Verifier:
+    """Проверка счетов в пуле процессов, чтобы не занимать цикл событий.
+
+    Пул создается через fork до открытия базы и начала обработки обновлений
+    (start() в начале post_init): дочерним процессам нужна только verify_run,
+    а spawn заново импортировал бы Race.py с базой и ботом. Ответ ждется не дольше timeout;
+    сама симуляция ограничена MAX_TICKS, так что вечной проверки не бывает.
+    """
+
+    def __init__(self, workers=1, timeout=2.0):
+        self.workers = workers
+        self.timeout = timeout
+        self.verified = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._pool = None
+
+    def start(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+            # Процессы запускаются сразу, а не на первом счете
+            for _ in range(self.workers):
+                self._pool.submit(int)
+        return self
+
+    async def verify(self, score, seed, round_index, ticks, log):
+        """True - счет подтвержден, False - нет или проверка не уложилась во время"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        try:
+            valid = await asyncio.wait_for(
+                loop.run_in_executor(self._pool, verify_run, score, seed, round_index, ticks, log), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return False
+        if valid:
+            self.verified += 1
+        else:
+            self.rejected += 1
+        return valid
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,107 @@
+import csv
+import glob
+import gzip
+import json
+import os
+import sqlite3
+import time
+
+# Страниц за шаг backup_step: шаг короткий, поток копирования отдает GIL между шагами
+BACKUP_PAGES = 256
+EXPORT_BATCH = 5000
+EXPORT_FORMATS = ('jsonl', 'csv')
+
+
+def _snapshot(path):
+    """Отдельное соединение с открытой транзакцией чтения.
+
+    В режиме WAL чтение не мешает писателям, а пока транзакция открыта,
+    соединение видит одну и ту же версию базы. Без этого запись с любого
+    другого соединения перезапускает backup с начала, и под нагрузкой
+    копия не заканчивается никогда.
+    """
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("BEGIN")
+    conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+    return conn
+
+
+def _finish(part, dest):
+    # Файл появляется под своим именем только целиком
+    os.replace(part, dest)
+    return os.path.getsize(dest)
+
+
+def backup_database(path, dest, pages=BACKUP_PAGES, pause=0.0):
+    """Онлайн-копия базы шагами по pages страниц; отчет о копии.
+
+    Копия согласована на момент начала (см. _snapshot) и пишется во
+    временный файл рядом с dest. pause - сон между шагами, если копию
+    нужно растянуть, чтобы не занимать диск.
+    """
+    source = _snapshot(path)
+    part = dest + '.part'
+    if os.path.exists(part):
+        os.remove(part)
+    target = sqlite3.connect(part)
+    steps = 0
+
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        if pause:
+            time.sleep(pause)
+
+    start = time.perf_counter()
+    try:
+        source.backup(target, pages=pages, progress=progress)
+    finally:
+        target.close()
+        source.close()
+    elapsed = time.perf_counter() - start
+    size = _finish(part, dest)
+    return {'path': dest, 'bytes': size, 'seconds': elapsed, 'steps': steps}
+
+
+def export_table(path, dest, table, columns, fmt='jsonl', batch=EXPORT_BATCH):
+    """Потоковая выгрузка таблицы в dest (.gz): JSON Lines или CSV с заголовком.
+
+    Строки читаются курсором пачками по batch, поэтому память не зависит от
+    размера таблицы; выгрузка согласована, как и копия.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"неизвестный формат выгрузки {fmt!r}")
+    names = [name.strip() for name in columns.split(',')]
+    source = _snapshot(path)
+    part = dest + '.part'
+    rows = 0
+    start = time.perf_counter()
+    try:
+        cursor = source.execute(f"SELECT {columns} FROM {table} ORDER BY rowid")
+        with gzip.open(part, 'wt', encoding='utf-8', newline='', compresslevel=6) as out:
+            if fmt == 'csv':
+                writer = csv.writer(out)
+                writer.writerow(names)
+            while True:
+                chunk = cursor.fetchmany(batch)
+                if not chunk:
+                    break
+                if fmt == 'csv':
+                    writer.writerows(chunk)
+                else:
+                    out.writelines(json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n' for row in chunk)
+                rows += len(chunk)
+    finally:
+        source.close()
+    elapsed = time.perf_counter() - start
+    size = _finish(part, dest)
+    return {'path': dest, 'bytes': size, 'seconds': elapsed, 'rows': rows}
+
+
+def prune(pattern, keep):
+    """Оставляем keep самых новых файлов по шаблону; число удаленных"""
+    files = sorted(glob.glob(pattern), key=os.path.getmtime, reverse=True)
+    for name in files[keep:]:
+        os.remove(name)
+    return max(0, len(files) - keep)
@@ -0,0 +1,42 @@
+"""Общие помощники для бенчмарков"""
+import os
+import tempfile
+import time
+
+from metrics import percentile
+# Поддельные объекты Telegram для прогона настоящих обработчиков - общие с тестами
+from tests.helpers import FakeCallbackQuery, FakeChat, FakeMessage, FakeUpdate, FakeUser
+
+
+def temp_db_path(name='bench.db'):
+    """Путь к базе во временном каталоге"""
+    return os.path.join(tempfile.mkdtemp(prefix='race_bench_'), name)
+
+
+def import_race(db_path):
+    """Импорт Race.py с тестовым окружением (без реального токена)"""
+    os.environ.setdefault('BOT_TOKEN', 'bench:token')
+    os.environ['DB_PATH'] = db_path
+    import Race
+    return Race
+
+
+def ops_per_sec(fn, n):
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return n / (time.perf_counter() - start)
+
+
+def callback_update(user_id, data, chat_id=None, chat_type='private', message_id=1, network_delay=0.0):
+    chat = FakeChat(chat_id if chat_id is not None else user_id, chat_type)
+    query = FakeCallbackQuery(FakeUser(user_id), FakeMessage(chat, message_id), data, network_delay)
+    return FakeUpdate(callback_query=query)
+
+
+def disable_rate_limit(Race):
+    """Снимаем ограничения частоты нажатий и исходящих вызовов для замеров самих обработчиков"""
+    from outbound import OutboundScheduler
+    from ratelimit import CallbackLimiter
+    Race.limiter = CallbackLimiter(1e9, 10 ** 9, 1e9, 10 ** 9)
+    Race.editor = OutboundScheduler(1e9, 1e9, 1e9, 10 ** 9, max_in_flight=10 ** 6, metrics=Race.metrics)
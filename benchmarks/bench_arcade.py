@@ -0,0 +1,122 @@
+"""Проверка счетов аркады повтором игры: проверок в секунду на ядро и через
+пул процессов Verifier и предел времени проверки. Отклонение подделок и
+расход зерна проверяет tests/test_arcade.py.
+
+Игры записывает бот, который играет по тем же правилам, что game.html
+(повтор шагов arcade.simulate с выбором полосы).
+Запуск: python -m benchmarks.bench_arcade [игр]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+from arcade import (FIELD_HEIGHT, FIRST_SPAWN_TICKS, LANES, MAX_TICKS, OBSTACLE_HEIGHT, PLAYER_BOTTOM, PLAYER_TOP,
+                    POINTS_PER_OBSTACLE, SPAWN_Y, SPEED_STEP, START_SPEED, Verifier, next_random, round_state,
+                    spawn_ticks, verify_run)
+
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def base36(value):
+    digits = ''
+    while True:
+        value, digit = divmod(value, 36)
+        digits = DIGITS[digit] + digits
+        if not value:
+            return digits
+
+
+def play(seed, round_index, rng):
+    """Игра бота: (счет, кадр конца, журнал ходов) в формате shareScore()"""
+    state = round_state(seed, round_index)
+    lane, speed = 1, START_SPEED
+    score = milestones = 0
+    countdown = FIRST_SPAWN_TICKS
+    obstacles = []
+    log, last_move = [], 0
+    # Чем ближе бот замечает машину, тем раньше он ошибется
+    lookahead = rng.uniform(3, 9)
+
+    def busy(target):
+        return any(obstacle_lane == target and PLAYER_TOP - OBSTACLE_HEIGHT - lookahead * speed < top < PLAYER_BOTTOM
+                   for obstacle_lane, top in obstacles)
+
+    for tick in range(MAX_TICKS - 1):
+        if busy(lane) or rng.random() < 0.01:
+            options = [target for target in (lane - 1, lane + 1) if 0 <= target < LANES and not busy(target)]
+            if options:
+                target = rng.choice(options)
+                log.append(base36(tick - last_move) + ('L' if target < lane else 'R'))
+                last_move, lane = tick, target
+        countdown -= 1
+        if countdown <= 0:
+            state = next_random(state)
+            obstacles.append([state % LANES, SPAWN_Y])
+            countdown = spawn_ticks(score)
+        for obstacle in obstacles:
+            obstacle[1] += speed
+        score += POINTS_PER_OBSTACLE * sum(top > FIELD_HEIGHT for _, top in obstacles)
+        obstacles = [obstacle for obstacle in obstacles if obstacle[1] <= FIELD_HEIGHT]
+        if any(obstacle_lane == lane and top + OBSTACLE_HEIGHT > PLAYER_TOP and top < PLAYER_BOTTOM
+               for obstacle_lane, top in obstacles):
+            return score, tick, ''.join(log)
+        if score // 100 > milestones:
+            speed += SPEED_STEP * (score // 100 - milestones)
+            milestones = score // 100
+    return None
+
+
+def make_games(n, rng):
+    games = []
+    while len(games) < n:
+        seed, round_index = rng.getrandbits(32) or 1, rng.randrange(3)
+        result = play(seed, round_index, rng)
+        if result:
+            score, ticks, log = result
+            games.append((score, seed, round_index, ticks, log))
+    return games
+
+
+async def verify_all(verifier, games):
+    start = time.perf_counter()
+    results = await asyncio.gather(*(verifier.verify(*game) for game in games))
+    return results, time.perf_counter() - start
+
+
+def main(n=300):
+    rng = random.Random(21)
+    games = make_games(n, rng)
+    ticks = sum(game[3] for game in games)
+    scores = sorted(game[0] for game in games)
+    print(f"{n} игр бота: счет медиана {scores[n // 2]}, максимум {scores[-1]}, "
+          f"в среднем {ticks // n} кадров ({ticks / n * 0.05:.0f} с игры)")
+
+    start = time.perf_counter()
+    confirmed = sum(verify_run(*game) for game in games)
+    elapsed = time.perf_counter() - start
+    per_tick = elapsed / ticks
+    print(f"одно ядро:  {n / elapsed:8.0f} проверок/с, {ticks / elapsed / 1e6:.2f} млн кадров/с, "
+          f"подтверждено {confirmed} из {n}")
+    print(f"худший случай (игра на MAX_TICKS = {MAX_TICKS} кадров): ~{per_tick * MAX_TICKS * 1000:.0f} мс")
+
+    for workers in sorted({1, os.cpu_count() or 1}):
+        verifier = Verifier(workers, timeout=30).start()
+        results, elapsed = asyncio.run(verify_all(verifier, games))
+        verifier.shutdown()
+        print(f"пул из {workers}: {n / elapsed:8.0f} проверок/с ({n / elapsed / workers:.0f} на процесс), "
+              f"подтверждено {sum(results)}")
+
+    # Проверка, не уложившаяся во время, - отказ, а не ожидание
+    longest = max(games, key=lambda game: game[3])
+    verifier = Verifier(1, timeout=0.001).start()
+    start = time.perf_counter()
+    valid = asyncio.run(verifier.verify(*longest))
+    waited = time.perf_counter() - start
+    verifier.shutdown()
+    print(f"предел ожидания 1 мс: {'принято' if valid else 'отказ'} через {waited * 1000:.1f} мс")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300)
@@ -0,0 +1,76 @@
+"""Нагрузочный тест: задержка обработчиков при одновременных callback-запросах.
+
+Сравнивает прямые синхронные вызовы game.* в цикле событий (старое поведение)
+с асинхронным фасадом game_async, у которого БД работает в отдельном потоке.
+Медленный диск имитируется задержкой в update_stats_after_race.
+
+Запуск: python -m benchmarks.bench_async_latency [одновременных_запросов]
+"""
+import asyncio
+import sys
+import time
+
+from benchmarks._common import callback_update, disable_rate_limit, import_race, percentile, temp_db_path
+
+SLOW_WRITE = 0.005      # имитация медленного fsync
+NETWORK_DELAY = 0.02    # имитация обращения к Telegram API
+PLAYERS = 200
+
+
+class BlockingFacade:
+    """Старое поведение: синхронный вызов прямо в цикле событий"""
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+
+        async def method(*args, **kwargs):
+            return attr(*args, **kwargs)
+
+        return method
+
+
+async def run_load(Race, concurrency):
+    async def one(i):
+        data = "menu_race" if i % 4 == 0 else "menu_profile"
+        update = callback_update(i % PLAYERS, data, network_delay=NETWORK_DELAY)
+        start = time.perf_counter()
+        await Race.handle_callback(update, None)
+        return data, time.perf_counter() - start
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(concurrency)))
+    return results, time.perf_counter() - started
+
+
+def main(concurrency=400):
+    Race = import_race(temp_db_path())
+    disable_rate_limit(Race)
+    for user_id in range(PLAYERS):
+        Race.game.register_player(user_id, f"player{user_id}")
+
+    update_stats = Race.game.update_stats_after_race
+
+    def slow_update_stats(*args, **kwargs):
+        time.sleep(SLOW_WRITE)
+        return update_stats(*args, **kwargs)
+
+    Race.game.update_stats_after_race = slow_update_stats
+
+    facade = Race.game_async
+    for name, impl in (("блокирующие вызовы", BlockingFacade(Race.game)), ("AsyncFacade", facade)):
+        Race.game_async = impl
+        results, elapsed = asyncio.run(run_load(Race, concurrency))
+        reads = [latency for data, latency in results if data == "menu_profile"]
+        every = [latency for _, latency in results]
+        print(f"{name}: {concurrency} запросов за {elapsed:.2f} с")
+        print(f"  все обработчики   p50={percentile(every, 50) * 1000:7.1f} мс  p99={percentile(every, 99) * 1000:7.1f} мс")
+        print(f"  только профиль    p50={percentile(reads, 50) * 1000:7.1f} мс  p99={percentile(reads, 99) * 1000:7.1f} мс")
+    Race.game_async = facade
+    facade.shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 400)
@@ -0,0 +1,56 @@
+"""Число обращений к SQLite на гонку и гонок в секунду: прежние UPDATE +
+SELECT + UPDATE против записи в журнал экономики (один INSERT, новый
+уровень считается по записи игрока в кэше). Инварианты под конкурентной
+нагрузкой проверяет tests/test_atomic.py.
+
+Запуск: python -m benchmarks.bench_atomic [гонок]
+"""
+import sys
+import time
+
+from benchmarks._common import import_race, temp_db_path
+
+
+def legacy_update_stats(conn, user_id, earnings, exp_gain, is_win):
+    """Прежняя реализация: UPDATE, SELECT и, возможно, второй UPDATE"""
+    c = conn.cursor()
+    c.execute('''UPDATE players SET balance = balance + ?, experience = experience + ?,
+                 races = races + 1, wins = wins + ? WHERE user_id = ?''',
+              (earnings, exp_gain, 1 if is_win else 0, user_id))
+    exp, level = c.execute("SELECT experience, level FROM players WHERE user_id = ?", (user_id,)).fetchone()
+    new_level = exp // 100 + 1
+    if new_level > level:
+        c.execute("UPDATE players SET level = ? WHERE user_id = ?", (new_level, user_id))
+        conn.commit()
+        return True
+    conn.commit()
+    return False
+
+
+def count_statements(conn, fn, races):
+    statements = []
+    conn.set_trace_callback(statements.append)
+    start = time.perf_counter()
+    for i in range(races):
+        fn(i)
+    elapsed = time.perf_counter() - start
+    conn.set_trace_callback(None)
+    # Управляющие BEGIN/COMMIT тоже обращения к библиотеке, считаем их
+    return len(statements) / races, races / elapsed
+
+
+def main(races=4000):
+    path = temp_db_path()
+    Race = import_race(path)
+    # Как в боте: игрок в кэше, без отложенной записи
+    game = Race.RacingGame(path, stats_flush_races=1)
+    game.register_player(2, "solo")
+    legacy = count_statements(game.db.conn, lambda i: legacy_update_stats(game.db.conn, 2, 500, 25, True), races)
+    atomic = count_statements(game.db.conn, lambda i: game.update_stats_after_race(2, 500, 25, True), races)
+    Race.game_async.shutdown()
+    print(f"UPDATE + SELECT + UPDATE: {legacy[0]:.2f} обращений/гонку, {legacy[1]:.0f} гонок/с")
+    print(f"журнал, INSERT:           {atomic[0]:.2f} обращений/гонку, {atomic[1]:.0f} гонок/с")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 4000)
@@ -0,0 +1,139 @@
+"""Онлайн-копия racing.db под нагрузкой записи и потоковая выгрузка игроков.
+
+Пока поток-писатель непрерывно пишет в журнал через соединение бота,
+база копируется: backup_database (свое соединение, шаги по BACKUP_PAGES
+страниц) против копии одним шагом через соединение бота. Отчет - скорость
+копирования и самая долгая пауза писателя в сравнении с работой без копии;
+копия проверяется integrity_check. Затем выгрузка players в JSONL и CSV
+(gzip): строк в секунду и пик памяти. В конце - задача backup_db целиком.
+
+Запуск: python -m benchmarks.bench_backup [игроков]
+"""
+import asyncio
+import gzip
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from backup import BACKUP_PAGES, backup_database, export_table
+from benchmarks._common import import_race, percentile
+from benchmarks.suite import build_population
+
+
+class Writer(threading.Thread):
+    """Поток, который пополняет балансы с коммитом на каждое и замеряет запись"""
+
+    def __init__(self, game, players):
+        super().__init__(daemon=True)
+        self.game = game
+        self.players = players
+        self.latencies = []
+        self.running = True
+
+    def run(self):
+        rng = random.Random(1)
+        while self.running:
+            start = time.perf_counter()
+            self.game.update_balance(rng.randint(1, self.players), 1)
+            self.game.flush_stats()
+            self.latencies.append(time.perf_counter() - start)
+            time.sleep(0.001)
+
+    def window(self, fn):
+        """Запуск fn под нагрузкой: (результат, задержки записей за это время)"""
+        first = len(self.latencies)
+        result = fn()
+        return result, self.latencies[first:]
+
+
+def describe(latencies):
+    if not latencies:
+        # Копия маленькой базы успевает раньше первой записи нагрузки
+        return "записей      0, нет замеров"
+    return (f"записей {len(latencies):6d}, p99 {percentile(latencies, 99) * 1000:6.2f} мс, "
+            f"худшая {max(latencies) * 1000:7.2f} мс")
+
+
+def check_copy(path, players):
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+        assert conn.execute("SELECT COUNT(*) FROM players").fetchone()[0] == players
+    finally:
+        conn.close()
+
+
+def single_step_backup(game, dest):
+    """Копия одним шагом через соединение бота: запись ждет всю копию"""
+    target = sqlite3.connect(dest)
+    with game.db._lock:
+        game.db.conn.backup(target)
+    target.close()
+
+
+def export_with_memory(source, dest, columns, fmt):
+    """Скорость без трассировки, пик памяти - отдельным прогоном под tracemalloc"""
+    report = export_table(source, dest, 'players', columns, fmt)
+    tracemalloc.start()
+    export_table(source, dest, 'players', columns, fmt)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return report, peak
+
+
+def main(players=1000000):
+    workdir = tempfile.mkdtemp(prefix='race_bench_')
+    db_path = os.path.join(workdir, 'racing.db')
+    build_population(db_path, players, seed=1)
+    Race = import_race(db_path)
+    game = Race.game
+    game.open_db()
+    size = os.path.getsize(db_path) / 2 ** 20
+    print(f"база: {players} игроков, {size:.0f} МБ")
+
+    writer = Writer(game, players)
+    writer.start()
+    _, idle = writer.window(lambda: time.sleep(2))
+    print(f"без копии:                {describe(idle)}")
+
+    dest = os.path.join(workdir, 'online.db')
+    report, during = writer.window(lambda: backup_database(db_path, dest, BACKUP_PAGES))
+    check_copy(dest, players)
+    print(f"онлайн-копия по {BACKUP_PAGES} стр.: {describe(during)}; "
+          f"{report['bytes'] / 2 ** 20 / report['seconds']:.0f} МБ/с, шагов {report['steps']}")
+
+    blocking = os.path.join(workdir, 'blocking.db')
+    start = time.perf_counter()
+    _, during = writer.window(lambda: single_step_backup(game, blocking))
+    elapsed = time.perf_counter() - start
+    check_copy(blocking, players)
+    print(f"одним шагом в соединении бота: {describe(during)}; {size / elapsed:.0f} МБ/с")
+    writer.running = False
+    writer.join()
+    print("копии целые (integrity_check), все игроки на месте")
+
+    for fmt in ('jsonl', 'csv'):
+        export = os.path.join(workdir, f"players.{fmt}.gz")
+        report, peak = export_with_memory(dest, export, Race.PLAYER_COLUMNS, fmt)
+        assert report['rows'] == players
+        print(f"выгрузка {fmt:5}: {report['rows'] / report['seconds']:8.0f} строк/с, "
+              f"{report['bytes'] / 2 ** 20:5.1f} МБ, пик памяти Python {peak / 2 ** 20:.1f} МБ")
+    with gzip.open(os.path.join(workdir, 'players.jsonl.gz'), 'rt', encoding='utf-8') as f:
+        assert json.loads(f.readline())['user_id'] == 1
+
+    # Задача job_queue целиком: сброс буферов, копия, замер записи, выгрузка, ротация
+    Race.BACKUP_DIR = os.path.join(workdir, 'backups')
+    Race.EXPORT_FORMAT = 'jsonl'
+    asyncio.run(Race.backup_db(None))
+    assert len(os.listdir(Race.BACKUP_DIR)) == 2
+    Race.game_async.shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,34 @@
+"""get_player с LRU-кэшем и без него на неравномерной нагрузке.
+
+Небольшая доля активных игроков дает большую часть нажатий, как в групповых
+чатах. Запуск: python -m benchmarks.bench_cache [число_запросов]
+"""
+import random
+import sys
+
+from benchmarks._common import import_race, ops_per_sec, temp_db_path
+
+PLAYERS = 20000
+
+
+def main(n=100000):
+    Race = import_race(temp_db_path())
+    path = temp_db_path()
+    seed_game = Race.RacingGame(path, cache_size=0)
+    with seed_game.db.transaction() as conn:
+        conn.executemany("INSERT INTO players (user_id, username) VALUES (?, ?)",
+                         ((user_id, f"player{user_id}") for user_id in range(PLAYERS)))
+
+    rng = random.Random(42)
+    workload = [min(PLAYERS - 1, int(rng.paretovariate(0.4))) * 7 % PLAYERS for _ in range(n)]
+
+    for capacity in (0, 1000, 10000):
+        game = Race.RacingGame(path, cache_size=capacity)
+        rate = ops_per_sec(lambda i: game.get_player(workload[i]), n)
+        stats = game.cache.stats()
+        print(f"емкость {capacity:>6}: {rate:>9.0f} оп/с, попаданий {stats['hit_rate']:.1%}, "
+              f"вытеснений {stats['evictions']}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
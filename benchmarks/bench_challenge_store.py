@@ -0,0 +1,62 @@
+"""Вызовы в SQLite: скорость создания и принятия, однократное принятие из
+нескольких процессов и восстановление после перезапуска.
+
+Запуск: python -m benchmarks.bench_challenge_store [число_вызовов]
+"""
+import multiprocessing
+import sys
+import time
+
+from benchmarks._common import import_race, temp_db_path
+
+PROCESSES = 4
+
+
+def claim_all(path, challenge_ids, results):
+    Race = import_race(path)
+    game = Race.RacingGame(path)
+    results.put(sum(1 for cid in challenge_ids if game.claim_challenge(cid) is not None))
+
+
+def create_many(game, n, chat_id=-100):
+    return [game.open_challenge({'challenger_id': i, 'challenger_name': f"p{i}", 'challenger_car_id': 1,
+                                 'chat_id': chat_id, 'message_id': i}) for i in range(n)]
+
+
+def main(n=5000):
+    path = temp_db_path()
+    Race = import_race(path)
+    game = Race.RacingGame(path)
+
+    start = time.perf_counter()
+    ids = create_many(game, n)
+    create_rate = n / (time.perf_counter() - start)
+    start = time.perf_counter()
+    claimed = sum(1 for cid in ids if game.claim_challenge(cid) is not None)
+    accept_rate = n / (time.perf_counter() - start)
+    print(f"создание: {create_rate:8.0f} вызовов/с, принятие: {accept_rate:8.0f} вызовов/с ({claimed} из {n})")
+
+    # Несколько процессов одновременно принимают одни и те же вызовы
+    ids = create_many(game, n)
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=claim_all, args=(path, ids, results)) for _ in range(PROCESSES)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    total = sum(results.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    print(f"{PROCESSES} процесса приняли {total} из {n} вызовов за {elapsed:.2f} с")
+    assert total == n
+
+    # После "перезапуска" вызов находится в БД и принимается
+    ids = create_many(game, 10)
+    restarted = Race.RacingGame(path)
+    assert restarted.get_challenge(ids[0]) is not None
+    assert restarted.claim_challenge(ids[0]) is not None and game.claim_challenge(ids[0]) is None
+    print("вызовы переживают перезапуск, каждый принимается ровно один раз")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
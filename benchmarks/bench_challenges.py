@@ -0,0 +1,73 @@
+"""Очистка вызовов: полный проход по словарю против кучи сроков.
+
+Вызовы создаются равномерно в течение своего срока жизни, очистка идет раз в
+секунду. Куча платит только за истекшие вызовы, полный проход - за все.
+
+Запуск: python -m benchmarks.bench_challenges [открытых_вызовов]
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+
+from challenges import ChallengeRegistry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def legacy_cleanup(active_challenges, now):
+    expired = [cid for cid, data in active_challenges.items() if (now - data['created_at']).seconds > 1800]
+    for cid in expired:
+        del active_challenges[cid]
+    return expired
+
+
+def main(n=200000):
+    clock = FakeClock()
+    registry = ChallengeRegistry(ttl=1800, max_per_user=n, clock=clock)
+    legacy = {}
+    started = datetime.now()
+    step = 1800 / n
+    for i in range(n):
+        clock.now = i * step
+        data = {'challenger_id': i % 1000, 'chat_id': i % 500, 'created_at': started + timedelta(seconds=i * step)}
+        registry.create(f"c{i}", dict(data))
+        legacy[f"c{i}"] = data
+
+    # Очередная ежесекундная очистка: истекает лишь малая часть вызовов
+    clock.now = 1801
+    start = time.perf_counter()
+    expired = registry.expire()
+    heap_time = time.perf_counter() - start
+    start = time.perf_counter()
+    legacy_expired = legacy_cleanup(legacy, started + timedelta(seconds=clock.now))
+    scan_time = time.perf_counter() - start
+    print(f"{n} открытых вызовов, истекло {len(expired)} (полный проход нашел {len(legacy_expired)})")
+    print(f"полный проход:  {scan_time * 1000:8.2f} мс за очистку")
+    print(f"куча сроков:    {heap_time * 1000:8.2f} мс за очистку")
+
+    # timedelta.seconds обнуляется через сутки: старый код не удалял вызов суточной давности
+    stale = {'old': {'created_at': started}}
+    legacy_cleanup(stale, started + timedelta(days=1, seconds=5))
+    print(f"вызов суточной давности после старой очистки: {'остался' if stale else 'удален'}")
+
+    # Принятие ровно в момент истечения не проходит, даже без очистки
+    clock.now = 0
+    registry = ChallengeRegistry(ttl=10, max_per_user=3, clock=clock)
+    registry.create("late", {'challenger_id': 1, 'chat_id': 1})
+    clock.now = 10
+    assert registry.claim("late") is None
+    registry.create("once", {'challenger_id': 1, 'chat_id': 1})
+    assert registry.claim("once") is not None and registry.claim("once") is None
+    assert all(registry.create(f"x{i}", {'challenger_id': 2, 'chat_id': 1}) for i in range(3))
+    assert not registry.create("x3", {'challenger_id': 2, 'chat_id': 1})
+    print("истечение точно в срок, однократное принятие и лимит на игрока соблюдаются")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,57 @@
+"""Стоимость выбора обработчика на одно нажатие: цепочка if/elif против таблицы
+маршрутов с разбором и проверкой callback_data. Разбор и отклонение
+некорректных данных проверяет tests/test_callbacks.py.
+
+Запуск: python -m benchmarks.bench_dispatch [число_нажатий]
+"""
+import sys
+
+from benchmarks._common import import_race, ops_per_sec, temp_db_path
+
+
+def legacy_resolve(data):
+    """Прежний выбор ветки в handle_callback (без вызова обработчиков)"""
+    if data == "menu_main":
+        return "main"
+    elif data == "menu_profile":
+        return "profile"
+    elif data == "menu_garage":
+        return "garage"
+    elif data == "menu_race":
+        return "race"
+    elif data == "menu_challenge":
+        return "challenge"
+    elif data == "menu_top":
+        return "top"
+    elif data == "menu_refresh":
+        return "refresh"
+    elif data == "create_challenge":
+        return "create_challenge"
+    elif data.startswith('buy_'):
+        return "buy", int(data.split('_')[1])
+    elif data.startswith('accept_'):
+        return "accept", data.replace('accept_', '')
+
+
+def main(n=200000):
+    Race = import_race(temp_db_path())
+    router = Race.router
+    legacy_mix = ["menu_race", "menu_top", "menu_profile", "buy_3", "accept_123456789_1700000000", "menu_main"]
+    new_mix = [router.encode("race"), router.encode("top"), router.encode("profile"),
+               router.encode("buy", 3), router.encode("accept", "123456789_1700000000"), router.encode("main")]
+
+    longest = max(len(router.encode(name, *args).encode()) for name, args in
+                  (("accept", ("9" * 15 + "_" + "9" * 10,)), ("buy", (5,))))
+    print(f"самые длинные callback_data: {longest} байт из 64")
+
+    legacy = ops_per_sec(lambda i: legacy_resolve(legacy_mix[i % 6]), n)
+    decoded_legacy = ops_per_sec(lambda i: router.decode(legacy_mix[i % 6]), n)
+    decoded = ops_per_sec(lambda i: router.decode(new_mix[i % 6]), n)
+    print(f"if/elif без проверок:      {1e9 / legacy:6.0f} нс на нажатие")
+    print(f"таблица, старые кнопки:    {1e9 / decoded_legacy:6.0f} нс на нажатие")
+    print(f"таблица, формат v1:        {1e9 / decoded:6.0f} нс на нажатие")
+    Race.game_async.shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,63 @@
+"""Скорость симуляции гонок: прежняя формула в обработчике, одиночный путь
+RaceEngine и пакетный путь (NumPy, если установлен). Проверяется
+воспроизводимость по seed и совпадение одиночного пути с прежней формулой.
+
+Запуск: python -m benchmarks.bench_engine [гонок]
+"""
+import random
+import sys
+import time
+
+import race_engine
+from benchmarks._common import import_race, ops_per_sec, temp_db_path
+from race_engine import PVE_LUCK, PVP_LUCK, RaceEngine
+
+
+def legacy_powers(car_a, car_b, rng):
+    """Прежний расчет силы из start_race"""
+    power_a = (car_a.speed * 2 + car_a.acceleration * 1.5 + car_a.handling * 1.2 + rng.randint(1, 10))
+    power_b = (car_b.speed * 2 + car_b.acceleration * 1.5 + car_b.handling * 1.2 + rng.randint(1, 10))
+    return power_a, power_b
+
+
+def main(n=1000000):
+    Race = import_race(temp_db_path())
+    cars = Race.game.cars
+    ids = list(cars)
+    specs = [cars[i] for i in ids]
+
+    # Тот же генератор дает те же силы, что и прежняя формула
+    legacy_rng, engine = random.Random(7), RaceEngine(cars, seed=7)
+    assert all(legacy_powers(specs[i % 5], specs[i * 3 % 5], legacy_rng) ==
+               engine.race(specs[i % 5], specs[i * 3 % 5]) for i in range(1000))
+    # Воспроизводимость: одинаковый seed - одинаковые исходы
+    pairs_a = [ids[i % 5] for i in range(10000)]
+    pairs_b = [ids[i * 7 % 5] for i in range(10000)]
+    first = RaceEngine(cars, seed=42).race_batch(pairs_a, pairs_b, PVP_LUCK)
+    second = RaceEngine(cars, seed=42).race_batch(pairs_a, pairs_b, PVP_LUCK)
+    assert list(first) == list(second)
+    print("одиночный путь совпадает с прежней формулой, исходы повторяются по seed")
+
+    scalar_n = n // 10
+    rng = random.Random(1)
+    legacy = ops_per_sec(lambda i: legacy_powers(specs[i % 5], specs[(i + 2) % 5], rng), scalar_n)
+    engine = RaceEngine(cars, seed=1)
+    scalar = ops_per_sec(lambda i: engine.race(specs[i % 5], specs[(i + 2) % 5], PVE_LUCK), scalar_n)
+    cars_a = [ids[i % 5] for i in range(n)]
+    cars_b = [ids[(i + 2) % 5] for i in range(n)]
+    start = time.perf_counter()
+    engine.race_batch(cars_a, cars_b, PVE_LUCK)
+    batched = n / (time.perf_counter() - start)
+    backend = "NumPy" if race_engine.np is not None else "без NumPy, цикл на random"
+    print(f"прежняя формула:        {legacy:12.0f} гонок/с")
+    print(f"RaceEngine.race:        {scalar:12.0f} гонок/с")
+    print(f"RaceEngine.race_batch:  {batched:12.0f} гонок/с ({backend})")
+
+    win, draw, loss = engine.estimate(ids[2], ids[1], PVE_LUCK, trials=200000, seed=3)
+    print(f"{cars[ids[2]].name} против {cars[ids[1]].name}: "
+          f"победа {win:.3f}, ничья {draw:.3f}, поражение {loss:.3f}")
+    Race.game_async.shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,85 @@
+"""Топ игроков на синтетической таблице: сортировка выражения, индекс по score
+и топ-K в памяти, плюс поиск места игрока.
+
+Запуск: python -m benchmarks.bench_leaderboard [число_игроков]
+"""
+import random
+import sys
+import time
+
+from benchmarks._common import import_race, temp_db_path
+from leaderboard import score_of
+
+LEGACY_TOP = '''SELECT username, level, wins, races, pvp_wins, pvp_races, balance
+                FROM players ORDER BY (wins + pvp_wins * 2) DESC, level DESC LIMIT 10'''
+
+
+def populate(game, players, seed=7):
+    rng = random.Random(seed)
+
+    def rows():
+        for user_id in range(players):
+            races = rng.randint(0, 300)
+            wins = rng.randint(0, races)
+            pvp_races = rng.randint(0, 50)
+            pvp_wins = rng.randint(0, pvp_races)
+            experience = wins * 25 + races * 10
+            yield (user_id, f"player{user_id}", rng.randint(0, 200000), rng.randint(1, 5),
+                   experience, experience // 100 + 1, wins, races, pvp_wins, pvp_races)
+
+    with game.db.transaction() as conn:
+        conn.executemany('''INSERT INTO players (user_id, username, balance, car_id, experience, level,
+                                                 wins, races, pvp_wins, pvp_races)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows())
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main(players=1_000_000):
+    path = temp_db_path()
+    Race = import_race(path)
+    game = Race.RacingGame(path, stats_flush_races=100)
+    start = time.perf_counter()
+    populate(game, players)
+    print(f"{players} игроков создано за {time.perf_counter() - start:.1f} с")
+
+    legacy, _ = timed(lambda: game.db.fetchall(LEGACY_TOP), 3)
+    indexed, _ = timed(lambda: game.db.fetchall(
+        f"SELECT {Race.PLAYER_COLUMNS} FROM players ORDER BY score DESC, level DESC LIMIT 10"), 100)
+    load, _ = timed(game._ensure_leaderboard, 1)
+    memory, _ = timed(lambda: game.get_top(10), 10000)
+    print(f"ORDER BY выражения:   {legacy * 1000:9.3f} мс")
+    print(f"индекс (score, level): {indexed * 1000:9.3f} мс")
+    print(f"загрузка топа в память: {load * 1000:8.1f} мс (один раз)")
+    print(f"топ-K в памяти:        {memory * 1000:9.4f} мс")
+
+    rng = random.Random(11)
+    for _ in range(20000):
+        user_id = rng.randrange(players)
+        game.update_stats_after_race(user_id, 500, 25, rng.random() < 0.6, rng.random() < 0.3)
+    game.flush_stats()
+    game.compact_ledger()
+    expected = game.db.fetchall(LEGACY_TOP)
+    actual = game.get_top(10)
+    sql_scores = [(r[2] + r[4] * 2, r[1]) for r in expected]
+    mem_scores = [(score_of(r), r.level) for r in actual]
+    assert sql_scores == mem_scores, (sql_scores, mem_scores)
+
+    sample = [rng.randrange(players) for _ in range(200)]
+    sql_rank = lambda user_id: game.db.fetchone(
+        "SELECT COUNT(*) + 1 FROM players WHERE score > (SELECT score FROM players WHERE user_id = ?)", (user_id,))[0]
+    sql_time, _ = timed(lambda: [sql_rank(u) for u in sample], 1)
+    mem_time, _ = timed(lambda: [game.get_rank(u) for u in sample], 1)
+    assert [sql_rank(u) for u in sample] == [game.get_rank(u) for u in sample]
+    print(f"место игрока SQL COUNT: {sql_time / len(sample) * 1000:8.3f} мс")
+    print(f"место игрока в памяти:  {mem_time / len(sample) * 1000:8.4f} мс")
+    print("топ и места совпадают с SQL после 20000 гонок")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,220 @@
+"""Журнал экономики против прямых UPDATE players.
+
+Одна и та же последовательность операций (гонки и PvP, начисления,
+покупки; 80% операций приходится на 1% горячих игроков) прогоняется
+четырьмя способами на одинаковых базах:
+  - прежний UPDATE ... RETURNING на каждую операцию;
+  - прежняя отложенная запись: гонки пачкой UPDATE через executemany,
+    начисления и покупки - сразу;
+  - журнал с коммитом на каждую операцию (STATS_FLUSH_RACES=1);
+  - журнал пачками (по умолчанию).
+Отчет: операций в секунду, коммиты и байты в WAL на операцию. Затем
+свертка журнала (записей/с и самая долгая транзакция) и чтение игрока
+с балансом: из кэша, из БД с несвернутыми записями и после свертки.
+Итоговые players во всех четырех базах должны совпасть.
+
+Запуск: python -m benchmarks.bench_ledger [игроков] [операций]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks._common import import_race, ops_per_sec
+from benchmarks.suite import build_population
+from cache import PlayerCache
+from records import player_row
+
+HOT_SHARE = 0.01
+BATCH = 100
+
+
+def make_schedule(players, n, cars, seed=5):
+    """(вид, user_id, аргументы): 85% гонок, 10% начислений, 5% покупок"""
+    rng = random.Random(seed)
+    hot = max(1, int(players * HOT_SHARE))
+    schedule = []
+    for _ in range(n):
+        user_id = rng.randint(1, hot) if rng.random() < 0.8 else rng.randint(1, players)
+        kind = rng.random()
+        if kind < 0.85:
+            is_win, is_pvp = rng.random() < 0.5, rng.random() < 0.3
+            schedule.append(('race', user_id, (500 if is_win else 100, 25 if is_win else 10, is_win, is_pvp)))
+        elif kind < 0.95:
+            schedule.append(('adjust', user_id, (rng.randint(100, 1000),)))
+        else:
+            car_id = rng.choice(cars)
+            schedule.append(('buy', user_id, (car_id,)))
+    return schedule
+
+
+class Legacy:
+    """Прежние запросы: баланс и статистика меняются на месте.
+
+    Как и прежний _buffer_stats, отложенная гонка читает игрока (кэш или
+    SELECT с наложением буфера), чтобы сообщить о новом уровне.
+    """
+
+    def __init__(self, Race, game, batch):
+        self.sql = f"SELECT {Race.PLAYER_COLUMNS} FROM players WHERE user_id = ?"
+        self.apply = Race.RacingGame._apply_delta
+        self.db = game.db
+        self.cars = game.cars
+        self.cache = PlayerCache(game.cache.capacity)
+        self.batch = batch
+        self.pending = {}
+        self.count = 0
+
+    def player(self, user_id):
+        record = self.cache.get(user_id)
+        if record is None:
+            record = self.db.fetchone(self.sql, (user_id,), factory=player_row)
+            if user_id in self.pending:
+                self.apply(record, self.pending[user_id])
+            self.cache.put(user_id, record)
+        return record
+
+    def adjust(self, user_id, amount):
+        if self.db.fetchone_commit("UPDATE players SET balance = balance + ? WHERE user_id = ? RETURNING balance",
+                                   (amount, user_id)):
+            record = self.cache.peek(user_id)
+            if record is not None:
+                record.balance += amount
+
+    def buy(self, user_id, car_id):
+        if user_id in self.pending:
+            self.flush()
+        price = self.cars[car_id].price
+        result = self.db.fetchone_commit('''UPDATE players SET balance = balance - ?, car_id = ?
+                                            WHERE user_id = ? AND balance >= ? RETURNING balance''',
+                                         (price, car_id, user_id, price))
+        record = self.cache.peek(user_id)
+        if result and record is not None:
+            record.balance, record.car_id = result[0], car_id
+        return result is not None
+
+    def race(self, user_id, earnings, exp_gain, is_win, is_pvp):
+        delta = [earnings, exp_gain, 0 if is_pvp else 1, int(is_win and not is_pvp), int(is_pvp),
+                 int(is_win and is_pvp)]
+        if self.batch <= 1:
+            self.db.fetchone_commit('''UPDATE players SET balance = balance + ?, experience = experience + ?,
+                                           races = races + ?, wins = wins + ?, pvp_races = pvp_races + ?,
+                                           pvp_wins = pvp_wins + ?, level = MAX(level, (experience + ?) / 100 + 1)
+                                       WHERE user_id = ? RETURNING level''', (*delta, exp_gain, user_id))
+            return
+        record = self.player(user_id)
+        level = record.level
+        self.apply(record, delta)
+        current = self.pending.setdefault(user_id, [0] * 6)
+        for i, value in enumerate(delta):
+            current[i] += value
+        self.count += 1
+        if self.count >= self.batch:
+            self.flush()
+        return record.level > level
+
+    def flush(self):
+        pending, self.pending, self.count = self.pending, {}, 0
+        with self.db.transaction() as c:
+            c.executemany('''UPDATE players SET balance = balance + ?, experience = experience + ?,
+                                 races = races + ?, wins = wins + ?, pvp_races = pvp_races + ?,
+                                 pvp_wins = pvp_wins + ?, level = MAX(level, (experience + ?) / 100 + 1)
+                             WHERE user_id = ?''', [(*d, d[1], user_id) for user_id, d in pending.items()])
+
+
+def run(schedule, race, adjust, buy, flush):
+    bought = 0
+    start = time.perf_counter()
+    for kind, user_id, args in schedule:
+        if kind == 'race':
+            race(user_id, *args)
+        elif kind == 'adjust':
+            adjust(user_id, *args)
+        else:
+            bought += bool(buy(user_id, *args))
+    flush()
+    return len(schedule) / (time.perf_counter() - start), bought
+
+
+def measured(game, fn):
+    """fn под счетчиком коммитов и с WAL без автосброса: (результат, коммитов, байт WAL)"""
+    conn = game.db.conn
+    conn.execute("PRAGMA wal_autocheckpoint=0")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    commits = []
+    conn.set_trace_callback(lambda sql: sql == 'COMMIT' and commits.append(sql))
+    result = fn()
+    conn.set_trace_callback(None)
+    wal = os.path.getsize(game.db.path + '-wal')
+    conn.execute("PRAGMA wal_autocheckpoint=1000")
+    return result, len(commits), wal
+
+
+def main(players=200000, n=20000):
+    workdir = tempfile.mkdtemp(prefix='race_bench_')
+    paths = [os.path.join(workdir, f"{name}.db") for name in ('legacy1', 'legacy', 'ledger1', 'ledger')]
+    for path in paths:
+        build_population(path, players, seed=1)
+    Race = import_race(paths[0])
+    schedule = make_schedule(players, n, [car_id for car_id in Race.game.cars if car_id > 1])
+    print(f"{players} игроков, {n} операций (гонок {sum(k == 'race' for k, _, _ in schedule)}, "
+          f"начислений {sum(k == 'adjust' for k, _, _ in schedule)}, покупок {sum(k == 'buy' for k, _, _ in schedule)})")
+
+    games = []
+    for label, path, batch, ledger in (("UPDATE на операцию", paths[0], 1, False),
+                                       (f"UPDATE, гонки пачками по {BATCH}", paths[1], BATCH, False),
+                                       ("журнал, коммит на операцию", paths[2], 1, True),
+                                       (f"журнал пачками по {BATCH}", paths[3], BATCH, True)):
+        game = Race.RacingGame(path, stats_flush_races=batch)
+        game.open_db()
+        if ledger:
+            ops = (game.update_stats_after_race, game.update_balance, game.buy_car, game.flush_stats)
+        else:
+            legacy = Legacy(Race, game, batch)
+            ops = (legacy.race, legacy.adjust, legacy.buy, legacy.flush)
+        (rate, bought), commits, wal = measured(game, lambda: run(schedule, *ops))
+        print(f"{label:30} {rate:8.0f} оп/с, коммитов {commits:6d}, WAL {wal / n / 1024:6.2f} КБ/оп, "
+              f"покупок {bought}")
+        games.append(game)
+
+    # Баланс и статистика игрока до свертки: из кэша и из БД с несвернутыми записями
+    game = games[3]
+    hot = [user_id for _, user_id, _ in schedule[:2000]]
+    cached = ops_per_sec(lambda i: game.get_player(hot[i % len(hot)]).balance, 200000)
+    game.cache = PlayerCache(0)
+    before = [game.get_player(user_id).astuple() for user_id in hot]
+    pending = game.db.fetchone("SELECT COUNT(*) FROM ledger")[0]
+    unfolded = ops_per_sec(lambda i: game.get_player(hot[i % len(hot)]).balance, 20000)
+
+    for game in games[2:]:
+        start = time.perf_counter()
+        batches = []
+        original = game.ledger.compact_step
+
+        def timed_batch():
+            batch_start = time.perf_counter()
+            result = original()
+            batches.append(time.perf_counter() - batch_start)
+            return result
+
+        game.ledger.compact_step = timed_batch
+        entries, updated, _ = game.compact_ledger()
+        elapsed = time.perf_counter() - start
+        print(f"свертка: {entries} записей в {updated} игроков за {elapsed * 1000:.0f} мс "
+              f"({entries / elapsed:.0f} записей/с), самая долгая транзакция {max(batches) * 1000:.1f} мс")
+
+    game = games[3]
+    folded = ops_per_sec(lambda i: game.get_player(hot[i % len(hot)]).balance, 20000)
+    assert [game.get_player(user_id).astuple() for user_id in hot] == before
+    print(f"чтение баланса: из кэша {cached:9.0f}/с, из БД при {pending} несвернутых записях {unfolded:7.0f}/с, "
+          f"после свертки {folded:7.0f}/с")
+
+    tables = [game.db.fetchall(f"SELECT {Race.PLAYER_COLUMNS} FROM players ORDER BY user_id") for game in games]
+    assert all(table == tables[0] for table in tables[1:])
+    print("итоговые players совпадают во всех четырех базах")
+    Race.game_async.shutdown()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,63 @@
+"""Таблицы шансов: построение, сверка с Монте-Карло, стоимость выбора
+соперника на гонку и доля побед игрока по уровням.
+
+Запуск: python -m benchmarks.bench_matchups [гонок]
+"""
+import random
+import sys
+import time
+
+from benchmarks._common import import_race, ops_per_sec, temp_db_path
+from matchups import Matchmaker, target_win_rate
+from race_engine import PVE_LUCK, PVP_LUCK, RaceEngine
+
+
+def main(n=200000):
+    Race = import_race(temp_db_path())
+    cars = Race.game.cars
+    engine = RaceEngine(cars, seed=5)
+
+    for luck in (PVE_LUCK, PVP_LUCK):
+        start = time.perf_counter()
+        table = engine.odds(luck)
+        built = (time.perf_counter() - start) * 1000
+        assert engine.odds(luck) is table
+        worst = 0.0
+        for car_a in table.car_ids:
+            for car_b in table.car_ids:
+                win, draw, loss = table.get(car_a, car_b)
+                assert abs(win + draw + loss - 1) < 1e-12 and table.get(car_b, car_a)[2] == win
+                estimate = engine.estimate(car_a, car_b, luck, trials=20000)
+                worst = max(worst, max(abs(e - x) for e, x in zip(estimate, (win, draw, loss))))
+        print(f"randint(1, {luck}): таблица {len(table.car_ids)}x{len(table.car_ids)} за {built:.2f} мс, "
+              f"расхождение с Монте-Карло не больше {worst:.3f}")
+    # Новая таблица - только после изменения каталога
+    table = engine.odds(PVE_LUCK)
+    engine.load(cars)
+    assert engine.odds(PVE_LUCK) is not table
+
+    rng = random.Random(1)
+    legacy = ops_per_sec(lambda i: rng.choice(list(cars.values())), n)
+    matchmaker = Matchmaker(engine, PVE_LUCK)
+    odds = engine.odds(PVE_LUCK)
+
+    def pick(i):
+        rival = matchmaker.pick(3, i % 20 + 1)
+        return odds.get(3, rival)
+
+    picked = ops_per_sec(pick, n)
+    print(f"random.choice(list(...)):      {1e9 / legacy:6.0f} нс на гонку")
+    print(f"выбор по уровню + шансы:       {1e9 / picked:6.0f} нс на гонку")
+
+    for level in (1, 5, 12):
+        wins = 0
+        for _ in range(n // 10):
+            rival = matchmaker.pick(3, level)
+            mine, theirs = engine.race(cars[3], cars[rival], PVE_LUCK)
+            wins += mine > theirs
+        print(f"уровень {level:2}: побед {wins / (n // 10):.2f} (цель {target_win_rate(level):.2f})")
+    Race.game_async.shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
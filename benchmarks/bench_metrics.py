@@ -0,0 +1,103 @@
+"""Стоимость инструментирования: замер сам по себе, нажатия "Гонка" и
+"Профиль" с метриками и без, выгрузка /metrics и команда /stats.
+
+Запуск: python -m benchmarks.bench_metrics [нажатий]
+"""
+import asyncio
+import sys
+import time
+
+from benchmarks._common import FakeChat, FakeMessage, FakeUpdate, FakeUser, callback_update, disable_rate_limit, \
+    import_race, ops_per_sec, temp_db_path
+from metrics import Metrics
+from storage import AsyncFacade
+
+USERS = 100
+
+
+class NoMetrics:
+    async def timed(self, family, label, awaitable):
+        return await awaitable
+
+    def inc(self, name, value=1):
+        pass
+
+
+class StatsMessage(FakeMessage):
+    def __init__(self, chat):
+        super().__init__(chat)
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return self
+
+
+async def presses(Race, n):
+    start = time.perf_counter()
+    for i in range(n):
+        user_id = i % USERS + 1
+        await Race.handle_callback(callback_update(user_id, Race.cb("race" if i % 2 else "profile"),
+                                                   message_id=i), None)
+    return (time.perf_counter() - start) / n
+
+
+async def scrape(Race):
+    server = await Race.metrics.serve('127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    response = await reader.read()
+    writer.close()
+    server.close()
+    return response.decode()
+
+
+async def admin_stats(Race, user_id):
+    message = StatsMessage(FakeChat(user_id))
+    await Race.show_stats(FakeUpdate(message=message, user=FakeUser(user_id)), None)
+    return message.replies
+
+
+def main(n=20000):
+    Race = import_race(temp_db_path())
+    disable_rate_limit(Race)
+    for user_id in range(1, USERS + 1):
+        Race.game.register_player(user_id, f"player{user_id}")
+
+    metrics = Metrics()
+    observe = ops_per_sec(lambda i: metrics.observe('callback', 'race', i * 1e-6), n * 10)
+    print(f"один замер:                {1e9 / observe:7.0f} нс")
+
+    instrumented = Race.metrics, Race.game_async
+    timings = {}
+    for label in ("без метрик", "с метриками"):
+        if label == "без метрик":
+            Race.metrics, Race.game_async = NoMetrics(), AsyncFacade(Race.game)
+            Race.editor.metrics = None
+        else:
+            Race.metrics, Race.game_async = instrumented
+            Race.editor.metrics = Race.metrics
+        asyncio.run(presses(Race, n // 10))
+        timings[label] = asyncio.run(presses(Race, n))
+        print(f"нажатие {label + ':':18} {timings[label] * 1e6:7.1f} мкс")
+    overhead = timings["с метриками"] / timings["без метрик"] - 1
+    print(f"накладные расходы:         {overhead:+7.1%}")
+
+    text = asyncio.run(scrape(Race))
+    assert text.startswith("HTTP/1.1 200") and 'racing_callback_seconds_count{callback="race"}' in text
+    assert 'racing_db_seconds_count{db="update_stats_after_race"}' in text
+    print(f"/metrics: {len(text.splitlines())} строк")
+
+    Race.ADMIN_ID = '1'
+    assert asyncio.run(admin_stats(Race, 2)) == []
+    replies = asyncio.run(admin_stats(Race, 1))
+    assert replies and "race" in replies[0]
+    print("/stats для ADMIN_ID:")
+    print(replies[0])
+    Race.game_async.shutdown()
+    instrumented[1].shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
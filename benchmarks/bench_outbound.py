@@ -0,0 +1,59 @@
+"""Очередь исходящих вызовов против прямых правок через поддельный Bot,
+который держит лимиты Telegram (30 вызовов/с, в чат 1/с с запасом 3) и
+отвечает RetryAfter на превышение, а также на случайную долю вызовов.
+
+Настоящие обработчики "Гонки": сколько вызовов API сэкономило схлопывание,
+сколько правок потеряно на флуд-контроле, задержка до результата.
+Инварианты очереди проверяет tests/test_outbound.py.
+Запуск: python -m benchmarks.bench_outbound [игроков] [гонок_на_игрока]
+"""
+import asyncio
+import sys
+
+from benchmarks._common import FakeChat, FakeMessage, FakeUser, import_race, percentile, temp_db_path
+from ratelimit import CallbackLimiter
+from render import MessageEditor
+from tests.helpers import PRESS_INTERVAL, BotQuery, FakeBot, load
+
+
+def coalescing(scheduler):
+    """10 правок одного сообщения подряд: сколько вызовов API ушло"""
+    bot = FakeBot(random_flood=0)
+    query = BotQuery(bot, FakeUser(1), FakeMessage(FakeChat(1), 1), '')
+
+    async def burst():
+        for i in range(9):
+            await scheduler.edit(query, f"кадр {i}", wait=False)
+        return await scheduler.edit(query, "итог")
+
+    asyncio.run(burst())
+    print(f"10 правок одного сообщения: вызовов API {bot.calls['editMessageText']}")
+
+
+def main(players=50, races=4):
+    Race = import_race(temp_db_path())
+    Race.limiter = CallbackLimiter(1e9, 10 ** 9, 1e9, 10 ** 9)
+    for user_id in range(1, players + 1):
+        Race.game.register_player(user_id, f"player{user_id}")
+    coalescing(Race.editor)
+
+    scheduler = Race.editor
+    print(f"{players} игроков, {races} гонок каждый (нажатие раз в {PRESS_INTERVAL * 1000:.0f} мс на всех)")
+    for label, editor in (("прямые правки", MessageEditor()), ("очередь", scheduler)):
+        Race.editor = editor
+        bot = FakeBot()
+        elapsed, latencies, lost = asyncio.run(load(Race, bot, players, races))
+        n = players * races
+        print(f"{label:14} вызовов {bot.calls['editMessageText']:5} ({bot.calls['editMessageText'] / n:.2f} на гонку), "
+              f"RetryAfter {bot.flooded:4}, без результата {len(lost):4}, "
+              f"до результата p50 {percentile(latencies, 50):7.1f} мс p99 {percentile(latencies, 99):7.1f} мс, "
+              f"всего {elapsed:.1f} с")
+        if editor is scheduler:
+            print("метрики очереди:", ", ".join(f"{name}={value:.1f}" if isinstance(value, float)
+                                                else f"{name}={value}" for name, value in scheduler.stats().items()))
+    Race.game_async.shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 4)
@@ -0,0 +1,55 @@
+"""Спам кнопками: сколько нажатий отсекает ограничитель и сколько схлопывается.
+
+Запуск: python -m benchmarks.bench_ratelimit [нажатий_в_секунду]
+"""
+import asyncio
+import sys
+
+from benchmarks._common import callback_update, import_race, ops_per_sec, temp_db_path
+from ratelimit import CallbackLimiter
+
+SECONDS = 10
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def main(presses_per_sec=10):
+    Race = import_race(temp_db_path())
+    Race.game.register_player(1, "spammer")
+    clock = FakeClock()
+    Race.limiter = CallbackLimiter(Race.RATE_USER_PER_SEC, Race.RATE_USER_BURST,
+                                   Race.RATE_CHAT_PER_SEC, Race.RATE_CHAT_BURST, clock=clock)
+    races_before = Race.game.get_player(1).races
+
+    async def spam():
+        # Нажатия идут с постоянной частотой по имитируемым часам
+        for i in range(presses_per_sec * SECONDS):
+            clock.now = i / presses_per_sec
+            await Race.handle_callback(callback_update(1, "menu_race", message_id=i), None)
+
+    async def burst():
+        # Двадцать одновременных нажатий одной кнопки одного сообщения
+        clock.now += 100
+        updates = [callback_update(2, "menu_top", message_id=7, network_delay=0.01) for _ in range(20)]
+        await asyncio.gather(*(Race.handle_callback(update, None) for update in updates))
+
+    asyncio.run(spam())
+    races = Race.game.get_player(1).races - races_before
+    print(f"{presses_per_sec * SECONDS} нажатий \"Еще гонку\" за {SECONDS} с: гонок проведено {races}")
+    asyncio.run(burst())
+    print(f"счетчики: {Race.limiter.stats()}")
+
+    limiter = CallbackLimiter()
+    rate = ops_per_sec(lambda i: limiter.allow(i % 5000, i % 300), 200000)
+    print(f"стоимость проверки: {1e9 / rate:.0f} нс на нажатие")
+    Race.game_async.shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
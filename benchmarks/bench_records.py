@@ -0,0 +1,68 @@
+"""Запись игрока Player (__slots__, row_factory) против прежних списков и
+кортежей по позициям: память на игрока в кэше, разбор строк из SQLite и
+выдача игрока из кэша (запись без копии против прежнего tuple(list)).
+Инварианты записи проверяет tests/test_records.py.
+
+Запуск: python -m benchmarks.bench_records [игроков]
+"""
+import sys
+import time
+
+from benchmarks._common import import_race, ops_per_sec, temp_db_path
+from cache import PlayerCache
+from records import player_row
+from tests.helpers import cache_bytes
+
+
+def decode_rate(rows_fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = rows_fn()
+        best = min(best, time.perf_counter() - start)
+    return len(rows) / best, rows
+
+
+def main(players=200000):
+    Race = import_race(temp_db_path())
+    game = Race.game
+    with game.db.transaction() as conn:
+        conn.executemany("INSERT INTO players (user_id, username, balance, car_id, experience, level, wins, races, "
+                         "pvp_wins, pvp_races) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         ((i, f"player{i}", 1000 + i, 1 + i % 5, i % 5000, 1 + i % 50, i % 300, i % 900, i % 40,
+                           i % 120) for i in range(1, players + 1)))
+    sql = f"SELECT {Race.PLAYER_COLUMNS} FROM players"
+
+    # Разбор всей таблицы: кортежи sqlite3 и списки, как хранил кэш, против Player
+    tuples, _ = decode_rate(lambda: game.db.fetchall(sql))
+    lists, legacy = decode_rate(lambda: [list(row) for row in game.db.fetchall(sql)])
+    records_rate, records = decode_rate(lambda: game.db.fetchall(sql, factory=player_row))
+    print(f"разбор {players} строк: кортежи {tuples:10.0f}/с, списки {lists:10.0f}/с, Player {records_rate:10.0f}/с")
+
+    del legacy, records
+    legacy_size, legacy_cache = cache_bytes(lambda: [list(row) for row in game.db.fetchall(sql)])
+    record_size, record_cache = cache_bytes(lambda: game.db.fetchall(sql, factory=player_row))
+    print(f"память кэша на игрока: список {legacy_size:5.0f} байт, Player {record_size:5.0f} байт "
+          f"({1 - record_size / legacy_size:.0%} меньше)")
+    print(f"сама запись: список {sys.getsizeof(legacy_cache.peek(1))} байт, "
+          f"Player {sys.getsizeof(record_cache.peek(1))} байт")
+
+    # Выдача из кэша: прежде копия tuple(list) на каждый запрос, теперь сама запись
+    n = 500000
+    legacy_get = ops_per_sec(lambda i: tuple(legacy_cache.get(1 + i % players)), n)
+    record_get = ops_per_sec(lambda i: record_cache.get(1 + i % players), n)
+    print(f"игрок из кэша: tuple(list) {legacy_get:10.0f}/с, Player {record_get:10.0f}/с")
+
+    # get_player целиком: промах (чтение из БД) и попадание
+    game.cache = PlayerCache(0)
+    miss = ops_per_sec(lambda i: game.get_player(1 + i % players), 100000)
+    game.cache = PlayerCache(players)
+    for user_id in range(1, players + 1):
+        game.get_player(user_id)
+    hit = ops_per_sec(lambda i: game.get_player(1 + i % players), n)
+    print(f"get_player: из БД {miss:10.0f}/с, из кэша {hit:10.0f}/с")
+    Race.game_async.shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,46 @@
+"""Кэш отрисовки: сборка клавиатуры гаража и текста топа, пропуск холостых правок.
+
+Запуск: python -m benchmarks.bench_render [число_нажатий]
+"""
+import asyncio
+import sys
+
+from benchmarks._common import callback_update, disable_rate_limit, import_race, ops_per_sec, temp_db_path
+from render import build_garage_markup
+
+PLAYERS = 50
+
+
+def main(n=20000):
+    Race = import_race(temp_db_path())
+    disable_rate_limit(Race)
+    game = Race.game
+    for user_id in range(PLAYERS):
+        game.register_player(user_id, f"player{user_id}")
+        game.update_balance(user_id, user_id * 3000)
+
+    balances = [1000 + user_id * 3000 for user_id in range(PLAYERS)]
+    built = ops_per_sec(lambda i: build_garage_markup(game.cars, 1 + i % 5, balances[i % PLAYERS], Race.cb), n)
+    cached = ops_per_sec(lambda i: Race.render_cache.garage_markup(game.cars, 1 + i % 5, balances[i % PLAYERS]), n)
+    leaders = game.get_top(10)
+    formatted = ops_per_sec(lambda i: Race.format_top(leaders), n)
+    version = game.leaderboard.version
+    Race.render_cache.store_top_text(version, Race.format_top(leaders))
+    top_cached = ops_per_sec(lambda i: Race.render_cache.top_text(version), n)
+    print(f"клавиатура гаража: сборка {built:>10.0f}/с, из кэша {cached:>10.0f}/с")
+    print(f"текст топа:        сборка {formatted:>10.0f}/с, из кэша {top_cached:>10.0f}/с")
+
+    async def presses():
+        # Один игрок жмет "Обновить" в топе и профиле одного и того же сообщения
+        for i in range(200):
+            data = "menu_top" if i % 2 else "menu_profile"
+            await Race.handle_callback(callback_update(1, data, message_id=1 + i % 2), None)
+
+    asyncio.run(presses())
+    editor = Race.editor
+    print(f"правки сообщений: отправлено {editor.sent}, пропущено без изменений {editor.skipped}")
+    Race.game_async.shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
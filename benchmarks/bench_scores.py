@@ -0,0 +1,119 @@
+"""Прием счетов аркады через настоящий обработчик web_app_data: всплеск,
+когда группа игроков заканчивает одновременно, с повторными доставками
+обновлений. Пакетная запись против коммита на каждый
+счет; проверка, что рекорды, число игр и награды записаны точно.
+
+Запуск: python -m benchmarks.bench_scores [игроков] [игр_на_игрока]
+"""
+import asyncio
+import json
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from benchmarks._common import FakeChat, FakeMessage, FakeUser, disable_rate_limit, import_race, ops_per_sec, \
+    temp_db_path
+from scores import parse_score, score_reward
+
+
+class WebAppMessage(FakeMessage):
+    def __init__(self, chat, message_id, data):
+        super().__init__(chat, message_id)
+        self.web_app_data = SimpleNamespace(data=data)
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return self
+
+
+class WebAppUpdate:
+    def __init__(self, user_id, message_id, data):
+        self.effective_user = FakeUser(user_id)
+        self.effective_message = self.message = WebAppMessage(FakeChat(user_id), message_id, data)
+
+
+def payload(score):
+    return json.dumps({'action': 'game_score', 'score': score, 'game': 'racer'})
+
+
+def make_burst(first_user, players, games, rng):
+    """Обновления всплеска и ожидаемые итоги по принятым счетам"""
+    updates, expected = [], {}
+    message_id = 0
+    for user_id in range(first_user, first_user + players):
+        for _ in range(games):
+            message_id += 1
+            score = rng.randrange(0, 3000, 10)
+            updates.append(WebAppUpdate(user_id, message_id, payload(score)))
+            best, plays, credits = expected.get(user_id, (0, 0, 0))
+            expected[user_id] = (max(best, score), plays + 1, credits + score_reward(score)[0])
+            if rng.random() < 0.2:
+                # Повторная доставка того же сообщения
+                updates.append(WebAppUpdate(user_id, message_id, payload(score)))
+    rng.shuffle(updates)
+    return updates, expected
+
+
+async def burst(Race, updates):
+    start = time.perf_counter()
+    await asyncio.gather(*(Race.handle_web_app_data(update, None) for update in updates))
+    return time.perf_counter() - start
+
+
+def main(players=1000, games=3):
+    Race = import_race(temp_db_path())
+    disable_rate_limit(Race)
+    # Здесь мерится прием и запись; проверку повтором игры - bench_arcade
+    Race.ARCADE_VERIFY = False
+    game = Race.game
+    rng = random.Random(7)
+
+    data = payload(1230)
+    parsed = ops_per_sec(lambda i: parse_score(data), 100000)
+    for bad in ('{}', 'not json', payload(15), payload(-10), payload(10 ** 6), '{"action": "game_score", "score": true, '
+                '"game": "racer"}', json.dumps({'action': 'game_score', 'score': 10, 'game': 'chess'}), 'x' * 5000):
+        try:
+            parse_score(bad)
+        except ValueError:
+            continue
+        raise AssertionError(bad)
+    print(f"разбор и проверка: {parsed:9.0f}/с; некорректные данные отклоняются")
+    print(f"всплеск: {players} игроков по {games} игр, 20% повторных доставок")
+
+    for label, flush_size, first_user in (("коммит на счет", 1, 1), ("пакетами", Race.SCORE_FLUSH_SIZE, 10 ** 6)):
+        game.scores.max_pending = flush_size
+        for user_id in range(first_user, first_user + players):
+            game.register_player(user_id, f"player{user_id}")
+        game.flush_scores()
+        game.compact_ledger()
+        balance_before = game.db.fetchone("SELECT SUM(balance) FROM players WHERE user_id >= ? AND user_id < ?",
+                                          (first_user, first_user + players))[0]
+        updates, expected = make_burst(first_user, players, games, rng)
+        duplicates_before = game.scores.duplicates
+        commits = []
+        game.db.conn.set_trace_callback(lambda sql: sql == 'COMMIT' and commits.append(sql))
+        elapsed = asyncio.run(burst(Race, updates))
+        game.flush_scores()
+        game.db.conn.set_trace_callback(None)
+        game.compact_ledger()
+
+        rows = {user_id: (best, plays) for user_id, best, plays in game.db.fetchall(
+            "SELECT user_id, best_score, plays FROM game_scores WHERE user_id >= ? AND user_id < ?",
+            (first_user, first_user + players))}
+        assert rows == {user_id: (best, plays) for user_id, (best, plays, _) in expected.items()}
+        balance_after = game.db.fetchone("SELECT SUM(balance) FROM players WHERE user_id >= ? AND user_id < ?",
+                                         (first_user, first_user + players))[0]
+        assert balance_after - balance_before == sum(credits for _, _, credits in expected.values())
+        accepted = sum(plays for _, plays, _ in expected.values())
+        assert game.scores.duplicates - duplicates_before == len(updates) - accepted
+        print(f"{label:15} {len(updates) / elapsed:8.0f} отправок/с, принято {accepted}, "
+              f"отсечено повторов {len(updates) - accepted}, коммитов {len(commits)}")
+    print("рекорды, число игр и награды записаны точно")
+    Race.game_async.shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 3)
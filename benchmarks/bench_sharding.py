@@ -0,0 +1,33 @@
+"""Масштабирование по числу процессов-обработчиков (SHARD_WORKERS).
+
+Бот запускается с 1, 2, 4 ... шардами и заглушкой Bot API (см.
+bench_webhook); обновления подаются с частотой выше пропускной способности
+одного процесса, так что замеренные обновления/с - это предел конфигурации.
+Прирост ограничен числом ядер машины: на одном ядре шарды только делят его.
+После каждого прогона проверяется, что все гонки всех шардов записаны в
+общую БД.
+
+Запуск: python -m benchmarks.bench_sharding [обновлений] [режим] [шарды,...]
+"""
+import asyncio
+import os
+import sys
+
+from benchmarks.bench_webhook import run_mode
+
+
+def main(n=2000, mode='polling', shard_counts=(1, 2, 4)):
+    print(f"{n} нажатий \"Гонка\", режим {mode}, ядер: {os.cpu_count()}")
+    baseline = None
+    for shards in shard_counts:
+        # 1 - обычный режим без координатора
+        env = {'SHARD_WORKERS': str(shards if shards > 1 else 0)}
+        throughput = asyncio.run(run_mode(mode, n, rate=10 ** 4, extra_env=env, label=f"{shards} шард."))
+        baseline = baseline or throughput
+        print(f"         ускорение x{throughput / baseline:.2f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+         sys.argv[2] if len(sys.argv) > 2 else 'polling',
+         tuple(int(x) for x in sys.argv[3].split(',')) if len(sys.argv) > 3 else (1, 2, 4))
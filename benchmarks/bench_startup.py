@@ -0,0 +1,81 @@
+"""Холодный старт бота на большой racing.db: импорт Race.py и первое
+обращение к базе в отдельном процессе. База строится в исходном виде
+(только players, user_version = 0), поэтому первый запуск применяет все
+миграции, а следующие - только читают версию схемы. Для сравнения - прежняя
+проверка схемы при импорте: все CREATE ... IF NOT EXISTS и PRAGMA table_xinfo
+отдельными транзакциями на каждом старте.
+
+Запуск: python -m benchmarks.bench_startup [игроков] [запусков]
+"""
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks._common import temp_db_path
+from benchmarks.suite import ROOT, build_population
+from migrations import SCHEMA_VERSION, _baseline
+from storage import PRAGMAS
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+import Race
+imported = time.perf_counter()
+assert not Race.game.db.opened
+version = Race.game.open_db()
+opened = time.perf_counter()
+Race.game.get_player(1)
+Race.game_async.shutdown()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'open_ms': (opened - imported) * 1000,
+                  'version': version}))
+"""
+
+
+def start_bot(db_path):
+    child = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, capture_output=True, text=True,
+                           env=dict(os.environ, BOT_TOKEN='bench:token', DB_PATH=db_path))
+    if child.returncode:
+        raise SystemExit(child.stderr[-3000:])
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def legacy_bootstrap(db_path):
+    """Прежний порядок: соединение при импорте и схема заново на каждом старте"""
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    _baseline(conn)
+    conn.close()
+    return (time.perf_counter() - start) * 1000
+
+
+def main(players=1000000, runs=5):
+    db_path = temp_db_path('racing.db')
+    start = time.perf_counter()
+    build_population(db_path, players, seed=1)
+    print(f"база на {players} игроков: {time.perf_counter() - start:.1f} с, "
+          f"{os.path.getsize(db_path) / 2 ** 20:.0f} МБ")
+
+    first = start_bot(db_path)
+    assert first['version'] == SCHEMA_VERSION
+    print(f"первый запуск (миграции до версии {SCHEMA_VERSION}): импорт {first['import_ms']:.0f} мс, "
+          f"база {first['open_ms']:.0f} мс")
+
+    starts = [start_bot(db_path) for _ in range(runs)]
+    imported = statistics.median(run['import_ms'] for run in starts)
+    opened = statistics.median(run['open_ms'] for run in starts)
+    print(f"следующие запуски (медиана из {runs}): импорт {imported:.0f} мс без обращения к базе, "
+          f"открытие и проверка версии {opened:.1f} мс")
+
+    legacy = statistics.median(legacy_bootstrap(db_path) for _ in range(runs))
+    print(f"прежняя проверка схемы на каждом старте: {legacy:.1f} мс")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 5)
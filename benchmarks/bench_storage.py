@@ -0,0 +1,50 @@
+"""Сравнение connect-на-каждый-вызов и долгоживущего соединения Storage.
+
+Запуск: python -m benchmarks.bench_storage [число_операций]
+"""
+import sqlite3
+import sys
+
+from benchmarks._common import import_race, ops_per_sec, temp_db_path
+
+PLAYERS = 1000
+
+
+def legacy_get_player(path, user_id):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("SELECT * FROM players WHERE user_id = ?", (user_id,))
+    player = c.fetchone()
+    conn.close()
+    return player
+
+
+def legacy_update_balance(path, user_id, amount):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("UPDATE players SET balance = balance + ? WHERE user_id = ?", (amount, user_id))
+    conn.commit()
+    conn.close()
+
+
+def main(n=5000):
+    path = temp_db_path()
+    Race = import_race(path)
+    game = Race.game
+    for user_id in range(PLAYERS):
+        game.register_player(user_id, f"player{user_id}")
+
+    results = [
+        ("get_player, connect на вызов", ops_per_sec(lambda i: legacy_get_player(path, i % PLAYERS), n)),
+        ("get_player, Storage", ops_per_sec(lambda i: game.get_player(i % PLAYERS), n)),
+        ("update_balance, connect на вызов", ops_per_sec(lambda i: legacy_update_balance(path, i % PLAYERS, 1), n)),
+        # Начисление копится в буфере журнала - сбрасываем сразу, коммит на вызов как и выше
+        ("update_balance, Storage", ops_per_sec(lambda i: (game.update_balance(i % PLAYERS, 1),
+                                                           game.flush_stats()), n)),
+    ]
+    for name, rate in results:
+        print(f"{name:<36} {rate:>12.0f} оп/с")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
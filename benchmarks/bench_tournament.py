@@ -0,0 +1,116 @@
+"""Турнир на 32 участника против 31 отдельной дуэли через настоящие обработчики:
+транзакции (COMMIT), правки сообщений и время на розыгрыш, а также проверка,
+что статистика сетки записана полностью и старт срабатывает один раз.
+
+Результаты гонок пишутся сразу (STATS_FLUSH_RACES=1), как без буфера.
+Запуск: python -m benchmarks.bench_tournament [турниров] [задержка_сети_мс]
+"""
+import asyncio
+import os
+import sys
+import time
+
+from benchmarks._common import callback_update, disable_rate_limit, import_race, temp_db_path
+
+PLAYERS = 32
+CHAT_ID = -100
+
+
+def count_commits(conn):
+    commits = []
+    conn.set_trace_callback(lambda sql: sql == 'COMMIT' and commits.append(sql))
+    return commits
+
+
+async def press(Race, user_id, data, message_id, delay):
+    update = callback_update(user_id, data, chat_id=CHAT_ID, chat_type='group', message_id=message_id,
+                             network_delay=delay)
+    await Race.handle_callback(update, None)
+    return len(update.callback_query.edits)
+
+
+async def duels(Race, game, delay):
+    """31 дуэль: вызов создается заранее, замеряется принятие"""
+    ids = []
+    for i in range(PLAYERS - 1):
+        challenger = 1 + i % PLAYERS
+        ids.append((game.open_challenge({'challenger_id': challenger, 'challenger_name': f"player{challenger}",
+                                         'challenger_car_id': 1, 'chat_id': CHAT_ID, 'message_id': i}),
+                    1 + (i + 1) % PLAYERS))
+    commits = count_commits(game.db.conn)
+    start = time.perf_counter()
+    edits = 0
+    for i, (challenge_id, acceptor) in enumerate(ids):
+        edits += await press(Race, acceptor, Race.cb("accept", challenge_id), i, delay)
+    elapsed = time.perf_counter() - start
+    game.db.conn.set_trace_callback(None)
+    return elapsed, len(commits), edits
+
+
+async def tournament(Race, game, message_id, delay):
+    """Ведущий собирает 32 участника; замеряется розыгрыш сетки (последняя запись)"""
+    await press(Race, 1, Race.cb("tournament"), message_id, 0)
+    tournament_id = game.db.fetchone("SELECT tournament_id FROM tournaments WHERE host_id = 1")[0]
+    for user_id in range(2, PLAYERS):
+        await press(Race, user_id, Race.cb("join", tournament_id), message_id, 0)
+    commits = count_commits(game.db.conn)
+    start = time.perf_counter()
+    edits = await press(Race, PLAYERS, Race.cb("join", tournament_id), message_id, delay)
+    elapsed = time.perf_counter() - start
+    game.db.conn.set_trace_callback(None)
+    assert game.tournaments.get(tournament_id) is None
+    return elapsed, len(commits), edits
+
+
+def totals(game):
+    game.compact_ledger()
+    return game.db.fetchone("SELECT SUM(pvp_races), SUM(pvp_wins), SUM(balance), MAX(pvp_wins) FROM players")
+
+
+def main(rounds=20, delay_ms=0.0):
+    os.environ['STATS_FLUSH_RACES'] = '1'
+    Race = import_race(temp_db_path())
+    disable_rate_limit(Race)
+    game = Race.game
+    for user_id in range(1, PLAYERS + 1):
+        game.register_player(user_id, f"player{user_id}")
+    delay = delay_ms / 1000
+
+    duel_time = duel_commits = duel_edits = 0
+    for _ in range(rounds):
+        elapsed, commits, edits = asyncio.run(duels(Race, game, delay))
+        duel_time += elapsed
+        duel_commits += commits
+        duel_edits += edits
+
+    before = totals(game)
+    bracket_time = bracket_commits = bracket_edits = 0
+    for i in range(rounds):
+        elapsed, commits, edits = asyncio.run(tournament(Race, game, 10 ** 6 + i, delay))
+        bracket_time += elapsed
+        bracket_commits += commits
+        bracket_edits += edits
+    after = totals(game)
+    # Сетка на 32: 31 матч, у каждого две стороны; чемпион выиграл 5 матчей
+    assert after[0] - before[0] == 62 * rounds and after[1] - before[1] == 31 * rounds
+    assert after[2] - before[2] == 31 * (1000 + 200) * rounds
+
+    # Повторный старт того же турнира не проходит
+    tournament_id = game.open_tournament({'host_id': 1, 'host_name': 'host', 'chat_id': CHAT_ID, 'message_id': 1}, 1)
+    game.join_tournament(tournament_id, 2, 'p2', 1)
+    assert game.start_tournament(tournament_id, 2)[0] == Race.NOT_HOST
+    assert game.start_tournament(tournament_id, 1)[1] is not None
+    assert game.start_tournament(tournament_id, 1)[0] == Race.CLOSED
+    print(f"статистика {rounds} турниров записана полностью, старт срабатывает один раз")
+
+    print(f"задержка сети на правку: {delay_ms:.0f} мс, {PLAYERS} игроков")
+    print(f"31 дуэль:      {duel_time / rounds * 1000:8.1f} мс, коммитов {duel_commits / rounds:5.1f}, "
+          f"правок {duel_edits / rounds:5.1f}")
+    print(f"турнир на 32:  {bracket_time / rounds * 1000:8.1f} мс, коммитов {bracket_commits / rounds:5.1f}, "
+          f"правок {bracket_edits / rounds:5.1f}")
+    Race.game_async.shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20,
+         float(sys.argv[2]) if len(sys.argv) > 2 else 0.0)
@@ -0,0 +1,198 @@
+"""Нагрузочный прогон бота в режимах polling и webhook через заглушку Bot API.
+
+Бот запускается отдельным процессом (python Race.py) и ходит в локальную
+заглушку вместо api.telegram.org. Синтетические Update с нажатием "Гонка"
+подаются с заданной частотой: в режиме polling через getUpdates заглушки, в
+режиме webhook POST-запросами на сервер бота. Задержка - от подачи
+обновления до последней правки сообщения, которую бот прислал в заглушку.
+После прогона проверяются отказ запросу с неверным секретом и то, что при
+остановке процесса все отложенные результаты гонок записаны в БД.
+
+Запуск: python -m benchmarks.bench_webhook [обновлений] [обновлений_в_секунду]
+"""
+import asyncio
+import json
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+
+from benchmarks._common import percentile, temp_db_path
+from benchmarks.stub_telegram import BOT_USER, StubTelegram
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRET = 'bench-secret'
+USERS = 200
+CONNECTIONS = 8
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def command_update(update_id, user_id, text='/start'):
+    user = {'id': user_id, 'is_bot': False, 'first_name': f"player{user_id}"}
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': int(time.time()), 'from': user, 'text': text,
+        'chat': {'id': user_id, 'type': 'private'},
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]}}
+
+
+def callback_update(update_id, user_id, data):
+    user = {'id': user_id, 'is_bot': False, 'first_name': f"player{user_id}"}
+    return {'update_id': update_id, 'callback_query': {
+        'id': str(update_id), 'from': user, 'chat_instance': str(user_id), 'data': data,
+        'message': {'message_id': update_id, 'date': int(time.time()), 'from': BOT_USER, 'text': 'menu',
+                    'chat': {'id': user_id, 'type': 'private'}}}}
+
+
+class WebhookClient:
+    """Легкий HTTP/1.1 клиент с постоянными соединениями: генератор нагрузки
+    делит процессор с ботом и не должен тратить его на httpx"""
+
+    def __init__(self, port, path, connections=CONNECTIONS):
+        self.port = port
+        self.path = path
+        self.queue = asyncio.Queue()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(connections)]
+
+    async def post(self, update, secret=SECRET):
+        """Код ответа сервера бота на POST с обновлением"""
+        done = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((json.dumps(update).encode(), secret, done))
+        return await done
+
+    def post_nowait(self, update):
+        self.queue.put_nowait((json.dumps(update).encode(), SECRET, None))
+
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+    async def _worker(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        try:
+            while True:
+                body, secret, done = await self.queue.get()
+                writer.write(f"POST /{self.path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                             f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\n\r\n".encode() + body)
+                status = int((await reader.readline()).split()[1])
+                length = 0
+                while (line := await reader.readline()) not in (b'\r\n', b''):
+                    name, _, value = line.partition(b':')
+                    if name.lower() == b'content-length':
+                        length = int(value)
+                await reader.readexactly(length)
+                if done is not None:
+                    done.set_result(status)
+        finally:
+            writer.close()
+
+
+async def wait_for(condition, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("бот не ответил вовремя")
+        await asyncio.sleep(0.01)
+
+
+async def run_mode(mode, n, rate, extra_env=None, label=None):
+    stub = await StubTelegram().start()
+    db_path = temp_db_path()
+    webhook_port = free_port()
+    env = dict(os.environ, BOT_TOKEN='bench:token', DB_PATH=db_path, TELEGRAM_API_URL=stub.base_url,
+               RATE_USER_PER_SEC='1e9', RATE_USER_BURST='1000000000',
+               RATE_CHAT_PER_SEC='1e9', RATE_CHAT_BURST='1000000000',
+               OUTBOUND_PER_SEC='1e9', OUTBOUND_CHAT_PER_SEC='1e9', OUTBOUND_CHAT_BURST='1000000000',
+               # Все результаты остаются в буфере до остановки: проверяем сброс при завершении
+               STATS_FLUSH_RACES='1000000000', STATS_FLUSH_INTERVAL_MS='3600000')
+    env.update(extra_env or {})
+    if mode == 'webhook':
+        env.update(WEBHOOK_URL=f"http://127.0.0.1:{webhook_port}", WEBHOOK_LISTEN='127.0.0.1',
+                   WEBHOOK_PORT=str(webhook_port), WEBHOOK_PATH='telegram', WEBHOOK_SECRET=SECRET)
+    else:
+        env.pop('WEBHOOK_URL', None)
+    log_path = db_path + '.log'
+    with open(log_path, 'w') as log:
+        bot = subprocess.Popen([sys.executable, 'Race.py'], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=log)
+    client = None
+
+    def deliver(update):
+        if client is not None:
+            client.post_nowait(update)
+        else:
+            stub.push(update)
+
+    try:
+        if mode == 'webhook':
+            await wait_for(lambda: stub.webhook is not None)
+            client = WebhookClient(webhook_port, 'telegram')
+        else:
+            await wait_for(lambda: stub.calls['getUpdates'] > 0)
+
+        update_id = 1
+        for user_id in range(1, USERS + 1):
+            deliver(command_update(update_id, user_id))
+            update_id += 1
+        await wait_for(lambda: len(stub.sent) == USERS)
+
+        sent_at = {}
+        edits_before = stub.calls['editMessageText']
+        start = time.perf_counter()
+        for i in range(n):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            user_id = i % USERS + 1
+            sent_at[user_id, update_id] = time.perf_counter()
+            deliver(callback_update(update_id, user_id, '1:r'))
+            update_id += 1
+        # Гонка заканчивается правкой с результатом (промежуточную очередь может схлопнуть)
+        await wait_for(lambda: all(key in stub.finals for key in sent_at), timeout=60)
+        elapsed = max(stub.finals[key] for key in sent_at) - start
+        latencies = [(stub.finals[key] - sent) * 1000 for key, sent in sent_at.items()]
+        edits = stub.calls['editMessageText'] - edits_before
+
+        if mode == 'webhook':
+            assert await client.post(callback_update(update_id, 1, '1:r'), secret='wrong') == 403
+            assert await client.post(callback_update(update_id, 1, '1:r'), secret='') == 403
+    finally:
+        if client is not None:
+            await client.close()
+        bot.send_signal(signal.SIGTERM)
+        try:
+            bot.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+        await stub.stop()
+
+    races = sqlite3.connect(db_path).execute("SELECT COALESCE(SUM(races), 0) FROM players").fetchone()[0]
+    if races != n:
+        with open(log_path) as log:
+            print(log.read()[-2000:])
+    assert races == n, f"в БД {races} гонок из {n}: отложенные результаты потеряны при остановке"
+    print(f"{label or mode:8} {n / elapsed:8.0f} обновлений/с  "
+          f"p50 {percentile(latencies, 50):6.1f} мс  p95 {percentile(latencies, 95):6.1f} мс  "
+          f"p99 {percentile(latencies, 99):6.1f} мс  правок на гонку {edits / n:.2f}")
+    return n / elapsed
+
+
+def main(n=1000, rate=50):
+    print(f"{n} нажатий \"Гонка\" с частотой {rate}/с, {USERS} игроков")
+    for mode in ('polling', 'webhook'):
+        asyncio.run(run_mode(mode, n, rate))
+    print("неверный секрет отклоняется (403); при остановке отложенные результаты записаны в БД")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+         float(sys.argv[2]) if len(sys.argv) > 2 else 50)
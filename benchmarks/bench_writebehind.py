@@ -0,0 +1,37 @@
+"""Гонки в секунду и число коммитов: запись на каждую гонку против отложенной.
+
+Запуск: python -m benchmarks.bench_writebehind [число_гонок]
+"""
+import sys
+import time
+
+from benchmarks._common import import_race, temp_db_path
+
+PLAYERS = 500
+
+
+def run(game, races):
+    start = time.perf_counter()
+    level_ups = 0
+    for i in range(races):
+        level_ups += game.update_stats_after_race(i % PLAYERS, 500, 25, i % 2 == 0, i % 3 == 0)
+    game.flush_stats()
+    return races / (time.perf_counter() - start), level_ups
+
+
+def main(races=20000):
+    Race = import_race(temp_db_path())
+    for flush_races in (1, 100, 1000):
+        game = Race.RacingGame(temp_db_path(), stats_flush_races=flush_races)
+        for user_id in range(PLAYERS):
+            game.register_player(user_id, f"player{user_id}")
+        rate, level_ups = run(game, races)
+        game.compact_ledger()
+        commits = races if not game.stats_buffer.enabled else game.stats_buffer.flushes
+        totals = game.db.fetchone("SELECT SUM(races + pvp_races), SUM(experience), SUM(level) FROM players")
+        print(f"сброс каждые {flush_races:>4} гонок: {rate:>9.0f} гонок/с, коммитов {commits:>6}, "
+              f"повышений уровня {level_ups}, итого {totals}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,185 @@
+"""Локальная заглушка Bot API для прогона бота без настоящего Telegram.
+
+Отвечает на методы, которые вызывает бот (getMe, setWebhook, deleteWebhook,
+getUpdates, answerCallbackQuery, editMessageText, sendMessage ...), отдает
+через getUpdates обновления, добавленные методом push, и запоминает время
+каждого ответа бота, чтобы считать задержку от обновления до ответа.
+
+Бот направляется на заглушку через .env:
+    TELEGRAM_API_URL=http://127.0.0.1:8081/bot
+
+Запуск отдельно: python -m benchmarks.stub_telegram [порт]
+"""
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+from urllib.parse import parse_qsl
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'RaceBot', 'username': 'race_stub_bot'}
+
+
+def decode_params(body, content_type):
+    """Параметры запроса: PTB шлет форму, где сложные значения закодированы в JSON"""
+    if not body:
+        return {}
+    if content_type.startswith('application/json'):
+        return json.loads(body)
+    params = {}
+    for key, value in parse_qsl(body.decode(), keep_blank_values=True):
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+class StubTelegram:
+    """HTTP-сервер, изображающий api.telegram.org"""
+
+    def __init__(self, host='127.0.0.1', port=0, clock=time.perf_counter):
+        self.host = host
+        self.port = port
+        self.clock = clock
+        self.calls = Counter()
+        # (chat_id, message_id) -> время последней правки сообщения
+        self.edits = {}
+        self.finals = {}
+        # chat_id -> время последнего отправленного сообщения
+        self.sent = {}
+        self.webhook = None
+        self._updates = []
+        self._new_updates = asyncio.Event()
+        self._server = None
+        self._writers = set()
+        self._message_id = 10 ** 9
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        # Закрываем keep-alive соединения, чтобы их обработчики завершились сами
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+        while self._writers:
+            await asyncio.sleep(0.01)
+
+    def push(self, update):
+        """Обновление, которое бот получит следующим вызовом getUpdates"""
+        self._updates.append(update)
+        self._new_updates.set()
+
+    # --- Методы Bot API ---
+    async def get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        self._updates = [u for u in self._updates if u['update_id'] >= offset]
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    def edit_message_text(self, params):
+        chat_id, message_id = int(params['chat_id']), int(params['message_id'])
+        self.edits[chat_id, message_id] = self.clock()
+        if params.get('reply_markup'):
+            # Правка с клавиатурой - итоговый экран (промежуточные идут без кнопок)
+            self.finals[chat_id, message_id] = self.edits[chat_id, message_id]
+        return self._message(chat_id, message_id, params.get('text', ''))
+
+    def send_message(self, params):
+        chat_id = int(params['chat_id'])
+        self.sent[chat_id] = self.clock()
+        self._message_id += 1
+        return self._message(chat_id, self._message_id, params.get('text', ''))
+
+    def set_webhook(self, params):
+        self.webhook = params.get('url') or None
+        return True
+
+    def delete_webhook(self, params):
+        self.webhook = None
+        return True
+
+    def get_webhook_info(self, params):
+        return {'url': self.webhook or '', 'has_custom_certificate': False, 'pending_update_count': len(self._updates)}
+
+    @staticmethod
+    def _message(chat_id, message_id, text):
+        return {'message_id': message_id, 'date': int(time.time()), 'text': text, 'from': BOT_USER,
+                'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group'}}
+
+    async def call(self, method, params):
+        self.calls[method] += 1
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getUpdates':
+            return await self.get_updates(params)
+        handler = {
+            'editMessageText': self.edit_message_text,
+            'sendMessage': self.send_message,
+            'setWebhook': self.set_webhook,
+            'deleteWebhook': self.delete_webhook,
+            'getWebhookInfo': self.get_webhook_info,
+        }.get(method)
+        # Остальные методы (answerCallbackQuery и т.п.) просто успешны
+        return handler(params) if handler else True
+
+    # --- HTTP ---
+    async def _serve(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode().split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode().partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                method = path.rstrip('/').rsplit('/', 1)[-1]
+                result = await self.call(method, decode_params(body, headers.get('content-type', '')))
+                payload = json.dumps({'ok': True, 'result': result}).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n%s" % (len(payload), payload))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+
+async def serve_forever(port):
+    stub = await StubTelegram(port=port).start()
+    print(f"Заглушка Bot API: TELEGRAM_API_URL={stub.base_url}")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(dict(stub.calls))
+    finally:
+        await stub.stop()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(serve_forever(int(sys.argv[1]) if len(sys.argv) > 1 else 8081))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,224 @@
+"""Воспроизводимый прогон бота на синтетической базе игроков.
+
+Для каждого размера (по умолчанию 10k, 100k и 1M игроков) в отдельном
+процессе строится racing.db с детерминированной популяцией, затем через
+настоящие обработчики проигрывается смесь нажатий "Гонка", "Топ", покупок
+машин и принятия вызовов (поддельные Update/CallbackQuery вместо Bot API).
+Отчет - пропускная способность, p50/p99 по видам нажатий и пиковая память
+процесса; с --save результат сохраняется как эталон, без него - сравнивается
+с сохраненным.
+
+Запуск: python -m benchmarks.suite [--players 10000,100000,1000000] [--updates 20000]
+        [--concurrency 32] [--delay-ms 0] [--seed 1] [--baseline путь] [--save]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import time
+
+from benchmarks._common import callback_update, disable_rate_limit, import_race, percentile, temp_db_path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# Доли нажатий в смеси
+MIX = (('race', 0.5), ('top', 0.2), ('buy', 0.15), ('accept', 0.15))
+# 80% нажатий делают 5% самых активных игроков
+HOT_SHARE = 0.05
+HOT_PRESSES = 0.8
+CHAT_ID = -100
+# Отклонение от эталона, которое считается регрессией
+TOLERANCE = 0.10
+
+
+def build_population(db_path, players, seed):
+    """Игроки со статистикой разного масштаба; одна транзакция, executemany.
+
+    Таблица создается в исходном виде, остальное схеме добавит бот при запуске.
+    """
+    rng = random.Random(seed)
+
+    def rows():
+        for user_id in range(1, players + 1):
+            races = int(rng.expovariate(1 / 40))
+            wins = rng.randint(0, races)
+            pvp_races = int(rng.expovariate(1 / 8))
+            pvp_wins = rng.randint(0, pvp_races)
+            experience = wins * 25 + (races - wins) * 10 + pvp_wins * 50 + (pvp_races - pvp_wins) * 20
+            yield (user_id, f"player{user_id}", int(rng.expovariate(1 / 20000)), rng.choice((1, 1, 1, 2, 2, 3, 4, 5)),
+                   experience, experience // 100 + 1, wins, races, pvp_wins, pvp_races)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('''CREATE TABLE players (user_id INTEGER PRIMARY KEY, username TEXT,
+                    balance INTEGER DEFAULT 1000, car_id INTEGER DEFAULT 1, experience INTEGER DEFAULT 0,
+                    level INTEGER DEFAULT 1, wins INTEGER DEFAULT 0, races INTEGER DEFAULT 0,
+                    pvp_wins INTEGER DEFAULT 0, pvp_races INTEGER DEFAULT 0)''')
+    conn.executemany('''INSERT INTO players (user_id, username, balance, car_id, experience, level,
+                                             wins, races, pvp_wins, pvp_races)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows())
+    conn.commit()
+    conn.close()
+
+
+def make_schedule(players, updates, seed):
+    """Последовательность (вид, user_id, аргумент) - одинаковая при том же seed"""
+    rng = random.Random(seed)
+    hot = max(1, int(players * HOT_SHARE))
+    kinds, weights = zip(*MIX)
+    schedule = []
+    for kind in rng.choices(kinds, weights, k=updates):
+        user_id = rng.randint(1, hot) if rng.random() < HOT_PRESSES else rng.randint(1, players)
+        schedule.append((kind, user_id, rng.randint(2, 5) if kind == 'buy' else None))
+    return schedule
+
+
+async def replay(Race, schedule, challenges, concurrency, delay):
+    latencies = {kind: [] for kind, _ in MIX}
+    challenges = iter(challenges)
+    position = iter(range(len(schedule)))
+
+    async def press(i):
+        kind, user_id, arg = schedule[i]
+        if kind == 'accept':
+            challenge_id, challenger_id = next(challenges)
+            # Свой вызов принять нельзя - его принимает следующий игрок
+            user_id = user_id if user_id != challenger_id else challenger_id + 1
+            data, chat_id = Race.cb("accept", challenge_id), CHAT_ID
+        else:
+            data = Race.cb(kind, arg) if arg is not None else Race.cb(kind)
+            chat_id = None
+        update = callback_update(user_id, data, chat_id=chat_id, chat_type='group' if chat_id else 'private',
+                                 message_id=i, network_delay=delay)
+        start = time.perf_counter()
+        await Race.handle_callback(update, None)
+        latencies[kind].append((time.perf_counter() - start) * 1000)
+
+    async def worker():
+        for i in position:
+            await press(i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+
+def run_size(players, updates, concurrency, delay_ms, seed):
+    """Один размер базы; вызывается в дочернем процессе, чтобы память мерилась отдельно"""
+    db_path = temp_db_path()
+    start = time.perf_counter()
+    build_population(db_path, players, seed)
+    built = time.perf_counter() - start
+
+    start = time.perf_counter()
+    Race = import_race(db_path)
+    loaded = time.perf_counter() - start
+    disable_rate_limit(Race)
+    game = Race.game
+    schedule = make_schedule(players, updates, seed)
+    rng = random.Random(seed + 1)
+    # Открытые вызовы для каждого принятия: по одному на вызывающего
+    challengers = rng.sample(range(1, players), sum(kind == 'accept' for kind, _, _ in schedule))
+    challenges = [(game.open_challenge({'challenger_id': user_id, 'challenger_name': f"player{user_id}",
+                                        'challenger_car_id': 1, 'chat_id': CHAT_ID, 'message_id': i}), user_id)
+                  for i, user_id in enumerate(challengers)]
+    game.compact_ledger()
+    before = game.db.fetchone("SELECT SUM(races), SUM(pvp_races) FROM players")
+
+    elapsed, latencies = asyncio.run(replay(Race, schedule, challenges, concurrency, delay_ms / 1000))
+    game.flush_stats()
+    game.compact_ledger()
+    after = game.db.fetchone("SELECT SUM(races), SUM(pvp_races) FROM players")
+    assert after[0] - before[0] == len(latencies['race']), "не все гонки записаны"
+    assert after[1] - before[1] == 2 * len(challenges), "не все вызовы разыграны"
+    Race.game_async.shutdown()
+
+    everything = [value for values in latencies.values() for value in values]
+    return {
+        'players': players,
+        'updates': updates,
+        'build_s': round(built, 2),
+        'import_s': round(loaded, 3),
+        'throughput': round(updates / elapsed, 1),
+        'p50_ms': round(percentile(everything, 50), 3),
+        'p99_ms': round(percentile(everything, 99), 3),
+        'kinds': {kind: {'p50_ms': round(percentile(values, 50), 3), 'p99_ms': round(percentile(values, 99), 3)}
+                  for kind, values in latencies.items()},
+        # ru_maxrss в Linux - в килобайтах
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def compare(result, baseline):
+    """Строки сравнения с эталоном; регрессии помечены"""
+    lines = []
+    for key, higher_is_better in (('throughput', True), ('p50_ms', False), ('p99_ms', False),
+                                  ('peak_rss_mb', False)):
+        old, new = baseline.get(key), result[key]
+        if not old:
+            continue
+        change = new / old - 1
+        worse = change < -TOLERANCE if higher_is_better else change > TOLERANCE
+        lines.append(f"{key} {old} -> {new} ({change:+.1%}){'  РЕГРЕССИЯ' if worse else ''}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', default='10000,100000,1000000')
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--delay-ms', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save', action='store_true')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        result = run_size(args.child, args.updates, args.concurrency, args.delay_ms, args.seed)
+        print(json.dumps(result))
+        return
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            baseline = {str(entry['players']): entry for entry in json.load(f)['results']}
+    results = []
+    print(f"{args.updates} нажатий, {args.concurrency} одновременно, смесь "
+          + ", ".join(f"{kind} {share:.0%}" for kind, share in MIX))
+    for players in (int(value) for value in args.players.split(',')):
+        child = subprocess.run([sys.executable, '-m', 'benchmarks.suite', '--child', str(players),
+                                '--updates', str(args.updates), '--concurrency', str(args.concurrency),
+                                '--delay-ms', str(args.delay_ms), '--seed', str(args.seed)],
+                               cwd=ROOT, env=dict(os.environ, BOT_TOKEN='bench:token', METRICS_LOG_INTERVAL='0'),
+                               capture_output=True, text=True)
+        if child.returncode:
+            print(child.stderr[-3000:])
+            raise SystemExit(f"прогон на {players} игроков завершился с ошибкой")
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"\n{players:>8} игроков: база за {result['build_s']} с, импорт бота {result['import_s']} с, "
+              f"{result['throughput']} нажатий/с, p50 {result['p50_ms']} мс, p99 {result['p99_ms']} мс, "
+              f"пик памяти {result['peak_rss_mb']} МБ")
+        for kind, stats in result['kinds'].items():
+            print(f"    {kind:7} p50 {stats['p50_ms']:7.3f} мс  p99 {stats['p99_ms']:7.3f} мс")
+        if str(players) in baseline:
+            for line in compare(result, baseline[str(players)]):
+                print(f"    эталон: {line}")
+        elif baseline:
+            print("    для этого размера эталона нет")
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({'args': {key: value for key, value in vars(args).items() if key not in ('save', 'child')},
+                       'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"\nэталон сохранен: {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
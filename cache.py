@@ -0,0 +1,53 @@
+from collections import OrderedDict
+
+
+class PlayerCache:
+    """Ограниченный LRU-кэш записей игроков по user_id.
+
+    Хранит актуальное состояние игрока (с учетом еще не записанных в БД
+    приращений), поэтому все изменяющие методы RacingGame обновляют запись
+    в кэше сами. Емкость 0 отключает кэш.
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, user_id):
+        record = self._data.get(user_id)
+        if record is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(user_id)
+        self.hits += 1
+        return record
+
+    def peek(self, user_id):
+        """Запись без учета в статистике и без изменения порядка"""
+        return self._data.get(user_id)
+
+    def put(self, user_id, record):
+        if self.capacity <= 0:
+            return
+        self._data[user_id] = record
+        self._data.move_to_end(user_id)
+        while len(self._data) > self.capacity:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'capacity': self.capacity,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,110 @@
+import re
+
+# Telegram ограничивает callback_data 64 байтами
+MAX_CALLBACK_DATA = 64
+VERSION = '1'
+SEPARATOR = ':'
+
+_TOKEN = re.compile(r'^[0-9A-Za-z_-]{1,48}$')
+
+
+def parse_int(value):
+    if not value.isdigit() or len(value) > 12:
+        raise ValueError(value)
+    return int(value)
+
+
+def parse_token(value):
+    if not _TOKEN.match(value):
+        raise ValueError(value)
+    return value
+
+
+# Разборщики аргументов по их типу в объявлении маршрута
+PARSERS = {int: parse_int, str: parse_token}
+
+
+class Route:
+    __slots__ = ('name', 'code', 'arg_types', 'validate', 'handler')
+
+    def __init__(self, name, code, arg_types, validate):
+        self.name = name
+        self.code = code
+        self.arg_types = arg_types
+        self.validate = validate
+        self.handler = None
+
+
+class CallbackRouter:
+    """Таблица маршрутов кнопок и компактная версия callback_data.
+
+    Кнопка кодируется как "<версия>:<код>[:<аргумент>...]", например "1:b:3".
+    Разбор проверяет версию, код, число и тип аргументов и валидатор маршрута,
+    так что обработчик получает уже проверенные значения. Старые кнопки
+    ("menu_profile", "buy_3", "accept_...") из отправленных ранее сообщений
+    по-прежнему распознаются.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._by_code = {}
+        # Готовые результаты разбора для кнопок без аргументов
+        self._static = {}
+        self._legacy_prefixes = {}
+
+    def declare(self, name, code, *arg_types, validate=None, legacy=None):
+        """Объявление маршрута; legacy - прежняя строка или префикс с '_' на конце"""
+        if code in self._by_code or SEPARATOR in code:
+            raise ValueError(f"Некорректный или повторный код маршрута: {code}")
+        route = Route(name, code, arg_types, validate)
+        self._routes[name] = route
+        self._by_code[code] = route
+        if not arg_types:
+            self._static[self.encode(name)] = (route, ())
+        if legacy is not None:
+            if arg_types:
+                self._legacy_prefixes[legacy] = route
+            else:
+                self._static[legacy] = (route, ())
+        return route
+
+    def handler(self, name):
+        """Декоратор: привязка обработчика к объявленному маршруту"""
+        def decorator(fn):
+            self._routes[name].handler = fn
+            return fn
+        return decorator
+
+    def encode(self, name, *args):
+        route = self._routes[name]
+        if len(args) != len(route.arg_types):
+            raise ValueError(f"Маршрут {name} ждет {len(route.arg_types)} аргументов")
+        data = SEPARATOR.join((VERSION, route.code, *map(str, args)))
+        if len(data.encode()) > MAX_CALLBACK_DATA:
+            raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA} байт: {data}")
+        return data
+
+    def decode(self, data):
+        """(маршрут, аргументы) или None для некорректных данных"""
+        resolved = self._static.get(data)
+        if resolved is not None:
+            return resolved
+        if not data:
+            return None
+        if data.startswith(VERSION + SEPARATOR):
+            parts = data.split(SEPARATOR)
+            route = self._by_code.get(parts[1])
+            raw_args = parts[2:]
+        else:
+            prefix, _, rest = data.partition('_')
+            route = self._legacy_prefixes.get(prefix + '_')
+            raw_args = [rest]
+        if route is None or len(raw_args) != len(route.arg_types):
+            return None
+        try:
+            args = tuple(PARSERS[kind](raw) for kind, raw in zip(route.arg_types, raw_args))
+        except ValueError:
+            return None
+        if route.validate is not None and not route.validate(*args):
+            return None
+        return route, args
@@ -0,0 +1,218 @@
+import heapq
+import sqlite3
+import time
+
+
+def to_base36(number):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    result = ""
+    while True:
+        number, rest = divmod(number, 36)
+        result = digits[rest] + result
+        if not number:
+            return result
+
+
+class ChallengeRegistry:
+    """Открытые PvP вызовы с истечением по монотонным часам.
+
+    Сроки хранятся в куче, поэтому очистка стоит O(k log n) для k истекших
+    вызовов, а не полный проход по всем. Просроченный вызов не отдается и
+    не может быть принят, даже если очистка до него еще не дошла. Принятие
+    забирает вызов одной операцией, так что принять его можно только один раз.
+    """
+
+    def __init__(self, ttl=1800, max_per_user=3, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_per_user = max_per_user
+        self.clock = clock
+        self.expired = 0
+        self._challenges = {}
+        self._heap = []
+        self._by_chat = {}
+        self._by_user = {}
+
+    def __len__(self):
+        return len(self._challenges)
+
+    def __contains__(self, challenge_id):
+        return self.get(challenge_id) is not None
+
+    def new_id(self, user_id):
+        """Уникальный и короткий id вызова для callback_data"""
+        stamp = int(time.time() * 1000)
+        challenge_id = f"{to_base36(user_id)}_{to_base36(stamp)}"
+        while challenge_id in self._challenges:
+            stamp += 1
+            challenge_id = f"{to_base36(user_id)}_{to_base36(stamp)}"
+        return challenge_id
+
+    def open_count(self, user_id):
+        return len(self._by_user.get(user_id, ()))
+
+    def create(self, challenge_id, challenge_data):
+        """Регистрация вызова; False, если у игрока уже максимум открытых"""
+        self.expire()
+        if self.open_count(challenge_data['challenger_id']) >= self.max_per_user:
+            return False
+        self.add(challenge_id, challenge_data, self.ttl)
+        return True
+
+    def add(self, challenge_id, challenge_data, ttl):
+        """Запись вызова без проверки лимита (например, прочитанного из БД)"""
+        if challenge_id in self._challenges:
+            self._remove(challenge_id)
+        deadline = self.clock() + ttl
+        challenge_data['deadline'] = deadline
+        self._challenges[challenge_id] = challenge_data
+        heapq.heappush(self._heap, (deadline, challenge_id))
+        self._by_chat.setdefault(challenge_data['chat_id'], set()).add(challenge_id)
+        self._by_user.setdefault(challenge_data['challenger_id'], set()).add(challenge_id)
+
+    def discard(self, challenge_id):
+        if challenge_id in self._challenges:
+            self._remove(challenge_id)
+
+    def get(self, challenge_id):
+        """Данные вызова или None, если его нет или он истек"""
+        challenge_data = self._challenges.get(challenge_id)
+        if challenge_data is None:
+            return None
+        if challenge_data['deadline'] <= self.clock():
+            self._remove(challenge_id)
+            self.expired += 1
+            return None
+        return challenge_data
+
+    def claim(self, challenge_id):
+        """Забираем вызов для гонки: вернется только одному принявшему"""
+        challenge_data = self.get(challenge_id)
+        if challenge_data is not None:
+            self._remove(challenge_id)
+        return challenge_data
+
+    def in_chat(self, chat_id):
+        """Открытые вызовы чата парами (id, данные) по индексу чата"""
+        found = []
+        for challenge_id in tuple(self._by_chat.get(chat_id, ())):
+            challenge_data = self.get(challenge_id)
+            if challenge_data is not None:
+                found.append((challenge_id, challenge_data))
+        return found
+
+    def expire(self):
+        """Удаление истекших вызовов; возвращает их id"""
+        now = self.clock()
+        heap = self._heap
+        expired = []
+        while heap and heap[0][0] <= now:
+            deadline, challenge_id = heapq.heappop(heap)
+            challenge_data = self._challenges.get(challenge_id)
+            # Запись кучи могла остаться от уже принятого вызова
+            if challenge_data is not None and challenge_data['deadline'] == deadline:
+                self._remove(challenge_id)
+                expired.append(challenge_id)
+        self.expired += len(expired)
+        # Принятые вызовы оставляют записи в куче; не даем им копиться
+        if len(heap) > 2 * len(self._challenges) + 64:
+            self._heap = [(d['deadline'], cid) for cid, d in self._challenges.items()]
+            heapq.heapify(self._heap)
+        return expired
+
+    def _remove(self, challenge_id):
+        challenge_data = self._challenges.pop(challenge_id)
+        for index, key in ((self._by_chat, challenge_data['chat_id']), (self._by_user, challenge_data['challenger_id'])):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(challenge_id)
+                if not ids:
+                    del index[key]
+
+
+class ChallengeStore:
+    """Вызовы в таблице challenges; ChallengeRegistry служит кэшем чтения.
+
+    Таблица переживает перезапуск бота и видна всем процессам. Принятие -
+    это DELETE ... RETURNING с проверкой срока: строку удаляет ровно один
+    запрос, поэтому вызов не примут дважды даже из разных процессов.
+    """
+
+    COLUMNS = "challenger_id, challenger_name, challenger_car_id, chat_id, message_id, created_at, expires_at"
+
+    def __init__(self, db, ttl=1800, max_per_user=3, wall_clock=time.time, clock=time.monotonic):
+        self.db = db
+        self.ttl = ttl
+        self.max_per_user = max_per_user
+        self.wall_clock = wall_clock
+        self.cache = ChallengeRegistry(ttl, max_per_user, clock)
+
+    @staticmethod
+    def _row_to_data(row):
+        keys = ('challenger_id', 'challenger_name', 'challenger_car_id', 'chat_id', 'message_id', 'created_at', 'expires_at')
+        return dict(zip(keys, row))
+
+    def create(self, challenge_data):
+        """Сохраняем вызов; возвращает его id или None, если превышен лимит"""
+        now = self.wall_clock()
+        user_id = challenge_data['challenger_id']
+        with self.db.transaction() as conn:
+            open_count = conn.execute("SELECT COUNT(*) FROM challenges WHERE challenger_id = ? AND expires_at > ?",
+                                      (user_id, now)).fetchone()[0]
+            if open_count >= self.max_per_user:
+                return None
+            challenge_data['created_at'] = now
+            challenge_data['expires_at'] = now + self.ttl
+            while True:
+                challenge_id = self.cache.new_id(user_id)
+                try:
+                    conn.execute(f"INSERT INTO challenges (challenge_id, {self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (challenge_id, user_id, challenge_data['challenger_name'],
+                                  challenge_data['challenger_car_id'], challenge_data['chat_id'],
+                                  challenge_data['message_id'], now, now + self.ttl))
+                    break
+                except sqlite3.IntegrityError:
+                    # Тот же игрок в ту же миллисекунду из другого процесса
+                    time.sleep(0.001)
+        self.cache.add(challenge_id, challenge_data, self.ttl)
+        return challenge_id
+
+    def get(self, challenge_id):
+        """Данные открытого вызова: из кэша или из БД (после перезапуска)"""
+        challenge_data = self.cache.get(challenge_id)
+        if challenge_data is not None:
+            return challenge_data
+        now = self.wall_clock()
+        row = self.db.fetchone(f"SELECT {self.COLUMNS} FROM challenges WHERE challenge_id = ? AND expires_at > ?",
+                               (challenge_id, now))
+        if row is None:
+            return None
+        challenge_data = self._row_to_data(row)
+        self.cache.add(challenge_id, challenge_data, challenge_data['expires_at'] - now)
+        return challenge_data
+
+    def claim(self, challenge_id):
+        """Атомарно забираем вызов; None, если его уже приняли или он истек"""
+        self.cache.discard(challenge_id)
+        row = self.db.fetchone_commit(f"""DELETE FROM challenges WHERE challenge_id = ? AND expires_at > ?
+                                          RETURNING {self.COLUMNS}""", (challenge_id, self.wall_clock()))
+        return self._row_to_data(row) if row else None
+
+    def in_chat(self, chat_id, limit=5):
+        """Открытые вызовы чата парами (id, данные) по индексу (chat_id, expires_at), ближайшие к сроку первыми"""
+        now = self.wall_clock()
+        rows = self.db.fetchall(f"""SELECT challenge_id, {self.COLUMNS} FROM challenges
+                                    WHERE chat_id = ? AND expires_at > ? ORDER BY expires_at LIMIT ?""",
+                                (chat_id, now, limit))
+        found = []
+        for challenge_id, *row in rows:
+            challenge_data = self.cache.get(challenge_id)
+            if challenge_data is None:
+                challenge_data = self._row_to_data(row)
+                self.cache.add(challenge_id, challenge_data, challenge_data['expires_at'] - now)
+            found.append((challenge_id, challenge_data))
+        return found
+
+    def expire(self):
+        """Удаление истекших вызовов по индексу срока; возвращает их число"""
+        self.cache.expire()
+        return self.db.execute("DELETE FROM challenges WHERE expires_at <= ?", (self.wall_clock(),))
@@ -0,0 +1,138 @@
+import threading
+
+
+def score_of(record):
+    """Очки рейтинга записи игрока (records.Player)"""
+    return record.wins + record.pvp_wins * 2
+
+
+class ScoreCounts:
+    """Число игроков по очкам в дереве Фенвика: место игрока за O(log n)"""
+
+    def __init__(self, size=1024):
+        self.counts = {}
+        self.total = 0
+        self._tree = [0] * (size + 1)
+
+    def _add(self, score, amount):
+        if score + 1 >= len(self._tree):
+            self._grow(score + 1)
+        i = score + 1
+        while i < len(self._tree):
+            self._tree[i] += amount
+            i += i & -i
+
+    def _grow(self, needed):
+        size = len(self._tree) - 1
+        while size < needed:
+            size *= 2
+        self._tree = [0] * (size + 1)
+        for score, count in self.counts.items():
+            i = score + 1
+            while i <= size:
+                self._tree[i] += count
+                i += i & -i
+
+    def add(self, score, amount=1):
+        self._add(score, amount)
+        self.counts[score] = self.counts.get(score, 0) + amount
+        self.total += amount
+
+    def move(self, old_score, new_score):
+        if old_score != new_score:
+            self.add(old_score, -1)
+            self.add(new_score, 1)
+
+    def count_above(self, score):
+        """Сколько игроков набрали больше очков"""
+        i = min(score + 1, len(self._tree) - 1)
+        not_above = 0
+        while i > 0:
+            not_above += self._tree[i]
+            i -= i & -i
+        return self.total - not_above
+
+
+class Leaderboard:
+    """Топ-K игроков, поддерживаемый при каждом изменении статистики.
+
+    Очки и уровень игрока только растут, поэтому выпасть из топа можно лишь
+    когда кого-то обгонят, и топ-K остается точным без повторной сортировки
+    всей таблицы. Пока таблица не загружена из БД, обновления пропускаются.
+    """
+
+    def __init__(self, size=10):
+        self.size = size
+        self.loaded = False
+        self.version = 0
+        self.scores = ScoreCounts()
+        self._entries = []
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(record):
+        return (-score_of(record), -record.level, record.user_id)
+
+    def load(self, top_records, score_counts):
+        with self._lock:
+            self._entries = sorted((r.copy() for r in top_records), key=self._key)[:self.size]
+            self.scores = ScoreCounts()
+            for score, count in score_counts:
+                self.scores.add(score, count)
+            self.loaded = True
+            self.version += 1
+
+    def add_player(self, record):
+        """Новый игрок с нулевыми очками"""
+        if not self.loaded:
+            return
+        with self._lock:
+            self.scores.add(score_of(record))
+            self._place(record)
+
+    def update(self, record, old_score):
+        """Изменение статистики игрока; record - его актуальная запись"""
+        if not self.loaded:
+            return
+        with self._lock:
+            self.scores.move(old_score, score_of(record))
+            self._place(record)
+
+    def set_balance(self, user_id, balance):
+        """Баланс в топе показывается, поэтому держим его актуальным"""
+        with self._lock:
+            for entry in self._entries:
+                if entry.user_id == user_id:
+                    if entry.balance != balance:
+                        entry.balance = balance
+                        self.version += 1
+                    return
+
+    def _place(self, record):
+        entries = self._entries
+        for i, entry in enumerate(entries):
+            if entry.user_id == record.user_id:
+                del entries[i]
+                break
+        else:
+            if len(entries) >= self.size and self._key(record) > self._key(entries[-1]):
+                return
+        key = self._key(record)
+        position = len(entries)
+        for i, entry in enumerate(entries):
+            if key < self._key(entry):
+                position = i
+                break
+        entries.insert(position, record.copy())
+        del entries[self.size:]
+        self.version += 1
+
+    def top(self, limit=None):
+        """Копии записей игроков (records.Player) из топа по порядку"""
+        with self._lock:
+            return [e.copy() for e in self._entries[:limit or self.size]]
+
+    def rank(self, record):
+        """Место игрока; игроки с равными очками делят место"""
+        with self._lock:
+            return self.scores.count_above(score_of(record)) + 1
@@ -0,0 +1,101 @@
+import time
+
+# Записей журнала за одну транзакцию свертки: блокировка записи не держится долго
+LEDGER_COMPACT_BATCH = 5000
+
+# Еще не свернутые приращения игрока в порядке writebehind
+# (BALANCE, EXPERIENCE, RACES, WINS, PVP_RACES, PVP_WINS); параметр :user_id
+LEDGER_PENDING = '''SELECT COALESCE(SUM(credits), 0), COALESCE(SUM(experience), 0),
+                           COALESCE(SUM(races), 0), COALESCE(SUM(wins), 0),
+                           COALESCE(SUM(pvp_races), 0), COALESCE(SUM(pvp_wins), 0)
+                    FROM ledger
+                    WHERE user_id = :user_id
+                      AND entry_id > (SELECT compacted_through FROM ledger_state)'''
+
+# Те же приращения сразу для всех игроков с записями после отметки (колонки d_*)
+LEDGER_PENDING_BY_USER = '''SELECT user_id, SUM(credits) AS d_credits, SUM(experience) AS d_experience,
+                                   SUM(races) AS d_races, SUM(wins) AS d_wins,
+                                   SUM(pvp_races) AS d_pvp_races, SUM(pvp_wins) AS d_pvp_wins
+                            FROM ledger
+                            WHERE entry_id > (SELECT compacted_through FROM ledger_state)
+                            GROUP BY user_id'''
+
+
+class Ledger:
+    """Журнал экономики: кредиты и опыт только дописываются.
+
+    Каждая награда за гонку, выплата PvP, счет аркады и покупка - отдельная
+    запись с причиной и временем, поэтому историю игрока можно проверить и
+    откатить. Горячие строки players не обновляются на каждое событие:
+    свертка (compact) периодически переносит записи в players одним
+    UPDATE на игрока и сдвигает отметку ledger_state.compacted_through.
+    Состояние игрока - строка players плюс записи после отметки; свертка
+    его не меняет, и читатели других процессов видят одно и то же.
+    """
+
+    def __init__(self, db, compact_batch=LEDGER_COMPACT_BATCH):
+        self.db = db
+        self.compact_batch = compact_batch
+
+    def append(self, c, entries):
+        """Пачка записей (user_id, причина, *приращения, время) в открытой транзакции c"""
+        c.executemany('''INSERT INTO ledger (user_id, reason, credits, experience, races, wins,
+                                             pvp_races, pvp_wins, created_at)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', entries)
+        return len(entries)
+
+    def compact(self):
+        """Свертка журнала в players пачками; (записей, обновлений игроков)"""
+        entries = updated = 0
+        while True:
+            folded, players = self.compact_step()
+            entries += folded
+            updated += players
+            if folded < self.compact_batch:
+                break
+        return entries, updated
+
+    def compact_step(self):
+        """Одна пачка свертки своей транзакцией; (записей, обновлений игроков).
+
+        Пачка меньше compact_batch - журнал свернут до конца.
+        """
+        with self.db.transaction() as c:
+            # Отметка читается под блокировкой записи: свертки шардов не пересекаются
+            mark = c.execute("SELECT compacted_through FROM ledger_state").fetchone()[0]
+            top, count = c.execute("SELECT MAX(entry_id), COUNT(*) FROM ledger WHERE entry_id > ? AND entry_id <= ?",
+                                   (mark, mark + self.compact_batch)).fetchone()
+            if top is None:
+                return 0, 0
+            updated = c.execute('''UPDATE players
+                                   SET balance = players.balance + l.credits,
+                                       experience = players.experience + l.experience,
+                                       races = players.races + l.races,
+                                       wins = players.wins + l.wins,
+                                       pvp_races = players.pvp_races + l.pvp_races,
+                                       pvp_wins = players.pvp_wins + l.pvp_wins,
+                                       level = MAX(players.level, (players.experience + l.experience) / 100 + 1)
+                                   FROM (SELECT user_id, SUM(credits) AS credits, SUM(experience) AS experience,
+                                                SUM(races) AS races, SUM(wins) AS wins,
+                                                SUM(pvp_races) AS pvp_races, SUM(pvp_wins) AS pvp_wins
+                                         FROM ledger WHERE entry_id > ? AND entry_id <= ?
+                                         GROUP BY user_id) AS l
+                                   WHERE players.user_id = l.user_id''', (mark, top)).rowcount
+            c.execute("UPDATE ledger_state SET compacted_through = ?", (top,))
+            return count, updated
+
+    def prune(self, before):
+        """Удаление свернутых записей старше before (unix time); число удаленных"""
+        with self.db.transaction() as c:
+            mark = c.execute("SELECT compacted_through FROM ledger_state").fetchone()[0]
+            # Записи идут по времени: первая свежая - граница, читаются только удаляемые.
+            # Запись на отметке остается: следующий номер выдается после наибольшего
+            kept = c.execute("SELECT entry_id FROM ledger WHERE entry_id < ? AND created_at >= ? "
+                             "ORDER BY entry_id LIMIT 1", (mark, before)).fetchone()
+            bound = kept[0] if kept else mark
+            return c.execute("DELETE FROM ledger WHERE entry_id < ?", (bound,)).rowcount
+
+
+def entry(user_id, reason, delta, now=None):
+    """Запись журнала из приращений writebehind"""
+    return (user_id, reason, *delta, time.time() if now is None else now)
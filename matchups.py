@@ -0,0 +1,88 @@
+import itertools
+
+# Желаемая доля побед игрока против ИИ: новичкам легче, опытным сложнее
+EASY_WIN_RATE = 0.65
+HARD_WIN_RATE = 0.35
+WIN_RATE_STEP = 0.03
+# С этого уровня желаемая доля побед уже не меняется
+MAX_TARGET_LEVEL = int(round((EASY_WIN_RATE - HARD_WIN_RATE) / WIN_RATE_STEP)) + 1
+
+
+class MatchupTable:
+    """Точные вероятности победы, ничьей и поражения для каждой пары машин.
+
+    Удача - два независимых равномерных броска 1..luck, поэтому для пары
+    достаточно перебрать luck² сочетаний, посчитав силы той же моделью и в
+    той же арифметике, что и в гонке, включая совпадения сил (ничьи).
+    """
+
+    def __init__(self, base, model, luck):
+        self.luck = luck
+        self.car_ids = sorted(base)
+        rolls = range(1, luck + 1)
+        powers = {car_id: [model.combine(base[car_id], roll) for roll in rolls] for car_id in self.car_ids}
+        total = luck * luck
+        self._odds = {}
+        for car_a, car_b in itertools.product(self.car_ids, repeat=2):
+            wins = draws = 0
+            for power_a in powers[car_a]:
+                for power_b in powers[car_b]:
+                    if power_a > power_b:
+                        wins += 1
+                    elif power_a == power_b:
+                        draws += 1
+            self._odds[car_a, car_b] = (wins / total, draws / total, (total - wins - draws) / total)
+
+    def get(self, car_a, car_b):
+        """(победа, ничья, поражение) первой машины"""
+        return self._odds[car_a, car_b]
+
+    def win_probability(self, car_a, car_b):
+        return self._odds[car_a, car_b][0]
+
+
+def target_win_rate(level):
+    return max(HARD_WIN_RATE, EASY_WIN_RATE - WIN_RATE_STEP * (level - 1))
+
+
+class Matchmaker:
+    """Выбор ИИ-соперника под уровень игрока по таблице шансов.
+
+    Для машины игрока и уровня берутся два соперника, между шансами против
+    которых лежит желаемая доля побед, и доля, в которой их смешивать, чтобы
+    средний шанс совпал с желаемым (если все соперники по одну сторону -
+    ближайший). План строится один раз на пару (машина, уровень), выбор -
+    одно сравнение; планы пересчитываются, когда движок отдает новую таблицу.
+    """
+
+    def __init__(self, engine, luck):
+        self.engine = engine
+        self.luck = luck
+        self._table = None
+        self._plans = {}
+
+    @staticmethod
+    def _plan(table, car_id, level):
+        target = target_win_rate(level)
+        ranked = sorted((table.win_probability(car_id, rival), rival) for rival in table.car_ids)
+        below = [entry for entry in ranked if entry[0] <= target]
+        above = [entry for entry in ranked if entry[0] >= target]
+        if not below or not above:
+            closest = (above or below)[0 if above else -1][1]
+            return closest, closest, 0.0
+        (low_chance, low), (high_chance, high) = below[-1], above[0]
+        share = (target - low_chance) / (high_chance - low_chance) if high_chance > low_chance else 0.0
+        return low, high, share
+
+    def pick(self, car_id, level, rng=None):
+        """id машины соперника"""
+        table = self.engine.odds(self.luck)
+        if table is not self._table:
+            self._table = table
+            self._plans = {}
+        key = (car_id, min(level, MAX_TARGET_LEVEL))
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = self._plans[key] = self._plan(table, car_id, key[1])
+        low, high, share = plan
+        return high if (rng or self.engine.rng).random() < share else low
@@ -0,0 +1,163 @@
+import asyncio
+import bisect
+import logging
+import time
+
+# Границы корзин гистограмм задержек (с), как принято в Prometheus
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(samples, p):
+    """Точный процентиль p (0-100) по выборке; 0.0 для пустой"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'total', 'count', 'errors')
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        # Последняя корзина - все, что больше верхней границы
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.errors = 0
+
+    def observe(self, seconds, error=False):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        if error:
+            self.errors += 1
+
+    def quantile(self, q):
+        """Оценка квантиля по корзинам (линейно внутри корзины), в секундах"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                low = self.bounds[i - 1] if i else 0.0
+                high = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+
+class Metrics:
+    """Гистограммы задержек по семействам (callback, db, api) и меткам.
+
+    Замер - два вызова perf_counter и bisect, поэтому инструментирование
+    можно держать включенным всегда. Все обновления идут из потока цикла
+    событий: время выполнения в потоке БД фасад передает обратно вместе с
+    результатом.
+    """
+
+    def __init__(self, prefix='racing', bounds=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.bounds = bounds
+        self.families = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def histogram(self, family, label):
+        labels = self.families.setdefault(family, {})
+        histogram = labels.get(label)
+        if histogram is None:
+            histogram = labels[label] = Histogram(self.bounds)
+        return histogram
+
+    def observe(self, family, label, seconds, error=False):
+        self.histogram(family, label).observe(seconds, error)
+
+    def inc(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, fn):
+        """Значение, которое читается в момент выгрузки.
+
+        fn() - число или словарь чисел (например, stats() компонента):
+        словарь читается один раз и дает по gauge name_ключ на каждый ключ.
+        """
+        self.gauges[name] = fn
+
+    async def timed(self, family, label, awaitable):
+        start = time.perf_counter()
+        error = True
+        try:
+            result = await awaitable
+            error = False
+            return result
+        finally:
+            self.observe(family, label, time.perf_counter() - start, error)
+
+    # --- Выгрузка ---
+    def render_prometheus(self):
+        """Текстовый формат экспозиции Prometheus"""
+        lines = []
+        for family, labels in sorted(self.families.items()):
+            name = f"{self.prefix}_{family}_seconds"
+            lines.append(f"# TYPE {name} histogram")
+            for label, histogram in sorted(labels.items()):
+                cumulative = 0
+                for bound, n in zip(self.bounds, histogram.counts):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{{{family}="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{family}="{label}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{{family}="{label}"}} {histogram.total:.6f}')
+                lines.append(f'{name}_count{{{family}="{label}"}} {histogram.count}')
+            errors = f"{self.prefix}_{family}_errors_total"
+            lines.append(f"# TYPE {errors} counter")
+            for label, histogram in sorted(labels.items()):
+                lines.append(f'{errors}{{{family}="{label}"}} {histogram.errors}')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE {self.prefix}_{name}_total counter")
+            lines.append(f"{self.prefix}_{name}_total {value}")
+        for name, fn in sorted(self.gauges.items()):
+            value = fn()
+            values = value.items() if isinstance(value, dict) else ((None, value),)
+            for key, number in values:
+                gauge = f"{self.prefix}_{name}" if key is None else f"{self.prefix}_{name}_{key}"
+                lines.append(f"# TYPE {gauge} gauge")
+                lines.append(f"{gauge} {number}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, family, limit=None):
+        """Строки "метка: число, p50, p99, ошибки", самые затратные по суммарному времени - первыми"""
+        labels = sorted(self.families.get(family, {}).items(), key=lambda item: -item[1].total)
+        lines = []
+        for label, histogram in labels[:limit]:
+            error_rate = histogram.errors / histogram.count if histogram.count else 0.0
+            lines.append(f"{label}: {histogram.count} шт, p50 {histogram.quantile(0.5) * 1000:.1f} мс, "
+                         f"p99 {histogram.quantile(0.99) * 1000:.1f} мс, ошибок {error_rate:.1%}")
+        return lines
+
+    async def serve(self, host, port):
+        """HTTP-эндпоинт /metrics для Prometheus"""
+        async def handle(reader, writer):
+            try:
+                request = await reader.readline()
+                while (await reader.readline()).strip():
+                    pass
+                parts = request.split()
+                if len(parts) > 1 and parts[1].split(b'?')[0] == b'/metrics':
+                    status, body = b"200 OK", self.render_prometheus().encode()
+                else:
+                    status, body = b"404 Not Found", b""
+                writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                             b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+                await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, host, port)
+        logger.info(f"Метрики: http://{host}:{port}/metrics")
+        return server
@@ -0,0 +1,151 @@
+import logging
+
+from storage import retry_busy
+
+logger = logging.getLogger(__name__)
+
+
+def _baseline(conn):
+    """Схема до введения версий. Базы прежних версий бота уже содержат часть
+    таблиц и колонок, поэтому все шаги проверяют, есть ли они"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS players
+                (user_id INTEGER PRIMARY KEY,
+                 username TEXT,
+                 balance INTEGER DEFAULT 1000,
+                 car_id INTEGER DEFAULT 1,
+                 experience INTEGER DEFAULT 0,
+                 level INTEGER DEFAULT 1,
+                 wins INTEGER DEFAULT 0,
+                 races INTEGER DEFAULT 0,
+                 pvp_wins INTEGER DEFAULT 0,
+                 pvp_races INTEGER DEFAULT 0)''')
+
+    columns = {row[1] for row in conn.execute("PRAGMA table_xinfo(players)")}
+    for column in ('pvp_wins', 'pvp_races'):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE players ADD COLUMN {column} INTEGER DEFAULT 0")
+    # Очки рейтинга как вычисляемая колонка, чтобы топ читался по индексу
+    if 'score' not in columns:
+        conn.execute('''ALTER TABLE players ADD COLUMN score INTEGER
+                        GENERATED ALWAYS AS (wins + pvp_wins * 2) VIRTUAL''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_players_score ON players (score DESC, level DESC)")
+
+    # Открытые PvP вызовы переживают перезапуск и видны всем процессам
+    conn.execute('''CREATE TABLE IF NOT EXISTS challenges
+                (challenge_id TEXT PRIMARY KEY,
+                 challenger_id INTEGER NOT NULL,
+                 challenger_name TEXT,
+                 challenger_car_id INTEGER DEFAULT 1,
+                 chat_id INTEGER NOT NULL,
+                 message_id INTEGER,
+                 created_at REAL NOT NULL,
+                 expires_at REAL NOT NULL)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_challenges_expires ON challenges (expires_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_challenges_chat ON challenges (chat_id, expires_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_challenges_user ON challenges (challenger_id, expires_at)")
+
+    # Турниры: набор участников до старта сетки
+    conn.execute('''CREATE TABLE IF NOT EXISTS tournaments
+                (tournament_id TEXT PRIMARY KEY,
+                 host_id INTEGER NOT NULL,
+                 host_name TEXT,
+                 chat_id INTEGER NOT NULL,
+                 message_id INTEGER,
+                 created_at REAL NOT NULL,
+                 expires_at REAL NOT NULL)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS tournament_entries
+                (tournament_id TEXT NOT NULL,
+                 user_id INTEGER NOT NULL,
+                 name TEXT,
+                 car_id INTEGER DEFAULT 1,
+                 joined_at REAL NOT NULL,
+                 PRIMARY KEY (tournament_id, user_id))''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tournaments_expires ON tournaments (expires_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tournaments_host ON tournaments (host_id, expires_at)")
+
+    # Лучшие счета аркады: строка на игрока и игру
+    conn.execute('''CREATE TABLE IF NOT EXISTS game_scores
+                (user_id INTEGER NOT NULL,
+                 game TEXT NOT NULL,
+                 best_score INTEGER NOT NULL,
+                 plays INTEGER NOT NULL DEFAULT 0,
+                 total_score INTEGER NOT NULL DEFAULT 0,
+                 updated_at REAL NOT NULL,
+                 PRIMARY KEY (user_id, game))''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_game_scores_best ON game_scores (game, best_score DESC)")
+
+    # Зерна аркады: одно действующее на игрока, расходуется принятым счетом
+    conn.execute('''CREATE TABLE IF NOT EXISTS arcade_seeds
+                (user_id INTEGER PRIMARY KEY,
+                 seed INTEGER NOT NULL,
+                 expires_at REAL NOT NULL)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_arcade_seeds_expires ON arcade_seeds (expires_at)")
+
+
+def _tournament_order(conn):
+    # Участники турнира читаются в порядке записи - без сортировки во временном B-дереве
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_tournament_entries_joined
+                    ON tournament_entries (tournament_id, joined_at)''')
+
+
+def _ledger(conn):
+    # Журнал экономики: записи только дописываются. Без AUTOINCREMENT (он стоит
+    # лишней страницы sqlite_sequence в WAL на каждый коммит) номера тоже не
+    # повторяются: новый - наибольший плюс один, а prune оставляет запись на отметке
+    conn.execute('''CREATE TABLE IF NOT EXISTS ledger
+                (entry_id INTEGER PRIMARY KEY,
+                 user_id INTEGER NOT NULL,
+                 reason TEXT NOT NULL,
+                 credits INTEGER NOT NULL DEFAULT 0,
+                 experience INTEGER NOT NULL DEFAULT 0,
+                 races INTEGER NOT NULL DEFAULT 0,
+                 wins INTEGER NOT NULL DEFAULT 0,
+                 pvp_races INTEGER NOT NULL DEFAULT 0,
+                 pvp_wins INTEGER NOT NULL DEFAULT 0,
+                 created_at REAL NOT NULL)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ledger_user ON ledger (user_id, entry_id)")
+    # Записи до compacted_through уже свернуты в players
+    conn.execute('''CREATE TABLE IF NOT EXISTS ledger_state
+                (id INTEGER PRIMARY KEY CHECK (id = 1),
+                 compacted_through INTEGER NOT NULL)''')
+    conn.execute("INSERT OR IGNORE INTO ledger_state (id, compacted_through) VALUES (1, 0)")
+
+
+# (версия, описание, шаг); новые шаги только дописываются в конец
+MIGRATIONS = (
+    (1, "исходная схема", _baseline),
+    (2, "порядок участников турнира", _tournament_order),
+    (3, "журнал экономики", _ledger),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """Применяем недостающие шаги схемы; число примененных.
+
+    Версия схемы хранится в PRAGMA user_version. Каждый шаг выполняется в
+    своей транзакции BEGIN IMMEDIATE вместе с записью новой версии, а версия
+    перечитывается уже под блокировкой: шарды, стартующие одновременно,
+    применят каждый шаг ровно один раз. На актуальной базе стоит одного чтения.
+    """
+    if schema_version(conn) >= migrations[-1][0]:
+        return 0
+    applied = 0
+    for version, description, step in migrations:
+        retry_busy(lambda: conn.execute("BEGIN IMMEDIATE"))
+        try:
+            if schema_version(conn) < version:
+                step(conn)
+                # PRAGMA не принимает параметры; version - константа из MIGRATIONS
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                applied += 1
+                logger.info(f"Схема БД: шаг {version} ({description})")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
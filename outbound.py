@@ -0,0 +1,311 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from metrics import percentile
+from ratelimit import BucketMap
+from render import MessageEditor
+
+# Приоритеты отправки: меньше - раньше
+URGENT, NORMAL, BACKGROUND = range(3)
+
+logger = logging.getLogger(__name__)
+
+
+class Deferred(Exception):
+    """Флуд-контроль: задание вернется в очередь через delay секунд"""
+
+    def __init__(self, delay):
+        super().__init__(delay)
+        self.delay = delay
+
+
+class OutboundJob:
+    __slots__ = ('key', 'chat_id', 'kind', 'send', 'content', 'priority', 'seq', 'waiters', 'flood_retries')
+
+    def __init__(self, key, chat_id, kind, send, content, priority):
+        self.key = key
+        self.chat_id = chat_id
+        # Метод API для метрик
+        self.kind = kind
+        self.send = send
+        self.content = content
+        self.priority = priority
+        self.seq = 0
+        # (future или None, время постановки в очередь)
+        self.waiters = []
+        self.flood_retries = 0
+
+
+class OutboundScheduler(MessageEditor):
+    """Очередь исходящих вызовов Bot API с учетом лимитов Telegram.
+
+    Правки одного сообщения (chat_id, message_id) схлопываются: пока правка
+    ждет своей очереди, новая просто заменяет ее содержимое, и в Telegram
+    уходит только последнее. Одновременно по сообщению летит не больше
+    одного запроса, так что правки не обгоняют друг друга. Вызовы выходят
+    по приоритету, если есть токены в глобальной корзине и в корзине чата
+    (для групп лимит строже). На RetryAfter чат замолкает на указанное
+    время, а задание освобождает слот и ждет в очереди отложенных - чаты
+    под флуд-контролем не задерживают остальных. На сетевые ошибки -
+    повтор с растущей паузой. backlog(chat_id) - сколько вызовов чата ждут
+    отправки: по нему CallbackLimiter отклоняет нажатия в чат, который
+    Telegram не успевает обслужить, и обработчики не копятся в ожидании.
+    """
+
+    def __init__(self, rate=30.0, chat_rate=1.0, group_rate=20 / 60, chat_burst=3, max_in_flight=8,
+                 max_retries=3, backoff=0.5, capacity=10000, clock=time.monotonic, metrics=None):
+        super().__init__(capacity)
+        # Время каждого вызова Bot API (семейство api)
+        self.metrics = metrics
+        self.global_bucket = BucketMap(rate, max(1, int(rate)))
+        self.chats = BucketMap(chat_rate, chat_burst)
+        self.groups = BucketMap(group_rate, chat_burst)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.clock = clock
+        self.coalesced = 0
+        self.retries = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=10000)
+        self._pending = {}
+        self._in_flight = set()
+        # chat_id -> заданий в очереди и в полете
+        self._backlog = {}
+        self._ready = []
+        self._delayed = []
+        self._seq = itertools.count()
+        self._loop = None
+
+    # --- Постановка в очередь ---
+    async def edit(self, query, text, reply_markup=None, priority=NORMAL, wait=True, **kwargs):
+        """Правка сообщения кнопки; wait=False - не ждать отправки (промежуточный экран).
+
+        Возвращает True, если правка отправлена, и False, если она не нужна
+        (содержимое уже такое).
+        """
+        key = self.message_key(query)
+        content = (text, reply_markup)
+        if key is None:
+            key = object()
+        elif key not in self._pending and key not in self._in_flight and self.unchanged(key, content):
+            return False
+        chat_id = query.message.chat_id if query.message is not None else None
+        return await self._submit(key, chat_id, 'edit_message_text',
+                                  lambda: query.edit_message_text(text, reply_markup=reply_markup, **kwargs),
+                                  content, priority, wait)
+
+    async def call(self, chat_id, fn, *args, priority=NORMAL, wait=True, **kwargs):
+        """Произвольный вызов API (например, reply_text) под теми же лимитами, без схлопывания"""
+        return await self._submit(object(), chat_id, getattr(fn, '__name__', 'call'), lambda: fn(*args, **kwargs),
+                                  None, priority, wait)
+
+    async def _submit(self, key, chat_id, kind, send, content, priority, wait):
+        self._ensure_worker()
+        future = self._loop.create_future() if wait else None
+        job = self._pending.get(key)
+        if job is not None:
+            # Новое содержимое вытесняет еще не отправленное
+            self.coalesced += 1
+            job.send, job.content = send, content
+            if priority < job.priority:
+                job.priority = priority
+                self._push(job)
+        else:
+            job = self._pending[key] = OutboundJob(key, chat_id, kind, send, content, priority)
+            self._count(chat_id, 1)
+            if key not in self._in_flight:
+                self._push(job)
+        job.waiters.append((future, self.clock()))
+        self._wake.set()
+        return await future if wait else None
+
+    def backlog(self, chat_id):
+        """Вызовов чата в очереди и в полете"""
+        return self._backlog.get(chat_id, 0)
+
+    def _count(self, chat_id, delta):
+        if chat_id is None:
+            return
+        count = self._backlog.get(chat_id, 0) + delta
+        if count > 0:
+            self._backlog[chat_id] = count
+        else:
+            self._backlog.pop(chat_id, None)
+
+    def _push(self, job):
+        job.seq = next(self._seq)
+        heapq.heappush(self._ready, (job.priority, job.seq, job.key))
+
+    # --- Выдача по лимитам ---
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Новый цикл событий (перезапуск приложения): очередь прежнего не переживает
+            self._loop = loop
+            self._wake = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._tasks = set()
+            self._pending.clear()
+            self._in_flight.clear()
+            self._backlog.clear()
+            self._ready, self._delayed = [], []
+            self._worker = loop.create_task(self._run())
+
+    def _buckets(self, chat_id):
+        return self.groups if chat_id < 0 else self.chats
+
+    def _bucket(self, chat_id, now):
+        if chat_id is None:
+            return None
+        return self._buckets(chat_id).peek(chat_id, now)
+
+    def _next(self, now):
+        """Следующее задание, которое можно отправить, или (None, сколько ждать)"""
+        while self._delayed and self._delayed[0][0] <= now:
+            _, seq, key = heapq.heappop(self._delayed)
+            job = self._pending.get(key)
+            if job is not None and job.seq == seq:
+                heapq.heappush(self._ready, (job.priority, seq, key))
+        wait = self._delayed[0][0] - now if self._delayed else None
+        global_bucket = self.global_bucket.peek(0, now)
+        if global_bucket.tokens < 1:
+            pause = (1 - global_bucket.tokens) / self.global_bucket.rate
+            return None, pause if wait is None else min(wait, pause)
+        while self._ready:
+            priority, seq, key = heapq.heappop(self._ready)
+            job = self._pending.get(key)
+            if job is None or job.seq != seq or key in self._in_flight:
+                # Устаревшая запись кучи; задание в полете вернется в кучу по завершении
+                continue
+            bucket = self._bucket(job.chat_id, now)
+            if bucket is not None and bucket.tokens < 1:
+                rate = self._buckets(job.chat_id).rate
+                heapq.heappush(self._delayed, (now + (1 - bucket.tokens) / rate, seq, key))
+                wait = self._delayed[0][0] - now
+                continue
+            if bucket is not None:
+                bucket.tokens -= 1
+            global_bucket.tokens -= 1
+            del self._pending[key]
+            self._in_flight.add(key)
+            return job, None
+        return None, wait
+
+    async def _run(self):
+        while True:
+            job, wait = self._next(self.clock())
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._slots.acquire()
+            task = self._loop.create_task(self._deliver(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    # --- Отправка ---
+    async def _deliver(self, job):
+        deferred = None
+        try:
+            result = await self._send(job)
+        except Deferred as e:
+            deferred = e.delay
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Не удалось отправить в чат {job.chat_id}: {e}")
+            self._resolve(job, exception=e)
+        else:
+            self._resolve(job, result)
+        finally:
+            self._in_flight.discard(job.key)
+            if deferred is not None:
+                self._defer(job, deferred)
+            else:
+                self._count(job.chat_id, -1)
+                if job.key in self._pending:
+                    self._push(self._pending[job.key])
+            self._slots.release()
+            self._wake.set()
+
+    async def _send(self, job):
+        for attempt in itertools.count():
+            if self.unchanged(job.key, job.content):
+                return False
+            send = job.send if self.metrics is None else lambda: self.metrics.timed('api', job.kind, job.send())
+            try:
+                return await self.apply(job.key, job.content, send)
+            except RetryAfter as e:
+                if job.flood_retries >= self.max_retries:
+                    raise
+                job.flood_retries += 1
+                self.retries += 1
+                # Флуд-контроль: чат молчит, пока Telegram не разрешит
+                bucket = self._bucket(job.chat_id, self.clock())
+                if bucket is not None:
+                    bucket.tokens = min(bucket.tokens, 1 - e.retry_after * self._buckets(job.chat_id).rate)
+                raise Deferred(e.retry_after)
+            except BadRequest:
+                # "not modified" разобрал apply, остальное не повторяем
+                raise
+            except NetworkError:
+                if attempt >= self.max_retries:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+            # Пока ждали, могло прийти более новое содержимое - отправляем его
+            newer = self._pending.pop(job.key, None)
+            if newer is not None:
+                job.send, job.content = newer.send, newer.content
+                job.waiters.extend(newer.waiters)
+                self.coalesced += 1
+                self._count(job.chat_id, -1)
+
+    def _defer(self, job, delay):
+        """Задание после RetryAfter - в отложенные; более новое содержимое заменяет его"""
+        newer = self._pending.get(job.key)
+        if newer is not None:
+            self.coalesced += 1
+            self._count(job.chat_id, -1)
+            newer.waiters[:0] = job.waiters
+            newer.flood_retries = job.flood_retries
+            job = newer
+        else:
+            self._pending[job.key] = job
+        job.seq = next(self._seq)
+        heapq.heappush(self._delayed, (self.clock() + delay, job.seq, job.key))
+
+    def _resolve(self, job, result=None, exception=None):
+        now = self.clock()
+        for future, queued_at in job.waiters:
+            self.latencies.append(now - queued_at)
+            if future is None or future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        latencies = list(self.latencies)
+        return {
+            'queue_depth': len(self._pending),
+            'in_flight': len(self._in_flight),
+            'backlogged_chats': len(self._backlog),
+            'sent': self.sent,
+            'skipped': self.skipped,
+            'coalesced': self.coalesced,
+            'retries': self.retries,
+            'failed': self.failed,
+            'latency_p50_ms': percentile(latencies, 50) * 1000,
+            'latency_p99_ms': percentile(latencies, 99) * 1000,
+        }
@@ -0,0 +1,108 @@
+import random
+
+from matchups import MatchupTable
+
+try:
+    import numpy as np
+except ImportError:  # NumPy не обязателен: пакетный путь работает и на random
+    np = None
+
+# Чем считаются пачки гонок; с одним seed NumPy и random дают разные исходы
+BATCH_BACKEND = 'numpy' if np is not None else 'random'
+
+# Разброс удачи: randint(1, N) к силе машины
+PVE_LUCK = 10
+PVP_LUCK = 15
+
+# Исходы гонки для первой машины пары
+WIN, DRAW, LOSS = 1, 0, -1
+
+
+class PhysicsModel:
+    """Сила машины в гонке: взвешенная сумма характеристик плюс удача.
+
+    Другая модель подставляется наследованием: base_power считается по
+    характеристикам машины, combine складывает базу с броском удачи и
+    должен работать как с числами, так и с массивами NumPy.
+    """
+
+    def __init__(self, speed=2, acceleration=1.5, handling=1.2):
+        self.speed = speed
+        self.acceleration = acceleration
+        self.handling = handling
+
+    def base_power(self, car):
+        return car.speed * self.speed + car.acceleration * self.acceleration + car.handling * self.handling
+
+    def combine(self, base, roll):
+        return base + roll
+
+
+class RaceEngine:
+    """Симуляция гонок по характеристикам машин game.cars (records.Car).
+
+    Одиночная гонка считается на random.Random, пачка гонок - одним
+    векторным проходом NumPy (без NumPy - циклом на том же генераторе).
+    Генераторы засеваются от seed движка, поэтому с тем же seed и той же
+    последовательностью вызовов результаты повторяются.
+    """
+
+    def __init__(self, cars, model=None, seed=None):
+        self.model = model or PhysicsModel()
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.load(cars)
+
+    def load(self, cars):
+        """Пересчет базовой силы машин и сброс таблиц шансов (после изменения каталога)"""
+        self.cars = cars
+        self.base = {car_id: self.model.base_power(car) for car_id, car in cars.items()}
+        self._odds = {}
+        if np is not None:
+            # Индекс массива - id машины
+            self._base_array = np.zeros(max(cars) + 1)
+            for car_id, base in self.base.items():
+                self._base_array[car_id] = base
+
+    def odds(self, luck=PVE_LUCK):
+        """Точная таблица шансов для разброса удачи; строится один раз на каталог"""
+        table = self._odds.get(luck)
+        if table is None:
+            table = self._odds[luck] = MatchupTable(self.base, self.model, luck)
+        return table
+
+    def power(self, car, luck=PVE_LUCK, rng=None):
+        return self.model.combine(self.model.base_power(car), (rng or self.rng).randint(1, luck))
+
+    def race(self, car_a, car_b, luck=PVE_LUCK, rng=None):
+        """Силы двух машин в одной гонке; победитель - у кого больше"""
+        rng = rng or self.rng
+        return self.power(car_a, luck, rng), self.power(car_b, luck, rng)
+
+    def race_batch(self, cars_a, cars_b, luck=PVE_LUCK, seed=None):
+        """Исходы гонок пар машин (по id): WIN - первой, LOSS - второй, DRAW - ничья"""
+        if seed is None:
+            seed = self.rng.getrandbits(64)
+        if np is None:
+            rng = random.Random(seed)
+            base, combine = self.base, self.model.combine
+            outcomes = []
+            for car_a, car_b in zip(cars_a, cars_b):
+                power_a = combine(base[car_a], rng.randint(1, luck))
+                power_b = combine(base[car_b], rng.randint(1, luck))
+                outcomes.append(WIN if power_a > power_b else LOSS if power_a < power_b else DRAW)
+            return outcomes
+        rng = np.random.default_rng(seed)
+        cars_a, cars_b = np.asarray(cars_a), np.asarray(cars_b)
+        power_a = self.model.combine(self._base_array[cars_a], rng.integers(1, luck + 1, size=len(cars_a)))
+        power_b = self.model.combine(self._base_array[cars_b], rng.integers(1, luck + 1, size=len(cars_b)))
+        return np.sign(power_a - power_b).astype(np.int8)
+
+    def estimate(self, car_a, car_b, luck=PVE_LUCK, trials=100000, seed=None):
+        """Оценка Монте-Карло: доли (побед, ничьих, поражений) первой машины"""
+        outcomes = self.race_batch([car_a] * trials, [car_b] * trials, luck, seed)
+        if np is not None:
+            wins, draws = int(np.count_nonzero(outcomes == WIN)), int(np.count_nonzero(outcomes == DRAW))
+        else:
+            wins, draws = outcomes.count(WIN), outcomes.count(DRAW)
+        return wins / trials, draws / trials, (trials - wins - draws) / trials
@@ -0,0 +1,105 @@
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+
+
+class BucketMap:
+    """Корзины токенов по ключу с ограничением числа хранимых ключей"""
+
+    def __init__(self, rate, burst, capacity=100000):
+        self.rate = rate
+        self.burst = burst
+        self.capacity = capacity
+        self._buckets = OrderedDict()
+
+    def peek(self, key, now):
+        """Доступные токены с учетом пополнения, без списания"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.burst, now)
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.capacity:
+                # Дольше всех молчавший ключ давно накопил полную корзину
+                self._buckets.popitem(last=False)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class CallbackLimiter:
+    """Ограничение частоты нажатий по пользователю и по чату.
+
+    Нажатие проходит, только если токен есть и в корзине пользователя, и в
+    корзине чата. Повторное нажатие той же кнопки того же сообщения, пока
+    первое еще обрабатывается, схлопывается с ним. backlog(chat_id) - сколько
+    исходящих вызовов чата еще не отправлено (OutboundScheduler.backlog):
+    при max_backlog и больше нажатия в чат отклоняются, пока очередь не сойдет.
+    """
+
+    def __init__(self, user_rate=1.0, user_burst=4, chat_rate=3.0, chat_burst=10, clock=time.monotonic,
+                 backlog=None, max_backlog=10):
+        self.users = BucketMap(user_rate, user_burst)
+        self.chats = BucketMap(chat_rate, chat_burst)
+        self.clock = clock
+        self.backlog = backlog
+        self.max_backlog = max_backlog
+        self.allowed = 0
+        self.rejected = 0
+        self.backlogged = 0
+        self.coalesced = 0
+        self._in_flight = set()
+
+    def allow(self, user_id, chat_id):
+        if self.backlog is not None and self.backlog(chat_id) >= self.max_backlog:
+            self.backlogged += 1
+            self.rejected += 1
+            return False
+        now = self.clock()
+        user = self.users.peek(user_id, now)
+        chat = self.chats.peek(chat_id, now)
+        if user.tokens < 1 or chat.tokens < 1:
+            self.rejected += 1
+            return False
+        user.tokens -= 1
+        chat.tokens -= 1
+        self.allowed += 1
+        return True
+
+    def in_flight(self, key):
+        if key in self._in_flight:
+            self.coalesced += 1
+            return True
+        return False
+
+    @contextmanager
+    def track(self, key):
+        """Отмечаем нажатие как обрабатываемое до выхода из блока"""
+        self._in_flight.add(key)
+        try:
+            yield
+        finally:
+            self._in_flight.discard(key)
+
+    def stats(self):
+        return {
+            'allowed': self.allowed,
+            'rejected': self.rejected,
+            'backlogged': self.backlogged,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._in_flight),
+            'tracked_users': len(self.users),
+            'tracked_chats': len(self.chats),
+        }
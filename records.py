@@ -0,0 +1,67 @@
+class Player:
+    """Запись игрока: строка players без вычисляемой score.
+
+    Поля по именам вместо позиций кортежа, а __slots__ делает запись
+    меньше списка из тех же десяти полей - это основной объем кэша игроков.
+    Запись изменяемая: кэш обновляет ее на месте в потоке БД, обработчики
+    получают ее из get_player только для чтения, топ хранит свои копии.
+    """
+
+    __slots__ = ('user_id', 'username', 'balance', 'car_id', 'experience', 'level',
+                 'wins', 'races', 'pvp_wins', 'pvp_races')
+
+    def __init__(self, user_id, username, balance=1000, car_id=1, experience=0, level=1,
+                 wins=0, races=0, pvp_wins=0, pvp_races=0):
+        self.user_id = user_id
+        self.username = username
+        self.balance = balance
+        self.car_id = car_id
+        self.experience = experience
+        self.level = level
+        self.wins = wins
+        self.races = races
+        self.pvp_wins = pvp_wins
+        self.pvp_races = pvp_races
+
+    @property
+    def score(self):
+        """Очки рейтинга: PvP победа считается за две"""
+        return self.wins + self.pvp_wins * 2
+
+    def copy(self):
+        return Player(self.user_id, self.username, self.balance, self.car_id, self.experience, self.level,
+                      self.wins, self.races, self.pvp_wins, self.pvp_races)
+
+    def astuple(self):
+        return (self.user_id, self.username, self.balance, self.car_id, self.experience, self.level,
+                self.wins, self.races, self.pvp_wins, self.pvp_races)
+
+    def __eq__(self, other):
+        if not isinstance(other, Player):
+            return NotImplemented
+        return self.astuple() == other.astuple()
+
+    def __repr__(self):
+        return f"Player{self.astuple()!r}"
+
+
+def player_row(cursor, row):
+    """row_factory для SELECT {PLAYER_COLUMNS}: запись сразу из строки sqlite3"""
+    return Player(*row)
+
+
+class Car:
+    """Машина каталога game.cars"""
+
+    __slots__ = ('car_id', 'name', 'price', 'speed', 'acceleration', 'handling')
+
+    def __init__(self, car_id, name, price, speed, acceleration, handling):
+        self.car_id = car_id
+        self.name = name
+        self.price = price
+        self.speed = speed
+        self.acceleration = acceleration
+        self.handling = handling
+
+    def __repr__(self):
+        return f"Car({self.car_id}, {self.name!r}, price={self.price})"
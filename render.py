@@ -0,0 +1,123 @@
+from collections import OrderedDict
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+
+class RenderCache:
+    """Кэш готовых клавиатур и текстов экранов.
+
+    Разметка гаража зависит только от текущей машины и от того, сколько машин
+    игрок может себе позволить, поэтому на весь каталог хватает нескольких
+    десятков вариантов. Текст топа хранится вместе с версией рейтинга и
+    пересобирается, только когда рейтинг изменился.
+    """
+
+    def __init__(self, callback_data):
+        # callback_data(имя_маршрута, *аргументы) -> строка для кнопки
+        self.callback_data = callback_data
+        self._garage = {}
+        self._top = (None, None)
+
+    @staticmethod
+    def affordable_tier(cars, balance):
+        """Сколько машин по цене не дороже баланса"""
+        return sum(1 for car in cars.values() if balance >= car.price)
+
+    def garage_markup(self, cars, current_car_id, balance):
+        key = (current_car_id, self.affordable_tier(cars, balance))
+        markup = self._garage.get(key)
+        if markup is None:
+            markup = self._garage[key] = build_garage_markup(cars, current_car_id, balance, self.callback_data)
+        return markup
+
+    def top_text(self, version):
+        """Текст топа для данной версии рейтинга или None"""
+        cached_version, text = self._top
+        return text if cached_version == version else None
+
+    def store_top_text(self, version, text):
+        self._top = (version, text)
+        return text
+
+
+def build_garage_markup(cars, current_car_id, balance, callback_data):
+    keyboard = []
+    for car_id, car in cars.items():
+        if car_id == current_car_id:
+            status = "✅ ВАШ АВТОМОБИЛЬ"
+            data = callback_data("none")
+        elif balance >= car.price:
+            status = f"🛒 Купить за {car.price} кредитов"
+            data = callback_data("buy", car_id)
+        else:
+            status = f"❌ Недостаточно средств ({car.price})"
+            data = callback_data("none")
+
+        car_info = f"{car.name}\n🚀{car.speed} ⚡{car.acceleration} 🎯{car.handling} - {status}"
+        keyboard.append([InlineKeyboardButton(car_info, callback_data=data)])
+
+    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data=callback_data("main"))])
+    return InlineKeyboardMarkup(keyboard)
+
+
+class MessageEditor:
+    """Редактирование сообщений без холостых вызовов API.
+
+    Помнит последнее отправленное содержимое каждого сообщения и пропускает
+    edit_message_text, если текст и клавиатура не изменились: это экономит
+    и разбор на нашей стороне, и запрос к Telegram.
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.sent = 0
+        self.skipped = 0
+        self._last = OrderedDict()
+
+    @staticmethod
+    def message_key(query):
+        if query.message is not None:
+            return (query.message.chat_id, query.message.message_id)
+        return getattr(query, 'inline_message_id', None)
+
+    def remember(self, key, content):
+        if key is None:
+            return
+        self._last[key] = content
+        self._last.move_to_end(key)
+        while len(self._last) > self.capacity:
+            self._last.popitem(last=False)
+
+    def unchanged(self, key, content):
+        """Содержимое уже на экране - правка не нужна"""
+        if key is None or content is None or self._last.get(key) != content:
+            return False
+        self.skipped += 1
+        return True
+
+    async def apply(self, key, content, send):
+        """Вызов правки send(); True - отправлена, False - Telegram ответил "not modified" """
+        try:
+            await send()
+        except BadRequest as e:
+            # Сообщение уже в таком виде (например, после перезапуска бота)
+            if "not modified" not in str(e).lower():
+                raise
+            self.skipped += 1
+            sent = False
+        else:
+            self.sent += 1
+            sent = True
+        if content is not None:
+            self.remember(key, content)
+        return sent
+
+    async def edit(self, query, text, reply_markup=None, **kwargs):
+        """Правка сообщения кнопки; False, если она не понадобилась"""
+        key = self.message_key(query)
+        content = (text, reply_markup)
+        if self.unchanged(key, content):
+            return False
+        return await self.apply(key, content,
+                                lambda: query.edit_message_text(text, reply_markup=reply_markup, **kwargs))
@@ -0,0 +1,162 @@
+import json
+import re
+import time
+from collections import OrderedDict
+
+from arcade import MAX_ROUND
+
+# Игры WebApp, счет которых принимается
+GAMES = {'racer'}
+# Telegram отдает web_app_data не длиннее 4096 байт
+MAX_PAYLOAD = 4096
+# В аркаде за каждую объеханную машину дается 10 очков
+SCORE_STEP = 10
+MAX_SCORE = 100000
+# Награда за игру: кредиты и опыт от счета, но не больше чем за MAX_REWARDED_SCORE очков
+CREDITS_PER_POINT = 0.5
+EXPERIENCE_PER_POINT = 0.05
+MAX_REWARDED_SCORE = 2000
+
+# Зерно, выданное ботом: 8 шестнадцатеричных цифр
+_SEED = re.compile(r'[0-9a-f]{8}')
+
+# Результат приема счета
+ACCEPTED, DUPLICATE, REJECTED = range(3)
+
+
+def parse_score(data):
+    """(игра, счет, прогон) из web_app_data; ValueError, если данные не от аркады или счет невозможен.
+
+    Прогон - (зерно, раунд, кадров, журнал ходов) для проверки в arcade.verify_run
+    или None, если WebApp запущен без зерна.
+    """
+    if len(data.encode()) > MAX_PAYLOAD:
+        raise ValueError("слишком длинные данные")
+    payload = json.loads(data)
+    if not isinstance(payload, dict) or payload.get('action') != 'game_score':
+        raise ValueError("не счет игры")
+    game = payload.get('game')
+    if game not in GAMES:
+        raise ValueError(f"неизвестная игра {game!r}")
+    score = payload.get('score')
+    # bool - тоже int в Python
+    if type(score) is not int or not 0 <= score <= MAX_SCORE or score % SCORE_STEP:
+        raise ValueError(f"некорректный счет {score!r}")
+    seed = payload.get('seed')
+    if not seed:
+        return game, score, None
+    if not isinstance(seed, str) or not _SEED.fullmatch(seed):
+        raise ValueError(f"некорректное зерно {seed!r}")
+    round_index, ticks, moves = payload.get('round'), payload.get('ticks'), payload.get('moves')
+    if type(round_index) is not int or not 0 <= round_index <= MAX_ROUND:
+        raise ValueError(f"некорректный раунд {round_index!r}")
+    if type(ticks) is not int or ticks < 0 or not isinstance(moves, str):
+        raise ValueError("некорректный журнал игры")
+    return game, score, (int(seed, 16), round_index, ticks, moves)
+
+
+def score_reward(score):
+    """(кредиты, опыт) за игру"""
+    rewarded = min(score, MAX_REWARDED_SCORE)
+    return int(rewarded * CREDITS_PER_POINT), int(rewarded * EXPERIENCE_PER_POINT)
+
+
+class ScoreBuffer:
+    """Буфер счетов аркады до записи в game_scores.
+
+    По каждой паре (игрок, игра) копятся лучший счет, число игр и сумма
+    очков, поэтому запись пачки - по одному upsert на игрока, сколько бы
+    счетов он ни прислал. Повторы отсекаются на входе в пределах окна: то
+    же сообщение (chat_id, message_id) - повторная доставка обновления, то же
+    зерно - двойное нажатие "Поделиться" в одной игре. Одинаковые счета из
+    разных игр - разные игры. Потраченные зерна копятся здесь же и удаляются
+    из arcade_seeds в транзакции записи счетов. Используется только из
+    потока БД.
+    """
+
+    def __init__(self, max_pending=500, dedupe_window=60, capacity=100000, clock=time.monotonic):
+        self.max_pending = max_pending
+        self.dedupe_window = dedupe_window
+        self.capacity = capacity
+        self.clock = clock
+        self.pending = {}
+        # (user_id, зерно), принятые после последней записи
+        self.seeds = set()
+        self.submissions = 0
+        self.accepted = 0
+        self.duplicates = 0
+        self.flushes = 0
+        # Ключ повтора -> момент, до которого он считается повтором (по возрастанию)
+        self._seen = OrderedDict()
+
+    def _keys(self, user_id, message_key, seed):
+        keys = []
+        if message_key is not None:
+            keys.append(('message', message_key))
+        if seed is not None:
+            keys.append(('seed', user_id, seed))
+        return keys
+
+    def is_duplicate(self, user_id, message_key=None, seed=None):
+        """Повтор ли это, без учета счета (проверка до расхода зерна)"""
+        now = self.clock()
+        while self._seen:
+            key, expires = next(iter(self._seen.items()))
+            if expires > now and len(self._seen) <= self.capacity:
+                break
+            self._seen.popitem(last=False)
+        return any(key in self._seen for key in self._keys(user_id, message_key, seed))
+
+    def add(self, user_id, game, score, message_key=None, seed=None):
+        if self.is_duplicate(user_id, message_key, seed):
+            self.duplicates += 1
+            return DUPLICATE
+        expires = self.clock() + self.dedupe_window
+        for key in self._keys(user_id, message_key, seed):
+            self._seen[key] = expires
+        if seed is not None:
+            self.seeds.add((user_id, seed))
+
+        entry = self.pending.get((user_id, game))
+        if entry is None:
+            self.pending[user_id, game] = [score, 1, score]
+        else:
+            entry[0] = max(entry[0], score)
+            entry[1] += 1
+            entry[2] += score
+        self.submissions += 1
+        self.accepted += 1
+        return ACCEPTED
+
+    @property
+    def full(self):
+        return self.submissions >= self.max_pending
+
+    def spent(self, user_id, seed):
+        """Зерно уже принято, но еще не удалено из arcade_seeds"""
+        return (user_id, seed) in self.seeds
+
+    def best(self, user_id, game):
+        """Лучший еще не записанный счет или 0"""
+        entry = self.pending.get((user_id, game))
+        return entry[0] if entry else 0
+
+    def take(self):
+        """(счета, потраченные зерна) для записи; буфер очищается"""
+        pending, self.pending = self.pending, {}
+        seeds, self.seeds = self.seeds, set()
+        self.submissions = 0
+        return pending, seeds
+
+    def restore(self, pending, seeds=()):
+        """Возвращаем счета и зерна обратно после неудачной записи"""
+        self.seeds.update(seeds)
+        for key, (best, plays, total) in pending.items():
+            entry = self.pending.get(key)
+            if entry is None:
+                self.pending[key] = [best, plays, total]
+            else:
+                entry[0] = max(entry[0], best)
+                entry[1] += plays
+                entry[2] += total
+            self.submissions += plays
@@ -0,0 +1,191 @@
+import asyncio
+import hmac
+import json
+import logging
+import multiprocessing
+import signal
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Сообщения обновления, из которых берется чат
+MESSAGE_KEYS = ('message', 'edited_message', 'channel_post', 'edited_channel_post')
+
+# Пауза getUpdates после ошибки (с): удваивается с каждой ошибкой подряд до предела
+POLL_BACKOFF = 1
+POLL_BACKOFF_MAX = 60
+
+
+def update_chat_id(data):
+    """chat_id сырого обновления (dict из JSON) без разбора в объекты PTB.
+
+    Нажатие кнопки относится к чату сообщения с кнопкой; обновления без
+    чата (inline-запросы и т.п.) - к личному чату отправителя.
+    """
+    for key in MESSAGE_KEYS:
+        message = data.get(key)
+        if message:
+            return message['chat']['id']
+    query = data.get('callback_query')
+    if query:
+        message = query.get('message')
+        return message['chat']['id'] if message else query['from']['id']
+    for value in data.values():
+        if isinstance(value, dict):
+            sender = value.get('from') or value.get('chat') or value.get('user')
+            if isinstance(sender, dict) and 'id' in sender:
+                return sender['id']
+    return 0
+
+
+def shard_of(chat_id, shards):
+    return chat_id % shards
+
+
+def poll_delay(failures, retry_after=None):
+    """Пауза перед повтором getUpdates: retry_after от Telegram или растущая"""
+    if retry_after:
+        return retry_after
+    return min(POLL_BACKOFF * 2 ** (failures - 1), POLL_BACKOFF_MAX)
+
+
+def secret_matches(header, secret_token):
+    """Сравнение секрета webhook за постоянное время; байты, чтобы не-ASCII заголовок получил 403"""
+    return hmac.compare_digest(header.encode(), secret_token.encode())
+
+
+class Coordinator:
+    """Прием обновлений и раздача их процессам-обработчикам по chat_id.
+
+    Все обновления одного чата попадают в один процесс и в порядке
+    поступления, поэтому вызов и его принятие в группе обрабатываются одним
+    шардом. Координатор только читает chat_id из JSON и кладет сырые
+    обновления в очередь шарда; разбор и обработку делают воркеры.
+    Воркеры запускаются через spawn: соединения SQLite и цикл событий не
+    переживают fork.
+    """
+
+    def __init__(self, worker, shards):
+        context = multiprocessing.get_context('spawn')
+        self.shards = shards
+        self.queues = [context.Queue() for _ in range(shards)]
+        self.processes = [context.Process(target=worker, args=(index, queue), name=f"race-shard-{index}")
+                          for index, queue in enumerate(self.queues)]
+        self.dispatched = [0] * shards
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def dispatch(self, updates):
+        """Раскладываем пачку обновлений по шардам, одна запись очереди на шард"""
+        batches = {}
+        for data in updates:
+            batches.setdefault(shard_of(update_chat_id(data), self.shards), []).append(data)
+        for index, batch in batches.items():
+            self.queues[index].put(batch)
+            self.dispatched[index] += len(batch)
+
+    def stop(self, timeout=30):
+        """Воркеры дорабатывают очередь, сбрасывают статистику и завершаются"""
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.error(f"{process.name} не завершился за {timeout} с")
+                process.terminate()
+        logger.info(f"Обновлений по шардам: {self.dispatched}")
+
+    async def poll(self, api_url, timeout=10, transport=None):
+        """Long polling getUpdates без разбора обновлений в объекты PTB.
+
+        Ответ {"ok": false} (409 - второй получатель, 401 - неверный токен)
+        не считается пустой пачкой: повтор ждет retry_after или растущую паузу.
+        """
+        offset = 0
+        failures = 0
+        async with httpx.AsyncClient(timeout=timeout + 10, transport=transport) as client:
+            await client.post(f"{api_url}/deleteWebhook")
+            try:
+                while True:
+                    try:
+                        response = await client.post(f"{api_url}/getUpdates",
+                                                     json={'offset': offset, 'timeout': timeout})
+                        data = response.json()
+                    except (httpx.HTTPError, ValueError) as e:
+                        failures += 1
+                        delay = poll_delay(failures)
+                        logger.warning(f"Ошибка getUpdates: {e}, повтор через {delay} с")
+                        await asyncio.sleep(delay)
+                        continue
+                    if not data.get('ok'):
+                        failures += 1
+                        delay = poll_delay(failures, (data.get('parameters') or {}).get('retry_after'))
+                        logger.error(f"getUpdates: {data.get('error_code')} {data.get('description')}, "
+                                     f"повтор через {delay} с")
+                        await asyncio.sleep(delay)
+                        continue
+                    failures = 0
+                    updates = data.get('result') or []
+                    if updates:
+                        offset = updates[-1]['update_id'] + 1
+                        self.dispatch(updates)
+            finally:
+                # Подтверждаем последнюю пачку, чтобы она не пришла повторно после перезапуска
+                if offset:
+                    await client.post(f"{api_url}/getUpdates", json={'offset': offset, 'timeout': 0})
+
+    async def serve_webhook(self, api_url, listen, port, url_path, webhook_url, secret_token):
+        """HTTP-сервер webhook; запросы без верного секрета получают 403"""
+        # tornado ставится вместе с python-telegram-bot[webhooks]
+        from tornado.httpserver import HTTPServer
+        from tornado.web import Application as WebApplication, RequestHandler
+
+        coordinator = self
+
+        class WebhookHandler(RequestHandler):
+            def post(self):
+                secret = self.request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+                if not secret_matches(secret, secret_token):
+                    self.set_status(403)
+                    return
+                try:
+                    data = json.loads(self.request.body)
+                except ValueError:
+                    self.set_status(400)
+                    return
+                coordinator.dispatch([data])
+
+        server = HTTPServer(WebApplication([(f"/{url_path}/?", WebhookHandler)]))
+        server.listen(port, listen)
+        try:
+            async with httpx.AsyncClient() as client:
+                await client.post(f"{api_url}/setWebhook", json={'url': webhook_url, 'secret_token': secret_token})
+            await asyncio.Event().wait()
+        finally:
+            server.stop()
+
+    def run(self, ingest):
+        """Запуск воркеров и приема обновлений до SIGINT/SIGTERM"""
+        self.start()
+        try:
+            asyncio.run(self._run(ingest))
+        finally:
+            self.stop()
+
+    async def _run(self, ingest):
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        task = asyncio.create_task(ingest)
+        stopped = asyncio.create_task(stop.wait())
+        await asyncio.wait((task, stopped), return_when=asyncio.FIRST_COMPLETED)
+        task.cancel()
+        stopped.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,231 @@
+import asyncio
+import functools
+import logging
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# --- Настройки соединения ---
+# WAL позволяет читателям не ждать писателя, synchronous=NORMAL в режиме WAL
+# безопасен при падении процесса и избавляет от fsync на каждый commit.
+# busy_timeout идет первым: переключение в WAL тоже может ждать другой процесс.
+PRAGMAS = (
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+)
+
+# Повторы, если база занята другим процессом дольше busy_timeout
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+def is_busy(error):
+    return isinstance(error, sqlite3.OperationalError) and 'locked' in str(error)
+
+
+def retry_busy(fn, retries=BUSY_RETRIES, backoff=BUSY_BACKOFF):
+    """Вызов fn с повтором при "database is locked" и растущей паузой"""
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except sqlite3.OperationalError as e:
+            if not is_busy(e) or attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt * (0.5 + random.random())
+            logger.warning(f"База занята, повтор через {delay:.2f} с")
+            time.sleep(delay)
+
+
+class Storage:
+    """Долгоживущее соединение с базой данных игры.
+
+    Вместо sqlite3.connect на каждый вызов держим одно соединение на весь
+    процесс. Скомпилированные запросы кэшируются самим sqlite3 по тексту SQL
+    (cached_statements), поэтому все запросы передаются константными строками.
+
+    Базу могут делить несколько процессов. Транзакции открываются через
+    BEGIN IMMEDIATE: блокировка записи берется сразу, и занятость базы
+    проявляется только на BEGIN, где ее можно переждать и повторить, а не
+    посреди транзакции после уже прочитанных данных.
+
+    Соединение открывается при первом обращении, а не в конструкторе:
+    импорт модуля не трогает файл базы, и процесс, который форкает
+    воркеры, не передает им открытое соединение. on_open(conn) вызывается
+    один раз сразу после открытия (например, для миграций схемы).
+    """
+
+    def __init__(self, path='racing.db', statement_cache_size=128, on_open=None):
+        self.path = path
+        self.statement_cache_size = statement_cache_size
+        self.on_open = on_open
+        self._lock = threading.RLock()
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    self._conn = self._open()
+        return self._conn
+
+    @property
+    def opened(self):
+        return self._conn is not None
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size,
+        )
+        try:
+            for pragma in PRAGMAS:
+                retry_busy(lambda: conn.execute(pragma))
+            if self.on_open is not None:
+                self.on_open(conn)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _execute(self, conn, sql, params, factory):
+        """Запрос; factory(cursor, row) - row_factory только для этого курсора"""
+        if factory is None:
+            return conn.execute(sql, params)
+        cursor = conn.cursor()
+        cursor.row_factory = factory
+        return cursor.execute(sql, params)
+
+    def fetchone(self, sql, params=(), factory=None):
+        with self._lock:
+            return retry_busy(lambda: self._execute(self.conn, sql, params, factory).fetchone())
+
+    def fetchall(self, sql, params=(), factory=None):
+        with self._lock:
+            return retry_busy(lambda: self._execute(self.conn, sql, params, factory).fetchall())
+
+    def execute(self, sql, params=()):
+        """Выполнение одиночного изменяющего запроса с коммитом"""
+        with self.transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def fetchone_commit(self, sql, params=(), factory=None):
+        """Изменяющий запрос с RETURNING: первая строка результата и коммит"""
+        with self.transaction() as conn:
+            cursor = self._execute(conn, sql, params, factory)
+            row = cursor.fetchone()
+            # Дочитываем курсор, чтобы запрос завершился до коммита
+            cursor.fetchall()
+            return row
+
+    @contextmanager
+    def transaction(self):
+        """Транзакция: commit при успехе, rollback при исключении"""
+        with self._lock:
+            if not self.conn.in_transaction:
+                retry_busy(lambda: self.conn.execute("BEGIN IMMEDIATE"))
+            try:
+                yield self.conn
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+    @contextmanager
+    def snapshot(self):
+        """Несколько чтений одного снимка базы без блокировки записи"""
+        with self._lock:
+            if self.conn.in_transaction:
+                yield self.conn
+                return
+            self.conn.execute("BEGIN")
+            try:
+                yield self.conn
+            finally:
+                self.conn.rollback()
+
+    def probe_write(self):
+        """Сколько писатель ждал блокировку записи сейчас (с); ничего не меняет"""
+        with self._lock:
+            start = time.perf_counter()
+            if not self.conn.in_transaction:
+                retry_busy(lambda: self.conn.execute("BEGIN IMMEDIATE"))
+                self.conn.rollback()
+            return time.perf_counter() - start
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class AsyncFacade:
+    """Асинхронный фасад над синхронным объектом хранилища.
+
+    Все вызовы выполняются в одном выделенном потоке БД: очередь
+    ThreadPoolExecutor с единственным воркером служит очередью писателя,
+    а цикл событий не блокируется ни чтениями, ни fsync при записи.
+    Состояние обернутого объекта трогается только из этого потока.
+    """
+
+    def __init__(self, target, metrics=None):
+        self._target = target
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='racing-db')
+        # Время выполнения методов (db) и ожидания в очереди потока БД (db_wait)
+        self._metrics = metrics
+
+    async def call(self, fn, *args, **kwargs):
+        """Выполнение произвольной функции в потоке БД"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        if self._metrics is None:
+            async def method(*args, **kwargs):
+                return await self.call(attr, *args, **kwargs)
+        else:
+            method = self._timed_method(name, attr)
+
+        # Кэшируем обертку, чтобы не создавать ее на каждый вызов
+        setattr(self, name, method)
+        return method
+
+    def _timed_method(self, name, attr):
+        metrics = self._metrics
+
+        def run(*args, **kwargs):
+            # Замер в потоке БД, запись в метрики - в цикле событий
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs), start, time.perf_counter() - start, None
+            except Exception as e:
+                return None, start, time.perf_counter() - start, e
+
+        async def method(*args, **kwargs):
+            queued = time.perf_counter()
+            result, started, elapsed, error = await self.call(run, *args, **kwargs)
+            metrics.observe('db', name, elapsed, error is not None)
+            metrics.observe('db_wait', name, started - queued)
+            if error is not None:
+                raise error
+            return result
+        return method
+
+    def shutdown(self):
+        """Дожидаемся завершения поставленных в очередь операций"""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,19 @@
+"""Общие фикстуры: Race.py импортируется один раз на прогон, база - во временном каталоге"""
+import os
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def Race(tmp_path_factory):
+    # Race.py читает токен и путь к базе из окружения при импорте
+    os.environ.setdefault('BOT_TOKEN', 'test:token')
+    os.environ['DB_PATH'] = str(tmp_path_factory.mktemp('race') / 'racing.db')
+    import Race
+    yield Race
+    Race.game_async.shutdown()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'racing.db')
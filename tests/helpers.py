@@ -0,0 +1,144 @@
+"""Поддельные объекты Telegram и Bot API и замеры для тестов (их используют и бенчмарки)"""
+import asyncio
+import random
+import time
+import tracemalloc
+from collections import Counter
+
+from telegram.error import RetryAfter
+
+from cache import PlayerCache
+from ratelimit import BucketMap
+
+PRESS_INTERVAL = 0.25
+
+
+class FakeUser:
+    def __init__(self, user_id, first_name=None):
+        self.id = user_id
+        self.first_name = first_name or f"player{user_id}"
+
+
+class FakeChat:
+    def __init__(self, chat_id, chat_type='private'):
+        self.id = chat_id
+        self.type = chat_type
+
+
+class FakeMessage:
+    def __init__(self, chat, message_id=1):
+        self.chat = chat
+        self.chat_id = chat.id
+        self.message_id = message_id
+
+    async def reply_text(self, text, **kwargs):
+        return self
+
+
+class FakeCallbackQuery:
+    """CallbackQuery, который считает вызовы API и имитирует сетевую задержку"""
+
+    def __init__(self, user, message, data, network_delay=0.0):
+        self.from_user = user
+        self.message = message
+        self.data = data
+        self.network_delay = network_delay
+        self.edits = []
+        self.answers = 0
+
+    async def answer(self, *args, **kwargs):
+        self.answers += 1
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        if self.network_delay:
+            await asyncio.sleep(self.network_delay)
+        self.edits.append(text)
+        return self.message
+
+
+class FakeUpdate:
+    def __init__(self, callback_query=None, message=None, user=None):
+        self.callback_query = callback_query
+        self.message = message
+        self.effective_user = user or (callback_query.from_user if callback_query else None)
+
+
+class FakeBot:
+    """Bot API с лимитами Telegram: лишний вызов получает RetryAfter"""
+
+    def __init__(self, rate=30, chat_rate=1, chat_burst=3, random_flood=0.01, network_delay=0.02, seed=1):
+        self.global_bucket = BucketMap(rate, rate)
+        self.chats = BucketMap(chat_rate, chat_burst)
+        self.random_flood = random_flood
+        self.network_delay = network_delay
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.flooded = 0
+        self.screens = {}
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        self.calls['editMessageText'] += 1
+        await asyncio.sleep(self.network_delay)
+        now = time.monotonic()
+        chat = self.chats.peek(chat_id, now)
+        total = self.global_bucket.peek(0, now)
+        if chat.tokens < 1 or total.tokens < 1 or self.rng.random() < self.random_flood:
+            self.flooded += 1
+            raise RetryAfter(1)
+        chat.tokens -= 1
+        total.tokens -= 1
+        self.screens[chat_id, message_id] = text
+
+
+class BotQuery(FakeCallbackQuery):
+    def __init__(self, bot, *args):
+        super().__init__(*args)
+        self.bot = bot
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        await self.bot.edit_message_text(self.message.chat_id, self.message.message_id, text)
+        self.edits.append(text)
+
+
+async def press(Race, bot, user_id, message_id, latencies, lost):
+    """Нажатие "Гонка с ИИ" через настоящий handle_callback; без итогового экрана - в lost"""
+    query = BotQuery(bot, FakeUser(user_id), FakeMessage(FakeChat(user_id), message_id), Race.cb("race"))
+    start = time.perf_counter()
+    try:
+        await Race.handle_callback(FakeUpdate(callback_query=query), None)
+    except RetryAfter:
+        pass
+    if not query.edits or "завершена" not in query.edits[-1]:
+        lost.append(user_id)
+    latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def load(Race, bot, players, races):
+    """races волн нажатий players игроков раз в PRESS_INTERVAL: (время, задержки в мс, игроки без результата)"""
+    latencies, lost = [], []
+    tasks = []
+    start = time.perf_counter()
+    for round_index in range(races):
+        for user_id in range(1, players + 1):
+            # Каждое нажатие - новое сообщение, как после кнопки "Еще гонку"
+            message_id = round_index * players + user_id
+            tasks.append(asyncio.create_task(press(Race, bot, user_id, message_id, latencies, lost)))
+        await asyncio.sleep(PRESS_INTERVAL)
+    await asyncio.gather(*tasks)
+    # Промежуточные правки без ожидания могут еще лететь
+    while getattr(Race.editor, '_in_flight', None) or getattr(Race.editor, '_pending', None):
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - start, latencies, lost
+
+
+def cache_bytes(load):
+    """Байт на игрока в заполненном PlayerCache: записи вместе с именами и узлы LRU"""
+    tracemalloc.start()
+    records = load()
+    cache = PlayerCache(len(records))
+    for record in records:
+        cache.put(record[0] if isinstance(record, list) else record.user_id, record)
+    del records
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return used / len(cache), cache
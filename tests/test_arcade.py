@@ -0,0 +1,157 @@
+"""Счета аркады: разбор web_app_data, проверка повтором игры, буфер счетов и расход зерна"""
+import json
+import random
+import re
+import time
+
+import pytest
+
+from arcade import MAX_TICKS, simulate, verify_run
+from scores import ACCEPTED, DUPLICATE, MAX_PAYLOAD, REJECTED, ScoreBuffer, parse_score
+
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def base36(value):
+    digits = ''
+    while True:
+        value, digit = divmod(value, 36)
+        digits = DIGITS[digit] + digits
+        if not value:
+            return digits
+
+
+def recorded_game(seed, round_index, rng):
+    """Игра со случайными сменами полосы до столкновения: (счет, зерно, раунд, кадр конца, журнал)"""
+    moves, tick, lane = [], 0, 1
+    while tick < 2000:
+        tick += rng.randrange(1, 30)
+        direction = rng.choice([d for d in (-1, 1) if 0 <= lane + d < 3])
+        lane += direction
+        moves.append((tick, direction))
+    score, end = simulate(seed, round_index, moves)
+    log, last = [], 0
+    for tick, direction in moves:
+        if tick > end:
+            break
+        log.append(base36(tick - last) + ('L' if direction < 0 else 'R'))
+        last = tick
+    return score, seed, round_index, end, ''.join(log)
+
+
+@pytest.fixture(scope='module')
+def games():
+    rng = random.Random(21)
+    return [recorded_game(rng.getrandbits(32) or 1, rng.randrange(3), rng) for _ in range(20)]
+
+
+def payload(**fields):
+    data = {'action': 'game_score', 'game': 'racer', 'score': 120}
+    data.update(fields)
+    return json.dumps(data)
+
+
+def test_recorded_games_verify(games):
+    assert all(verify_run(*game) for game in games)
+    assert any(game[4] for game in games)
+
+
+def test_forged_runs_rejected(games):
+    score, seed, round_index, ticks, log = max(games, key=lambda game: len(game[4]))
+    forged = {
+        'счет +10': (score + 10, seed, round_index, ticks, log),
+        'другой раунд': (score, seed, round_index + 1, ticks, log),
+        'чужое зерно': (score, seed ^ 1, round_index, ticks, log),
+        'кадр раньше': (score, seed, round_index, ticks - 1, log),
+        'без последнего хода': (score, seed, round_index, ticks, ''.join(re.findall(r'[0-9a-z]+[LR]', log)[:-1])),
+        'мусор в журнале': (score, seed, round_index, ticks, log + '!'),
+        'кадр за пределом': (score, seed, round_index, MAX_TICKS, log),
+    }
+    assert [name for name, game in forged.items() if verify_run(*game)] == []
+
+
+def test_parse_score_reads_run():
+    assert parse_score(payload()) == ('racer', 120, None)
+    assert parse_score(payload(seed='')) == ('racer', 120, None)
+    assert parse_score(payload(seed='00c0ffee', round=2, ticks=500, moves='aL5R')) == \
+        ('racer', 120, (0xc0ffee, 2, 500, 'aL5R'))
+
+
+@pytest.mark.parametrize('data', [
+    payload(action='other'),
+    payload(game='snake'),
+    payload(score=True),
+    payload(score=125),
+    payload(score=-10),
+    payload(score=100010),
+    payload(score='120'),
+    payload(seed='C0FFEE00', round=0, ticks=1, moves=''),
+    payload(seed='00c0ffee', round=-1, ticks=1, moves=''),
+    payload(seed='00c0ffee', round=0, ticks=-1, moves=''),
+    payload(seed='00c0ffee', round=0, ticks=1),
+    payload(moves='L' * MAX_PAYLOAD),
+    '[]',
+    'not json',
+])
+def test_parse_score_rejects(data):
+    with pytest.raises(ValueError):
+        parse_score(data)
+
+
+def test_score_buffer_aggregates_and_dedupes():
+    clock = Clock()
+    buffer = ScoreBuffer(max_pending=3, dedupe_window=60, clock=clock)
+    assert buffer.add(1, 'racer', 100, (1, 1), seed=7) == ACCEPTED
+    # Повторная доставка того же сообщения и то же зерно из нового сообщения
+    assert buffer.add(1, 'racer', 100, (1, 1)) == DUPLICATE
+    assert buffer.add(1, 'racer', 300, (1, 2), seed=7) == DUPLICATE
+    assert buffer.add(1, 'racer', 300, (1, 3)) == ACCEPTED
+    # Одинаковый счет из другого сообщения - другая игра
+    assert buffer.add(1, 'racer', 300, (1, 4)) == ACCEPTED
+    assert buffer.full and buffer.best(1, 'racer') == 300 and buffer.spent(1, 7)
+
+    clock.now = 60
+    assert not buffer.is_duplicate(1, (1, 1), seed=7)
+    pending, seeds = buffer.take()
+    assert pending == {(1, 'racer'): [300, 3, 700]} and seeds == {(1, 7)}
+    assert not buffer.full and not buffer.spent(1, 7) and buffer.best(1, 'racer') == 0
+
+    buffer.add(1, 'racer', 50, (1, 5))
+    buffer.restore(pending, seeds)
+    assert buffer.pending == {(1, 'racer'): [300, 4, 750]} and buffer.spent(1, 7)
+
+
+def test_seed_spent_once(Race, db_path):
+    game = Race.RacingGame(db_path, cache_size=0)
+    game.register_player(1, "player1")
+    game.register_player(2, "player2")
+    old_seed = game.issue_arcade_seed(1)
+    seed = game.issue_arcade_seed(1)
+    commits = []
+    game.db.conn.set_trace_callback(lambda sql: sql == 'COMMIT' and commits.append(sql))
+    statuses = [game.submit_score(1, "player1", 'racer', 100, (1, 1), old_seed)[0],
+                game.submit_score(2, "player2", 'racer', 100, (2, 1), seed)[0],
+                game.submit_score(1, "player1", 'racer', 100, (1, 2), seed)[0],
+                # Двойное нажатие: то же зерно из нового сообщения
+                game.submit_score(1, "player1", 'racer', 100, (1, 3), seed)[0]]
+    game.db.conn.set_trace_callback(None)
+    assert statuses == [REJECTED, REJECTED, ACCEPTED, DUPLICATE]
+    # Зерно расходуется в транзакции записи счетов, без отдельного коммита
+    assert not commits
+
+    # После окна повтора потраченное зерно отклоняется - и до записи, и после
+    game.scores.clock = lambda: time.monotonic() + 3600
+    statuses = [game.submit_score(1, "player1", 'racer', 100, (1, 4), seed)[0]]
+    assert game.flush_scores() == 1
+    statuses.append(game.submit_score(1, "player1", 'racer', 100, (1, 5), seed)[0])
+    assert statuses == [REJECTED, REJECTED]
+    assert game.db.fetchone("SELECT COUNT(*) FROM arcade_seeds")[0] == 0
+    assert game.best_score(1, 'racer') == 100
@@ -0,0 +1,62 @@
+"""Гонки и покупки под конкурентной нагрузкой: ничего не теряется, баланс не уходит в минус"""
+import asyncio
+import threading
+
+THREADS = 8
+RACES = 200
+
+
+def hammer(Race, path, user_id, races):
+    """Потоки с отдельными соединениями бьют в одного игрока гонками и покупками"""
+    min_balance = []
+    errors = []
+
+    def worker(n):
+        game = Race.RacingGame(path, stats_flush_races=1, cache_size=0)
+        try:
+            for i in range(races):
+                game.update_stats_after_race(user_id, 10, 7, i % 2 == 0, n % 2 == 0)
+                if game.buy_car(user_id, 2):
+                    min_balance.append(game.get_player(user_id).balance)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return min_balance, errors
+
+
+def test_concurrent_races_and_purchases(Race, db_path):
+    game = Race.RacingGame(db_path, stats_flush_races=1, cache_size=0)
+    game.register_player(1, "hammer")
+    game.update_balance(1, 20000)
+
+    balances, errors = hammer(Race, db_path, 1, RACES)
+    game.compact_ledger()
+    experience, level, balance, races = game.db.fetchone(
+        "SELECT experience, level, balance, races + pvp_races FROM players WHERE user_id = 1")
+    assert not errors
+    assert races == THREADS * RACES
+    assert level == experience // 100 + 1
+    assert balance >= 0 and min(balances, default=0) >= 0
+
+
+def test_level_ups_reported_once_through_db_thread(Race):
+    """Все гонки игрока идут через поток БД бота: каждое повышение сообщено ровно один раз"""
+    user_id = 5001
+    Race.game.register_player(user_id, "handlers")
+
+    async def handlers():
+        results = await asyncio.gather(*(Race.game_async.update_stats_after_race(user_id, 10, 7, i % 2 == 0)
+                                         for i in range(THREADS * RACES)))
+        await Race.game_async.flush_stats()
+        return sum(results)
+
+    level_ups = asyncio.run(handlers())
+    Race.game.compact_ledger()
+    experience, level = Race.game.db.fetchone("SELECT experience, level FROM players WHERE user_id = ?", (user_id,))
+    assert level == experience // 100 + 1
+    assert level_ups == level - 1
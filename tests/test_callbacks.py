@@ -0,0 +1,61 @@
+"""Маршруты кнопок: кодирование callback_data, разбор, проверки и прежние кнопки"""
+import pytest
+
+from callbacks import MAX_CALLBACK_DATA, CallbackRouter
+
+
+@pytest.fixture
+def router():
+    router = CallbackRouter()
+    router.declare('main', 'm', legacy='menu_main')
+    router.declare('buy', 'b', int, validate=lambda car_id: 1 <= car_id <= 5, legacy='buy_')
+    router.declare('accept', 'a', str, legacy='accept_')
+    router.declare('pair', 'p', int, str)
+    return router
+
+
+@pytest.mark.parametrize('name, args', [('main', ()), ('buy', (3,)), ('accept', ('7f_lq2x9k',)), ('pair', (12, 'x-1'))])
+def test_round_trip(router, name, args):
+    data = router.encode(name, *args)
+    assert data.startswith('1:')
+    route, decoded = router.decode(data)
+    assert route.name == name and decoded == args
+
+
+@pytest.mark.parametrize('data, name, args', [
+    ('menu_main', 'main', ()),
+    ('buy_3', 'buy', (3,)),
+    ('accept_123456789_1700000000', 'accept', ('123456789_1700000000',)),
+])
+def test_legacy_buttons(router, data, name, args):
+    route, decoded = router.decode(data)
+    assert route.name == name and decoded == args
+
+
+@pytest.mark.parametrize('data', [
+    'buy_99', 'buy_x', 'buy_', '1:b:99', '1:b:-1', '1:b:', '1:b', '1:b:3:4', '1:z', '2:m', '1:m:extra',
+    '1:a:a:b', 'accept_a:b', 'accept_', '1:p:1', '', 'menu_unknown', '1:b:' + '9' * 13,
+])
+def test_malformed_rejected(router, data):
+    assert router.decode(data) is None
+
+
+def test_encode_checks_arguments_and_length(router):
+    with pytest.raises(ValueError):
+        router.encode('buy')
+    with pytest.raises(ValueError):
+        router.encode('accept', 'x' * MAX_CALLBACK_DATA)
+    with pytest.raises(ValueError):
+        router.declare('other', 'm')
+    with pytest.raises(ValueError):
+        router.declare('other', 'x:y')
+
+
+def test_bot_routes_have_handlers(Race):
+    longest = Race.cb('accept', '9' * 15 + '_' + '9' * 10)
+    assert len(longest.encode()) <= MAX_CALLBACK_DATA
+    for data in ('menu_race', 'menu_top', 'menu_profile', 'buy_3', 'accept_1_2', Race.cb('tournament'),
+                 Race.cb('join', 'abc'), Race.cb('buy', 5), longest):
+        route, _ = Race.router.decode(data)
+        assert route.handler is not None, data
+    assert Race.router.decode('buy_99') is None
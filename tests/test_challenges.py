@@ -0,0 +1,60 @@
+"""Реестр вызовов: истечение точно в срок, лимит на игрока и индекс по чату"""
+from challenges import ChallengeRegistry, ChallengeStore
+from migrations import migrate
+from storage import Storage
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def challenge(user_id, chat_id):
+    return {'challenger_id': user_id, 'chat_id': chat_id}
+
+
+def test_chat_index_follows_add_claim_and_expire():
+    clock = Clock()
+    registry = ChallengeRegistry(ttl=10, max_per_user=3, clock=clock)
+    assert registry.create('a', challenge(1, -100))
+    assert registry.create('b', challenge(2, -100))
+    assert registry.create('c', challenge(1, -200))
+    assert sorted(cid for cid, _ in registry.in_chat(-100)) == ['a', 'b']
+
+    assert registry.claim('a')['challenger_id'] == 1
+    assert registry.claim('a') is None
+    assert [cid for cid, _ in registry.in_chat(-100)] == ['b']
+
+    clock.now = 10
+    assert sorted(registry.expire()) == ['b', 'c']
+    assert registry.in_chat(-100) == [] and registry.in_chat(-200) == []
+    assert not registry._by_chat and not registry._by_user
+
+
+def test_open_challenges_per_user_limited():
+    registry = ChallengeRegistry(ttl=10, max_per_user=2, clock=Clock())
+    assert registry.create('a', challenge(1, -100))
+    assert registry.create('b', challenge(1, -100))
+    assert not registry.create('c', challenge(1, -200))
+    registry.claim('a')
+    assert registry.create('c', challenge(1, -200))
+
+
+def test_store_lists_chat_challenges_after_restart(db_path):
+    store = ChallengeStore(Storage(db_path, on_open=migrate), ttl=10, max_per_user=3)
+    ids = [store.create({'challenger_id': user_id, 'challenger_name': f"p{user_id}", 'challenger_car_id': 1,
+                         'chat_id': -100, 'message_id': user_id}) for user_id in (1, 2)]
+    store.create({'challenger_id': 3, 'challenger_name': "p3", 'challenger_car_id': 1,
+                  'chat_id': -200, 'message_id': 3})
+    plan = store.db.fetchall("EXPLAIN QUERY PLAN SELECT challenge_id FROM challenges "
+                             "WHERE chat_id = ? AND expires_at > ? ORDER BY expires_at", (-100, 0))
+    assert any('idx_challenges_chat' in row[-1] for row in plan)
+
+    # Другой процесс (или перезапуск): кэш пуст, вызовы читаются из таблицы
+    restarted = ChallengeStore(Storage(db_path, on_open=migrate), ttl=10, max_per_user=3)
+    assert [cid for cid, _ in restarted.in_chat(-100)] == ids
+    assert restarted.claim(ids[0])['challenger_id'] == 1
+    assert [cid for cid, _ in restarted.in_chat(-100)] == ids[1:]
@@ -0,0 +1,23 @@
+"""Топ и места из несвернутого журнала совпадают с топом после свертки"""
+import random
+
+
+def test_leaderboard_loads_pending_ledger(Race, db_path):
+    game = Race.RacingGame(db_path, stats_flush_races=1, cache_size=0)
+    for user_id in range(1, 201):
+        game.register_player(user_id, f"player{user_id}")
+    rng = random.Random(3)
+    for _ in range(2000):
+        game.update_stats_after_race(rng.randrange(1, 201), 100, 30, rng.random() < 0.5, rng.random() < 0.3)
+    mark = game.db.fetchone("SELECT compacted_through FROM ledger_state")[0]
+
+    pending = Race.RacingGame(db_path, cache_size=0)
+    top = [(p.user_id, p.wins, p.pvp_wins, p.level) for p in pending.get_top(10)]
+    ranks = [pending.get_rank(user_id) for user_id in range(1, 201)]
+    # Загрузка топа журнал не сворачивает
+    assert game.db.fetchone("SELECT compacted_through FROM ledger_state")[0] == mark
+
+    game.compact_ledger()
+    compacted = Race.RacingGame(db_path, cache_size=0)
+    assert top == [(p.user_id, p.wins, p.pvp_wins, p.level) for p in compacted.get_top(10)]
+    assert ranks == [compacted.get_rank(user_id) for user_id in range(1, 201)]
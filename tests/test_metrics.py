@@ -0,0 +1,21 @@
+"""Выгрузка /metrics: gauge из stats() компонентов"""
+from metrics import Metrics
+
+
+def test_dict_gauge_renders_one_line_per_key():
+    metrics = Metrics()
+    metrics.gauge('cache', lambda: {'size': 3, 'hit_rate': 0.5})
+    metrics.gauge('queue', lambda: 7)
+    text = metrics.render_prometheus()
+    assert f"{metrics.prefix}_cache_size 3" in text
+    assert f"{metrics.prefix}_cache_hit_rate 0.5" in text
+    assert f"{metrics.prefix}_queue 7" in text
+
+
+def test_application_registers_component_gauges(Race):
+    Race.build_application()
+    text = Race.metrics.render_prometheus()
+    prefix = Race.metrics.prefix
+    for gauge in ('outbound_queue_depth', 'outbound_coalesced', 'player_cache_size', 'player_cache_hit_rate',
+                  'limiter_coalesced', 'limiter_backlogged'):
+        assert f"\n{prefix}_{gauge} " in text
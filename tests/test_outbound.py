@@ -0,0 +1,153 @@
+"""Очередь исходящих вызовов против поддельного Bot с лимитами Telegram"""
+import asyncio
+import time
+
+from telegram.error import BadRequest, RetryAfter
+
+from outbound import OutboundScheduler
+from ratelimit import CallbackLimiter
+from render import MessageEditor
+from tests.helpers import BotQuery, FakeBot, FakeCallbackQuery, FakeChat, FakeMessage, FakeUpdate, FakeUser, load
+
+
+class FloodQuery(FakeCallbackQuery):
+    """Первая правка получает RetryAfter(retry_after), следующие проходят"""
+
+    def __init__(self, chat_id, retry_after):
+        super().__init__(FakeUser(chat_id), FakeMessage(FakeChat(chat_id)), '')
+        self.retry_after = retry_after
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        self.edits.append(text)
+        if len(self.edits) == 1 and self.retry_after:
+            raise RetryAfter(self.retry_after)
+
+
+class NotModifiedQuery(FakeCallbackQuery):
+    def __init__(self):
+        super().__init__(FakeUser(1), FakeMessage(FakeChat(1)), '')
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        self.edits.append(text)
+        raise BadRequest("Message is not modified")
+
+
+def test_coalesced_edits_send_first_and_last():
+    scheduler = OutboundScheduler()
+    bot = FakeBot(random_flood=0)
+    query = BotQuery(bot, FakeUser(1), FakeMessage(FakeChat(1), 1), '')
+
+    async def burst():
+        for i in range(9):
+            await scheduler.edit(query, f"кадр {i}", wait=False)
+        return await scheduler.edit(query, "итог")
+
+    assert asyncio.run(burst()) is True
+    assert bot.screens[1, 1] == "итог"
+    assert bot.calls['editMessageText'] <= 2
+
+
+def test_races_under_flood_control_all_get_result(Race, monkeypatch):
+    monkeypatch.setattr(Race, 'limiter', CallbackLimiter(1e9, 10 ** 9, 1e9, 10 ** 9))
+    monkeypatch.setattr(Race, 'editor', OutboundScheduler(metrics=Race.metrics))
+    players = 20
+    for user_id in range(1, players + 1):
+        Race.game.register_player(user_id, f"player{user_id}")
+
+    bot = FakeBot()
+    _, _, lost = asyncio.run(load(Race, bot, players, 2))
+    assert not lost
+    # Схлопывание: меньше полутора вызовов API на гонку даже с повторами после RetryAfter
+    assert bot.calls['editMessageText'] < 1.5 * players * 2
+
+
+def test_race_result_shows_odds_when_animation_coalesced(Race, monkeypatch):
+    monkeypatch.setattr(Race, 'limiter', CallbackLimiter(1e9, 10 ** 9, 1e9, 10 ** 9))
+    scheduler = OutboundScheduler(chat_rate=2.0, metrics=Race.metrics)
+    monkeypatch.setattr(Race, 'editor', scheduler)
+    # Корзина чата пуста: анимация ждет токена, и ее вытесняет результат
+    scheduler.chats.peek(501, scheduler.clock()).tokens = 0
+    Race.game.register_player(501, "player501")
+    query = FakeCallbackQuery(FakeUser(501), FakeMessage(FakeChat(501)), Race.cb("race"))
+
+    asyncio.run(Race.handle_callback(FakeUpdate(callback_query=query), None))
+    assert len(query.edits) == 1
+    assert "завершена" in query.edits[0] and "Шансы на победу" in query.edits[0]
+
+
+def test_retry_after_releases_slot_and_mutes_group():
+    """Группы под флуд-контролем не держат слоты: правка в личном чате уходит сразу"""
+    scheduler = OutboundScheduler(chat_rate=2.0, group_rate=0.5, max_in_flight=2)
+    groups = [FloodQuery(-1, 1), FloodQuery(-2, 1)]
+    private = FloodQuery(5, 0)
+
+    async def run():
+        flooded = [asyncio.create_task(scheduler.edit(query, "группа")) for query in groups]
+        await asyncio.sleep(0.05)
+        start = time.monotonic()
+        await scheduler.edit(private, "личный")
+        waited = time.monotonic() - start
+        # Корзина группы замолчала на retry_after по своей скорости (1 - 1 * 0.5),
+        # а не по скорости личных чатов (1 - 1 * 2)
+        muted = scheduler.groups.peek(-1, scheduler.clock()).tokens
+        await asyncio.gather(*flooded)
+        return waited, muted
+
+    waited, muted = asyncio.run(run())
+    assert waited < 0.5
+    assert 0 < muted < 1
+    assert [len(query.edits) for query in groups] == [2, 2]
+    assert scheduler.retries == 2 and scheduler.failed == 0
+    # Отложенные после RetryAfter задания считаются в очереди чата до отправки
+    assert scheduler.backlog(-1) == scheduler.backlog(-2) == 0
+
+
+def test_not_modified_is_skipped_once():
+    """"not modified" одинаково в MessageEditor и в очереди: правка пропущена и запомнена"""
+    for editor in (MessageEditor(), OutboundScheduler()):
+        query = NotModifiedQuery()
+
+        async def twice():
+            return await editor.edit(query, "экран"), await editor.edit(query, "экран")
+
+        assert asyncio.run(twice()) == (False, False)
+        assert len(query.edits) == 1
+        assert editor.sent == 0 and editor.skipped == 2
+
+
+def test_chat_backlog_rejects_callbacks():
+    """Нажатия в чат с полной очередью отклоняются, а не ждут отправки; очередь сходит до нуля"""
+    scheduler = OutboundScheduler(chat_rate=1.0, group_rate=1.0, chat_burst=3)
+    limiter = CallbackLimiter(1e9, 10 ** 9, 1e9, 10 ** 9, backlog=scheduler.backlog, max_backlog=3)
+    sent = []
+
+    async def send(n):
+        sent.append(n)
+
+    async def handler(n):
+        if limiter.allow(n, -1):
+            await scheduler.call(-1, send, n)
+
+    async def run():
+        await asyncio.gather(*(handler(n) for n in range(10)))
+        return scheduler.backlog(-1)
+
+    assert asyncio.run(run()) == 0
+    assert sorted(sent) == [0, 1, 2]
+    assert limiter.backlogged == 7 and limiter.allowed == 3
+
+
+def test_coalesced_edits_count_once_in_backlog():
+    scheduler = OutboundScheduler()
+    bot = FakeBot(random_flood=0)
+    query = BotQuery(bot, FakeUser(1), FakeMessage(FakeChat(-5), 1), '')
+
+    async def burst():
+        for i in range(5):
+            await scheduler.edit(query, f"кадр {i}", wait=False)
+        queued = scheduler.backlog(-5)
+        await scheduler.edit(query, "итог")
+        return queued, scheduler.backlog(-5)
+
+    # Пять правок одного сообщения - одно задание в очереди чата
+    assert asyncio.run(burst()) == (1, 0)
@@ -0,0 +1,50 @@
+"""Запись игрока Player: разбор строк совпадает с кортежами, не медленнее прежних списков, в кэше легче"""
+import time
+
+from records import Player, player_row
+from tests.helpers import cache_bytes
+
+PLAYERS = 2000
+
+
+def populate(Race, path):
+    game = Race.RacingGame(path)
+    with game.db.transaction() as conn:
+        conn.executemany("INSERT INTO players (user_id, username, balance, car_id, experience, level, wins, races, "
+                         "pvp_wins, pvp_races) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         ((i, f"player{i}", 1000 + i, 1 + i % 5, i % 5000, 1 + i % 50, i % 300, i % 900, i % 40,
+                           i % 120) for i in range(1, PLAYERS + 1)))
+    return game, f"SELECT {Race.PLAYER_COLUMNS} FROM players"
+
+
+def decode_time(fn, repeat=5):
+    """Лучшее время разбора всей таблицы из repeat попыток"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def test_player_row_decodes_like_tuples(Race, db_path):
+    game, sql = populate(Race, db_path)
+    rows = game.db.fetchall(sql)
+    assert [record.astuple() for record in game.db.fetchall(sql, factory=player_row)] == rows
+    assert game.get_player(7) == Player(*rows[6])
+
+
+def test_player_record_is_smaller_in_cache(Race, db_path):
+    game, sql = populate(Race, db_path)
+    legacy_size, _ = cache_bytes(lambda: [list(row) for row in game.db.fetchall(sql)])
+    record_size, _ = cache_bytes(lambda: game.db.fetchall(sql, factory=player_row))
+    assert record_size < legacy_size
+
+
+def test_player_row_decodes_no_slower_than_lists(Race, db_path):
+    game, sql = populate(Race, db_path)
+    # Прежний кэш копировал каждую строку sqlite3 в список; player_row строит запись прямо в row_factory
+    legacy = decode_time(lambda: [list(row) for row in game.db.fetchall(sql)])
+    records = decode_time(lambda: game.db.fetchall(sql, factory=player_row))
+    # Запас на шум общей машины
+    assert records < legacy * 1.5
@@ -0,0 +1,68 @@
+"""Координатор шардов: ошибки getUpdates и секрет webhook"""
+import asyncio
+
+import httpx
+import pytest
+
+import sharding
+from sharding import Coordinator, poll_delay, secret_matches
+
+
+def api(replies):
+    """Bot API на httpx.MockTransport: getUpdates отвечает по очереди из replies"""
+    calls = []
+
+    def handle(request):
+        method = request.url.path.rsplit('/', 1)[-1]
+        calls.append(method)
+        if method == 'getUpdates' and replies:
+            return httpx.Response(200, json=replies.pop(0))
+        return httpx.Response(200, json={'ok': True, 'result': []})
+    return httpx.MockTransport(handle), calls
+
+
+def run_poll(coordinator, transport, monkeypatch, sleeps=3):
+    """poll до заданного числа пауз; паузы не ждутся, а записываются"""
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+        if len(delays) >= sleeps:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(sharding.asyncio, 'sleep', sleep)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(coordinator.poll('http://api/bot', transport=transport))
+    return delays
+
+
+def test_poll_backs_off_on_error_replies(monkeypatch):
+    coordinator = Coordinator(None, 2)
+    conflict = {'ok': False, 'error_code': 409, 'description': "Conflict: terminated by other getUpdates request"}
+    flood = {'ok': False, 'error_code': 429, 'description': "Too Many Requests", 'parameters': {'retry_after': 7}}
+    transport, calls = api([conflict, conflict, flood])
+    assert run_poll(coordinator, transport, monkeypatch) == [1, 2, 7]
+    assert calls.count('getUpdates') == 3
+    assert coordinator.dispatched == [0, 0]
+
+
+def test_poll_dispatches_and_resets_backoff(monkeypatch):
+    coordinator = Coordinator(None, 2)
+    update = {'update_id': 5, 'message': {'chat': {'id': 3}}}
+    unauthorized = {'ok': False, 'error_code': 401, 'description': "Unauthorized"}
+    transport, _ = api([unauthorized, {'ok': True, 'result': [update]}, unauthorized, unauthorized, unauthorized])
+    assert run_poll(coordinator, transport, monkeypatch) == [1, 1, 2]
+    assert coordinator.dispatched == [0, 1]
+    assert coordinator.queues[1].get(timeout=5) == [update]
+
+
+def test_poll_delay_capped():
+    assert poll_delay(1) == 1
+    assert poll_delay(20) == sharding.POLL_BACKOFF_MAX
+    assert poll_delay(20, retry_after=3) == 3
+
+
+def test_webhook_secret_rejects_non_ascii_header():
+    assert secret_matches("token", "token")
+    assert not secret_matches("tokeN", "token")
+    assert not secret_matches("тoken", "token")
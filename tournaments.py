@@ -0,0 +1,176 @@
+import random
+import sqlite3
+import time
+
+from challenges import to_base36
+from race_engine import DRAW, PVP_LUCK, WIN
+from writebehind import race_delta
+
+# Награды за матч сетки - как за PvP дуэль: (кредиты, опыт)
+MATCH_WIN_REWARD = (1000, 50)
+MATCH_LOSS_REWARD = (200, 20)
+# Сколько раз переигрываются ничьи, прежде чем победителя выберет жребий
+MAX_REPLAYS = 20
+
+# Результаты записи в турнир и его старта
+JOINED, ALREADY_JOINED, FULL, CLOSED, STARTED, NOT_HOST, TOO_FEW = range(7)
+
+
+class TournamentStore:
+    """Открытые турниры в таблицах tournaments и tournament_entries.
+
+    Запись и старт идут транзакциями BEGIN IMMEDIATE, поэтому лимит
+    участников не превышается, а старт - DELETE ... RETURNING строки турнира -
+    удается ровно одному нажатию, даже из разных процессов.
+    """
+
+    COLUMNS = "host_id, host_name, chat_id, message_id, created_at, expires_at"
+
+    def __init__(self, db, ttl=1800, max_players=32, min_players=2, wall_clock=time.time):
+        self.db = db
+        self.ttl = ttl
+        self.max_players = max_players
+        self.min_players = min_players
+        self.wall_clock = wall_clock
+
+    @staticmethod
+    def _row_to_data(row):
+        keys = ('host_id', 'host_name', 'chat_id', 'message_id', 'created_at', 'expires_at')
+        return dict(zip(keys, row))
+
+    @staticmethod
+    def _entrants(conn, tournament_id):
+        return conn.execute('''SELECT user_id, name, car_id FROM tournament_entries
+                               WHERE tournament_id = ? ORDER BY joined_at''', (tournament_id,)).fetchall()
+
+    def create(self, data, car_id):
+        """Новый турнир, ведущий записан первым; None, если у ведущего уже есть открытый"""
+        now = self.wall_clock()
+        host_id = data['host_id']
+        with self.db.transaction() as conn:
+            if conn.execute("SELECT 1 FROM tournaments WHERE host_id = ? AND expires_at > ?",
+                            (host_id, now)).fetchone():
+                return None
+            stamp = int(now * 1000)
+            while True:
+                tournament_id = f"{to_base36(host_id)}_{to_base36(stamp)}"
+                try:
+                    conn.execute(f"INSERT INTO tournaments (tournament_id, {self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 (tournament_id, host_id, data['host_name'], data['chat_id'],
+                                  data['message_id'], now, now + self.ttl))
+                    break
+                except sqlite3.IntegrityError:
+                    stamp += 1
+            conn.execute("INSERT INTO tournament_entries VALUES (?, ?, ?, ?, ?)",
+                         (tournament_id, host_id, data['host_name'], car_id, now))
+        return tournament_id
+
+    def get(self, tournament_id):
+        row = self.db.fetchone(f"SELECT {self.COLUMNS} FROM tournaments WHERE tournament_id = ? AND expires_at > ?",
+                               (tournament_id, self.wall_clock()))
+        return self._row_to_data(row) if row else None
+
+    def join(self, tournament_id, user_id, name, car_id):
+        """(результат, данные турнира, участники)"""
+        now = self.wall_clock()
+        with self.db.transaction() as conn:
+            row = conn.execute(f"SELECT {self.COLUMNS} FROM tournaments WHERE tournament_id = ? AND expires_at > ?",
+                               (tournament_id, now)).fetchone()
+            if row is None:
+                return CLOSED, None, []
+            entrants = self._entrants(conn, tournament_id)
+            if any(entrant[0] == user_id for entrant in entrants):
+                return ALREADY_JOINED, self._row_to_data(row), entrants
+            if len(entrants) >= self.max_players:
+                return FULL, self._row_to_data(row), entrants
+            conn.execute("INSERT INTO tournament_entries VALUES (?, ?, ?, ?, ?)",
+                         (tournament_id, user_id, name, car_id, now))
+        return JOINED, self._row_to_data(row), entrants + [(user_id, name, car_id)]
+
+    def start(self, tournament_id, user_id=None):
+        """Атомарно закрываем запись: (результат, данные турнира, участники).
+
+        user_id - кто нажал "Старт" (только ведущий); None - автостарт при
+        заполнении сетки.
+        """
+        now = self.wall_clock()
+        with self.db.transaction() as conn:
+            row = conn.execute(f"SELECT {self.COLUMNS} FROM tournaments WHERE tournament_id = ? AND expires_at > ?",
+                               (tournament_id, now)).fetchone()
+            if row is None:
+                return CLOSED, None, []
+            data = self._row_to_data(row)
+            if user_id is not None and user_id != data['host_id']:
+                return NOT_HOST, data, []
+            entrants = self._entrants(conn, tournament_id)
+            if len(entrants) < self.min_players:
+                return TOO_FEW, data, entrants
+            conn.execute("DELETE FROM tournaments WHERE tournament_id = ?", (tournament_id,))
+            conn.execute("DELETE FROM tournament_entries WHERE tournament_id = ?", (tournament_id,))
+        return STARTED, data, entrants
+
+    def expire(self):
+        """Удаление истекших турниров вместе с записями; возвращает их число"""
+        now = self.wall_clock()
+        with self.db.transaction() as conn:
+            conn.execute('''DELETE FROM tournament_entries WHERE tournament_id IN
+                            (SELECT tournament_id FROM tournaments WHERE expires_at <= ?)''', (now,))
+            return conn.execute("DELETE FROM tournaments WHERE expires_at <= ?", (now,)).rowcount
+
+
+def run_bracket(entrants, engine, cars, luck=PVP_LUCK, seed=None):
+    """Олимпийская сетка за один проход.
+
+    entrants - [(user_id, имя, car_id)]. Порядок сетки и все гонки задает
+    seed, так что турнир можно переиграть. Если участников не степень
+    двойки, часть проходит первый раунд без гонки. Каждый раунд - один
+    пакетный вызов движка; ничьи переигрываются.
+    Возвращает список раундов [(победитель, проигравший), ...].
+    """
+    rng = random.Random(seed)
+    players = [(user_id, name, car_id if car_id in cars else 1) for user_id, name, car_id in entrants]
+    rng.shuffle(players)
+    byes = (1 << (len(players) - 1).bit_length()) - len(players)
+    advancing, contenders = players[:byes], players[byes:]
+    rounds = []
+    while contenders:
+        pairs = list(zip(contenders[0::2], contenders[1::2]))
+        winners = [None] * len(pairs)
+        undecided = list(range(len(pairs)))
+        for _ in range(MAX_REPLAYS):
+            outcomes = engine.race_batch([pairs[i][0][2] for i in undecided], [pairs[i][1][2] for i in undecided],
+                                         luck, seed=rng.getrandbits(64))
+            replay = []
+            for i, outcome in zip(undecided, outcomes):
+                if outcome == DRAW:
+                    replay.append(i)
+                else:
+                    winners[i] = 0 if outcome == WIN else 1
+            undecided = replay
+            if not undecided:
+                break
+        for i in undecided:
+            winners[i] = rng.randrange(2)
+        matches = [(pair[side], pair[1 - side]) for pair, side in zip(pairs, winners)]
+        rounds.append(matches)
+        next_round = advancing + [winner for winner, _ in matches]
+        if len(next_round) == 1:
+            break
+        advancing, contenders = [], next_round
+    return rounds
+
+
+def bracket_deltas(rounds):
+    """Суммарные приращения статистики участников по всем матчам сетки"""
+    deltas = {}
+    for matches in rounds:
+        for winner, loser in matches:
+            for player, reward, is_win in ((winner, MATCH_WIN_REWARD, True), (loser, MATCH_LOSS_REWARD, False)):
+                delta = race_delta(*reward, is_win, True)
+                total = deltas.get(player[0])
+                if total is None:
+                    deltas[player[0]] = delta
+                else:
+                    for i, value in enumerate(delta):
+                        total[i] += value
+    return deltas
@@ -0,0 +1,76 @@
+import threading
+import time
+
+# Порядок накапливаемых приращений статистики
+BALANCE, EXPERIENCE, RACES, WINS, PVP_RACES, PVP_WINS = range(6)
+
+
+def race_delta(earnings, exp_gain, is_win=False, is_pvp=False):
+    """Приращения статистики от одной гонки"""
+    win = 1 if is_win else 0
+    if is_pvp:
+        return [earnings, exp_gain, 0, 0, 1, win]
+    return [earnings, exp_gain, 1, win, 0, 0]
+
+
+class StatsBuffer:
+    """Буфер отложенной записи результатов гонок.
+
+    Копит записи журнала экономики (гонка, PvP, аркада...) и отдает их
+    пачкой, чтобы дописать одной транзакцией через executemany. Число
+    коммитов зависит от интервала сброса, а не от числа гонок. Сумма
+    приращений по игроку (get) накладывается на игрока, читаемого из БД.
+    """
+
+    def __init__(self, max_races=100):
+        self.max_races = max_races
+        self.pending = {}
+        self.entries = []
+        self.races = 0
+        self.flushes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_races > 1
+
+    def add(self, user_id, earnings, exp_gain, is_win=False, is_pvp=False):
+        """Добавление результата гонки. Возвращает True, если пора сбрасывать"""
+        return self.add_delta(user_id, race_delta(earnings, exp_gain, is_win, is_pvp), 'pvp' if is_pvp else 'race')
+
+    def add_delta(self, user_id, change, reason='race'):
+        """Произвольные приращения (например, награда за аркаду) наравне с гонкой"""
+        with self._lock:
+            self.entries.append((user_id, reason, *change, time.time()))
+            delta = self.pending.get(user_id)
+            if delta is None:
+                self.pending[user_id] = list(change)
+            else:
+                for i, value in enumerate(change):
+                    delta[i] += value
+            self.races += 1
+            return self.races >= self.max_races
+
+    def get(self, user_id):
+        """Еще не записанные приращения игрока или None"""
+        return self.pending.get(user_id)
+
+    def take(self):
+        """Забираем накопленные записи журнала и очищаем буфер"""
+        with self._lock:
+            entries, self.entries = self.entries, []
+            self.pending = {}
+            self.races = 0
+        return entries
+
+    def restore(self, entries):
+        """Возвращаем записи обратно после неудачной записи, перед новыми"""
+        with self._lock:
+            for user_id, _, *delta, _ in entries:
+                current = self.pending.get(user_id)
+                if current is None:
+                    self.pending[user_id] = delta
+                else:
+                    for i, value in enumerate(delta):
+                        current[i] += value
+            self.entries[:0] = entries